@@ -0,0 +1,192 @@
+""" maintenance commands, run as: python -m app.cli <command> --help """
+import argparse
+import json
+import sys
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+import yaml
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from app.db.cache import formCache
+from app.db.database import SessionLocal, getSyncEngine
+from app.db.dbModel import Form
+from app.db.archive import ArchiveLocked, archiveSubmissions
+from app.db.documents import migrateToDocuments
+from app.db.interning import dedupeFields
+from app.db.migrations import LATEST_VERSION, currentVersion, isCurrent, migrate
+from app.db.store import FormStore
+from app.schemas import FormImportBatch
+from app.utils.logger import getLogger
+
+logger = getLogger()
+
+
+def rebuildStats(args: argparse.Namespace) -> int:
+    db = SessionLocal()
+    try:
+        formIds = [args.form_id] if args.form_id else db.execute(select(Form.id).order_by(Form.id)).scalars().all()
+        for formId in formIds:
+            seen = FormStore.rebuildFormStats(db, formId)
+            print(f"form {formId}: {seen} submissions")
+        return 0
+    finally:
+        db.close()
+
+
+def dedupeFieldRows(args: argparse.Namespace) -> int:
+    db = SessionLocal()
+    try:
+        result = dedupeFields(db, dryRun=args.dry_run)
+        if args.dry_run:
+            db.rollback()
+            print(f"would merge {result['merged']} duplicate fields in the first pass, touching {len(result['forms'])} forms")
+            return 0
+        db.commit()
+        print(f"merged {result['merged']} duplicate fields in {result['passes']} passes, {len(result['forms'])} forms touched")
+
+        # field ids moved, so the rollups of the touched forms are recomputed; with the shared
+        # cache enabled the invalidation reaches the running workers too
+        for formId in result["forms"]:
+            formCache.invalidate(formId)
+            FormStore.rebuildFormStats(db, formId)
+        return 0
+    finally:
+        db.close()
+
+
+def loadImportDocument(path: str) -> FormImportBatch:
+    """JSON or YAML (by extension), either {"forms": [...]} or a bare list of form definitions"""
+
+    with open(path) as handle:
+        document = yaml.safe_load(handle) if path.endswith((".yaml", ".yml")) else json.load(handle)
+    if isinstance(document, list):
+        document = {"forms": document}
+    return FormImportBatch.model_validate(document)
+
+
+def importForms(args: argparse.Namespace) -> int:
+    try:
+        batch = loadImportDocument(args.path)
+    except (OSError, ValueError, yaml.YAMLError) as e:
+        # pydantic's ValidationError is a ValueError
+        logger.error(f"import-forms: cannot read {args.path}: {str(e)}")
+        return 1
+
+    db = SessionLocal()
+    try:
+        result = FormStore.importForms(db, batch.forms)
+        print(f"imported {result['created']} forms, ids {result['form_ids'][0]}..{result['form_ids'][-1]}")
+        return 0
+    finally:
+        db.close()
+
+
+def archiveForms(args: argparse.Namespace) -> int:
+    db = SessionLocal()
+    try:
+        query = select(Form.id, Form.retention_days).order_by(Form.id)
+        if args.form_id:
+            query = query.where(Form.id == args.form_id)
+        elif args.older_than_days is None:
+            query = query.where(Form.retention_days.isnot(None))
+
+        failed = 0
+        for formId, retentionDays in db.execute(query).all():
+            days = args.older_than_days if args.older_than_days is not None else retentionDays
+            if not days:
+                continue
+            cutoff = datetime.now(timezone.utc) - timedelta(days=days)
+            try:
+                moved = archiveSubmissions(db, formId, cutoff, args.chunk_size, args.pause, args.limit)
+            except ArchiveLocked as e:
+                logger.error(f"archive: {str(e)}, skipped")
+                failed += 1
+                continue
+            print(f"form {formId}: archived {moved} submissions older than {days} days")
+        return 1 if failed else 0
+    finally:
+        db.close()
+
+
+def migrateDocuments(args: argparse.Namespace) -> int:
+    db = SessionLocal()
+    try:
+        form = db.get(Form, args.form_id)
+        if not form:
+            logger.error(f"migrate-documents: form ID {args.form_id} not found")
+            return 1
+        if form.storage_mode != "document":
+            # new writes go to documents first, so the backlog below only shrinks
+            form.storage_mode = "document"
+            form.version = Form.version + 1
+            db.commit()
+            formCache.invalidate(args.form_id)
+        moved = migrateToDocuments(db, args.form_id, args.chunk_size, args.pause)
+        print(f"form {args.form_id}: moved {moved} submissions to documents")
+        return 0
+    finally:
+        db.close()
+
+
+def migrateSchema(args: argparse.Namespace) -> int:
+    engine = getSyncEngine()
+    if args.check:
+        with engine.connect() as conn:
+            state = currentVersion(conn)
+        print(f"schema version {state['version'] if state else None}, this release needs {LATEST_VERSION}")
+        return 0 if isCurrent(state) else 1
+
+    applied = migrate(engine)
+    print(f"applied migrations {applied}" if applied else f"schema already at version {LATEST_VERSION}")
+    return 0
+
+
+def buildParser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="Forms service maintenance")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    stats = commands.add_parser("stats-rebuild", help="recompute per-field statistics from stored submissions")
+    stats.add_argument("--form-id", type=int, help="only this form, default all forms")
+    stats.set_defaults(handler=rebuildStats)
+
+    dedupe = commands.add_parser("dedupe-fields", help="merge fields with identical definitions into one row")
+    dedupe.add_argument("--dry-run", action="store_true", help="report what would merge, change nothing")
+    dedupe.set_defaults(handler=dedupeFieldRows)
+
+    importer = commands.add_parser("import-forms", help="create the form definitions of a JSON/YAML file in one transaction")
+    importer.add_argument("path", help="file holding {\"forms\": [...]} or a list of form definitions")
+    importer.set_defaults(handler=importForms)
+
+    archive = commands.add_parser("archive", help="move submissions past their form's retention_days to the archive")
+    archive.add_argument("--form-id", type=int, help="only this form, default every form with a retention policy")
+    archive.add_argument("--older-than-days", type=int, help="override the forms' retention_days")
+    archive.add_argument("--chunk-size", type=int, default=500, help="submissions per archive block and transaction")
+    archive.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between chunks")
+    archive.add_argument("--limit", type=int, help="at most this many submissions per form in this run")
+    archive.set_defaults(handler=archiveForms)
+
+    documents = commands.add_parser("migrate-documents", help="switch a form to document storage and fold its field_data rows in")
+    documents.add_argument("--form-id", type=int, required=True)
+    documents.add_argument("--chunk-size", type=int, default=500, help="submissions per transaction")
+    documents.add_argument("--pause", type=float, default=0.0, help="seconds to sleep between chunks")
+    documents.set_defaults(handler=migrateDocuments)
+
+    migrations = commands.add_parser("db-migrate", help="apply pending schema migrations")
+    migrations.add_argument("--check", action="store_true", help="only report, exit 1 when migrations are pending")
+    migrations.set_defaults(handler=migrateSchema)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = buildParser().parse_args(argv)
+    try:
+        return args.handler(args)
+    except HTTPException as e:
+        logger.error(f"{args.command} failed: {e.detail}")
+        return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,322 @@
+import fcntl
+import json
+import os
+import shutil
+import struct
+import threading
+import time
+import zlib
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from sqlalchemy import delete, event, select
+from sqlalchemy.orm import Session
+
+from app.db.dbModel import FieldData, Submission
+from app.db.documents import documentValues
+from app.utils.logger import getLogger
+
+logger = getLogger()
+
+# per form directory: segment_NNNNNN.seg holds zlib blocks (one per archival chunk, a JSON list of
+# submissions), index.bin holds one fixed size entry per archived submission pointing at its block,
+# remap.json maps field ids of archived records to the ids they were rekeyed to since
+INDEX_ENTRY = struct.Struct("<qIQI")  # submission id, segment number, block offset, block length
+
+
+def _encodeTime(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def _decodeTime(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value is not None else None
+
+
+class ArchiveLocked(Exception):
+    """another process is archiving this form"""
+
+
+class ArchiveStore:
+    """ append-only compressed cold storage for submissions past their form's retention """
+
+    def __init__(self, root: str, segmentBytes: int = 64 * 1024 * 1024, compressLevel: int = 6):
+        self.root = root
+        self.segmentBytes = segmentBytes
+        self.compressLevel = compressLevel
+        # form id -> (index file size, sorted ids, locations), reloaded when the file grew
+        self._indexes: Dict[int, Tuple[int, List[int], List[Tuple[int, int, int]]]] = {}
+        # form id -> (remap.json mtime, old field id -> current field id)
+        self._remaps: Dict[int, Tuple[int, Dict[int, int]]] = {}
+        self._lock = threading.Lock()
+
+    def _formDir(self, formId: int) -> str:
+        return os.path.join(self.root, f"form_{formId}")
+
+    def _segmentPath(self, formId: int, segment: int) -> str:
+        return os.path.join(self._formDir(formId), f"segment_{segment:06d}.seg")
+
+    @contextmanager
+    def writer(self, formId: int):
+        """exclusive, non blocking: one archiver per form across processes"""
+
+        os.makedirs(self._formDir(formId), exist_ok=True)
+        with open(os.path.join(self._formDir(formId), ".lock"), "w") as lockFile:
+            try:
+                fcntl.flock(lockFile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise ArchiveLocked(f"form ID {formId} is being archived by another process")
+            try:
+                yield
+            finally:
+                fcntl.flock(lockFile, fcntl.LOCK_UN)
+
+    def append(self, formId: int, records: List[Dict[str, Any]]) -> None:
+        """write one block and its index entries, durable before returning; caller holds writer()"""
+
+        block = zlib.compress(json.dumps(records, separators=(",", ":")).encode(), self.compressLevel)
+
+        segments = sorted(name for name in os.listdir(self._formDir(formId)) if name.endswith(".seg"))
+        segment = int(segments[-1][8:14]) if segments else 0
+        if segments and os.path.getsize(self._segmentPath(formId, segment)) + len(block) > self.segmentBytes:
+            segment += 1
+
+        with open(self._segmentPath(formId, segment), "ab") as handle:
+            offset = handle.tell()
+            handle.write(block)
+            handle.flush()
+            os.fsync(handle.fileno())
+
+        with open(os.path.join(self._formDir(formId), "index.bin"), "ab") as handle:
+            handle.write(b"".join(INDEX_ENTRY.pack(record["id"], segment, offset, len(block)) for record in records))
+            handle.flush()
+            os.fsync(handle.fileno())
+
+    def _index(self, formId: int) -> Tuple[List[int], List[Tuple[int, int, int]]]:
+        path = os.path.join(self._formDir(formId), "index.bin")
+        try:
+            size = os.path.getsize(path)
+        except FileNotFoundError:
+            return [], []
+
+        with self._lock:
+            cached = self._indexes.get(formId)
+            if cached and cached[0] == size:
+                return cached[1], cached[2]
+
+        with open(path, "rb") as handle:
+            data = handle.read(size - size % INDEX_ENTRY.size)
+        # a crash between block write and row delete archives a chunk twice, the later entry wins
+        locations = {entry[0]: entry[1:] for entry in INDEX_ENTRY.iter_unpack(data)}
+        ids = sorted(locations)
+        index = (size, ids, [locations[submissionId] for submissionId in ids])
+        with self._lock:
+            self._indexes[formId] = index
+        return index[1], index[2]
+
+    def fieldRemap(self, formId: int) -> Dict[int, int]:
+        """archived field id -> current field id, for fields copied or merged after archival"""
+
+        path = os.path.join(self._formDir(formId), "remap.json")
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+
+        with self._lock:
+            cached = self._remaps.get(formId)
+            if cached and cached[0] == mtime:
+                return cached[1]
+
+        with open(path) as handle:
+            remap = {int(old): new for old, new in json.load(handle).items()}
+        with self._lock:
+            self._remaps[formId] = (mtime, remap)
+        return remap
+
+    def rekey(self, formId: int, mapping: Dict[int, int]) -> None:
+        """record field id changes for a form's archived records, composed with earlier ones"""
+
+        if not mapping or not os.path.isdir(self._formDir(formId)):
+            return
+        path = os.path.join(self._formDir(formId), "remap.json")
+        with open(os.path.join(self._formDir(formId), ".remap.lock"), "w") as lockFile:
+            fcntl.flock(lockFile, fcntl.LOCK_EX)
+            try:
+                remap = {}
+                if os.path.exists(path):
+                    with open(path) as handle:
+                        remap = {int(old): new for old, new in json.load(handle).items()}
+                remap = {old: mapping.get(current, current) for old, current in remap.items()}
+                for old, new in mapping.items():
+                    remap.setdefault(old, new)
+
+                # replaced whole, readers see the old map or the new one
+                with open(path + ".tmp", "w") as handle:
+                    json.dump({str(old): new for old, new in remap.items() if old != new}, handle)
+                    handle.flush()
+                    os.fsync(handle.fileno())
+                os.replace(path + ".tmp", path)
+            finally:
+                fcntl.flock(lockFile, fcntl.LOCK_UN)
+        with self._lock:
+            self._remaps.pop(formId, None)
+
+    def formIds(self) -> List[int]:
+        """forms with an archive directory"""
+
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(int(name[5:]) for name in os.listdir(self.root) if name.startswith("form_") and name[5:].isdigit())
+
+    def _readBlock(self, formId: int, location: Tuple[int, int, int]) -> List[Dict[str, Any]]:
+        segment, offset, length = location
+        with open(self._segmentPath(formId, segment), "rb") as handle:
+            handle.seek(offset)
+            return json.loads(zlib.decompress(handle.read(length)))
+
+    @staticmethod
+    def _decode(record: Dict[str, Any], formId: int, fieldNames: Dict[int, str], remap: Dict[int, int]) -> Dict[str, Any]:
+        """same shape as FormStore._readSubmissionDetails, names from the current definition"""
+
+        values = {}
+        for fieldId, value in record["values"]:
+            fieldId = remap.get(fieldId, fieldId)
+            values[fieldNames.get(fieldId, f"field_{fieldId}")] = value
+        return {
+            "id": record["id"],
+            "form_id": formId,
+            "created": _decodeTime(record["created"]),
+            "updated": _decodeTime(record["updated"]),
+            "values": values,
+        }
+
+    def lookup(self, formId: int, submissionIds: Iterable[int], fieldNames: Dict[int, str]) -> Dict[int, Dict[str, Any]]:
+        ids, locations = self._index(formId)
+        wanted: Dict[Tuple[int, int, int], set] = {}
+        for submissionId in submissionIds:
+            position = bisect_left(ids, submissionId)
+            if position < len(ids) and ids[position] == submissionId:
+                wanted.setdefault(locations[position], set()).add(submissionId)
+
+        found = {}
+        remap = self.fieldRemap(formId)
+        for location, blockIds in wanted.items():
+            for record in self._readBlock(formId, location):
+                if record["id"] in blockIds:
+                    found[record["id"]] = self._decode(record, formId, fieldNames, remap)
+        return found
+
+    def _iterRecords(self, formId: int) -> Iterator[Dict[str, Any]]:
+        ids, locations = self._index(formId)
+        currentLocation = None
+        records: Dict[int, Dict[str, Any]] = {}
+        for submissionId, location in zip(ids, locations):
+            # consecutive ids share a block, each block is decompressed once in a row
+            if location != currentLocation:
+                records = {record["id"]: record for record in self._readBlock(formId, location)}
+                currentLocation = location
+            yield records[submissionId]
+
+    def iterForm(self, formId: int, fieldNames: Dict[int, str]) -> Iterator[Dict[str, Any]]:
+        """every archived submission of a form in id order"""
+
+        remap = self.fieldRemap(formId)
+        for record in self._iterRecords(formId):
+            yield self._decode(record, formId, fieldNames, remap)
+
+    def iterRawValues(self, formId: int) -> Iterator[Tuple[int, List[Tuple[int, Any]]]]:
+        """(submission id, (field id, value) pairs) per archived submission, for rollup rebuilds"""
+
+        remap = self.fieldRemap(formId)
+        for record in self._iterRecords(formId):
+            yield record["id"], [(remap.get(fieldId, fieldId), value) for fieldId, value in record["values"]]
+
+    def count(self, formId: int) -> int:
+        return len(self._index(formId)[0])
+
+    def drop(self, formId: int) -> None:
+        shutil.rmtree(self._formDir(formId), ignore_errors=True)
+        with self._lock:
+            self._indexes.pop(formId, None)
+            self._remaps.pop(formId, None)
+
+
+archiveStore = ArchiveStore(
+    os.getenv("ARCHIVE_DIR", "archive"),
+    segmentBytes=int(os.getenv("ARCHIVE_SEGMENT_MB", "64")) * 1024 * 1024,
+)
+
+
+def scheduleArchiveRekey(db: Session, mapping: Dict[int, int], formId: Optional[int] = None) -> None:
+    """rekey archived records along with a field copy or merge once db commits, dropped on rollback;
+    formId None applies the mapping to every archived form"""
+
+    if not mapping:
+        return
+    if not event.contains(db, "after_commit", _applyArchiveRekeys):
+        event.listen(db, "after_commit", _applyArchiveRekeys)
+        event.listen(db, "after_rollback", _dropArchiveRekeys)
+    db.info.setdefault("archive_rekeys", []).append((formId, dict(mapping)))
+
+
+def _applyArchiveRekeys(db: Session) -> None:
+    for formId, mapping in db.info.pop("archive_rekeys", []):
+        for archivedFormId in ([formId] if formId is not None else archiveStore.formIds()):
+            archiveStore.rekey(archivedFormId, mapping)
+
+
+def _dropArchiveRekeys(db: Session) -> None:
+    db.info.pop("archive_rekeys", None)
+
+
+def archiveSubmissions(db: Session, formId: int, cutoff: datetime, chunkSize: int = 500,
+                       pause: float = 0.0, limit: Optional[int] = None) -> int:
+    """move a form's submissions created before cutoff into the archive, oldest first
+
+    every chunk is written and fsynced to the archive, then deleted in its own short transaction,
+    so row locks are held for one chunk only; pause seconds between chunks to yield to live traffic
+    """
+
+    moved = 0
+    with archiveStore.writer(formId):
+        while limit is None or moved < limit:
+            size = chunkSize if limit is None else min(chunkSize, limit - moved)
+            submissionIds = db.execute(
+                select(Submission.id)
+                .where(Submission.form_id == formId, Submission.created < cutoff)
+                .order_by(Submission.id)
+                .limit(size)
+            ).scalars().all()
+            if not submissionIds:
+                break
+
+            records: Dict[int, Dict[str, Any]] = {}
+            for submissionId, created, updated, document, fieldId, value in db.execute(
+                select(
+                    Submission.id, Submission.created, Submission.updated, Submission.document,
+                    FieldData.field_id, FieldData.value
+                )
+                .outerjoin(FieldData, FieldData.submission_id == Submission.id)
+                .where(Submission.id.in_(submissionIds))
+                .order_by(Submission.id, FieldData.id)
+            ):
+                record = records.get(submissionId)
+                if record is None:
+                    record = records[submissionId] = {
+                        "id": submissionId, "created": _encodeTime(created), "updated": _encodeTime(updated),
+                        "values": [[fieldId, value] for fieldId, value in documentValues(document)]
+                    }
+                if fieldId is not None:
+                    record["values"].append([fieldId, value])
+
+            archiveStore.append(formId, list(records.values()))
+            db.execute(delete(FieldData).where(FieldData.submission_id.in_(submissionIds)))
+            db.execute(delete(Submission).where(Submission.id.in_(submissionIds)))
+            db.commit()
+
+            moved += len(submissionIds)
+            logger.info("Archived %s submissions of form ID %s", len(submissionIds), formId)
+            if pause:
+                time.sleep(pause)
+    return moved
@@ -0,0 +1,64 @@
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.store import FormStore
+from app.schemas import FormCreate, FormInDB, FormPage, FormUpdate, SubmissionCreate, SubmissionInDB
+
+
+class AsyncFormStore:
+    """ FormStore on an AsyncSession
+
+    every call runs the sync store through AsyncSession.run_sync, so the queries go over
+    asyncpg on the event loop instead of occupying a threadpool slot. results are
+    serialized inside run_sync because lazy loads are not allowed once back in async code
+    """
+
+    @staticmethod
+    async def createForm(db: AsyncSession, formData: FormCreate) -> FormInDB:
+        return await db.run_sync(
+            lambda session: FormInDB.model_validate(FormStore.createForm(session, formData))
+        )
+
+    @staticmethod
+    async def getForm(db: AsyncSession, formId: int) -> FormInDB:
+        return await db.run_sync(
+            lambda session: FormStore.getFormDefinition(session, formId).form
+        )
+
+    @staticmethod
+    async def updateForm(db: AsyncSession, formId: int, formData: FormUpdate) -> FormInDB:
+        return await db.run_sync(
+            lambda session: FormInDB.model_validate(FormStore.updateForm(session, formId, formData))
+        )
+
+    @staticmethod
+    async def createSubmission(db: AsyncSession, submitData: SubmissionCreate) -> SubmissionInDB:
+        return await db.run_sync(
+            lambda session: SubmissionInDB.model_validate(FormStore.createSubmission(session, submitData))
+        )
+
+    @staticmethod
+    async def createSubmissions(db: AsyncSession, formId: int, submissions: List[SubmissionCreate]) -> Dict[str, Any]:
+        return await db.run_sync(FormStore.createSubmissions, formId, submissions)
+
+    @staticmethod
+    async def getSubmissionValues(db: AsyncSession, formId: int, submitId: int) -> Dict[str, Any]:
+        return await db.run_sync(FormStore.getSubmissionValues, formId, submitId)
+
+    @staticmethod
+    async def getFormVersion(db: AsyncSession, formId: int) -> Optional[int]:
+        return await db.run_sync(FormStore.getFormVersion, formId)
+
+    @staticmethod
+    async def getSubmissionStamp(db: AsyncSession, formId: int, submitId: int) -> Optional[Tuple[datetime, Optional[datetime]]]:
+        return await db.run_sync(FormStore.getSubmissionStamp, formId, submitId)
+
+    @staticmethod
+    async def getForms(db: AsyncSession, cursor: Optional[str] = None, range: int = 100) -> FormPage:
+        return await db.run_sync(
+            lambda session: FormPage.model_validate(FormStore.getForms(session, cursor, range))
+        )
+
+    @staticmethod
+    async def removeForm(db: AsyncSession, formId: int) -> bool:
+        return await db.run_sync(FormStore.removeForm, formId)
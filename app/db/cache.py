@@ -0,0 +1,266 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, FrozenSet, Hashable, List, Optional
+
+from app.db.dbModel import Form
+from app.db.sharedCache import SharedFormCache
+from app.schemas import FormInDB, FieldInDB
+
+
+class LRUCache:
+    """ bounded LRU with a per-entry TTL, shared by the threadpool workers of one process """
+
+    def __init__(self, maxSize: int = 1024, ttl: float = 300.0):
+        self.maxSize = maxSize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._invalidations = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        if self.maxSize <= 0:
+            return
+        with self._lock:
+            self._store(key, value)
+
+    def getOrLoad(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """get, or run loader on a miss and cache its result unless an invalidation raced it"""
+
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            seen = self._invalidations
+        value = loader()
+
+        if self.maxSize > 0:
+            with self._lock:
+                if seen == self._invalidations:
+                    self._store(key, value)
+        return value
+
+    def getOrLoadMany(self, keys: List[Hashable], loader: Callable[[List[Hashable]], Dict[Hashable, Any]]) -> Dict[Hashable, Any]:
+        """getOrLoad for many keys, one loader call for all misses; keys the loader leaves out stay absent"""
+
+        found: Dict[Hashable, Any] = {}
+        missing: List[Hashable] = []
+        for key in keys:
+            value = self.get(key)
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+        if not missing:
+            return found
+
+        with self._lock:
+            seen = self._invalidations
+        loaded = loader(missing)
+
+        if self.maxSize > 0:
+            with self._lock:
+                if seen == self._invalidations:
+                    for key, value in loaded.items():
+                        self._store(key, value)
+        found.update(loaded)
+        return found
+
+    def invalidate(self, key: Hashable) -> None:
+        with self._lock:
+            self._invalidations += 1
+            self._entries.pop(key, None)
+
+    def remove(self, key: Hashable) -> None:
+        """key deleted at its source; for this cache the same as invalidate"""
+        self.invalidate(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._invalidations += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.maxSize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        # caller holds the lock
+        self._entries[key] = (value, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxSize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+
+class FormDefinition:
+    """ resolved, session independent view of a form used by reads and submission validation """
+
+    __slots__ = ("form", "referenceFields", "fieldIds", "fieldNames", "fieldTypes")
+
+    def __init__(self, form: FormInDB, referenceFields: List[FieldInDB], fieldIds: FrozenSet[int], fieldNames: Dict[int, str]):
+        self.form = form
+        self.referenceFields = referenceFields
+        self.fieldIds = fieldIds
+        self.fieldNames = fieldNames
+        self.fieldTypes = {field.id: field.type for field in referenceFields + form.fields}
+
+    @property
+    def version(self) -> int:
+        return self.form.version
+
+    @classmethod
+    def fromForm(cls, form: Form) -> "FormDefinition":
+        referenceFields = [FieldInDB.model_validate(field) for field in getattr(form, "reference_fields", [])]
+        return cls._resolve(FormInDB.model_validate(form), referenceFields)
+
+    @classmethod
+    def _resolve(cls, form: FormInDB, referenceFields: List[FieldInDB]) -> "FormDefinition":
+        fieldIds = frozenset(
+            [field.id for field in form.fields] + [field.id for field in referenceFields]
+        )
+        return cls(
+            form=form,
+            referenceFields=referenceFields,
+            fieldIds=fieldIds,
+            fieldNames={field.id: field.name for field in form.fields},
+        )
+
+    def toJson(self) -> bytes:
+        """payload of the shared cache; the id maps are rebuilt on load, not stored"""
+        return json.dumps({
+            "form": self.form.model_dump(mode="json"),
+            "reference_fields": [field.model_dump(mode="json") for field in self.referenceFields],
+        }, separators=(",", ":")).encode()
+
+    @classmethod
+    def fromJson(cls, payload: bytes) -> "FormDefinition":
+        document = json.loads(payload)
+        return cls._resolve(
+            FormInDB.model_validate(document["form"]),
+            [FieldInDB.model_validate(field) for field in document["reference_fields"]],
+        )
+
+
+class TieredFormCache:
+    """ process local LRU in front of the host wide SharedFormCache, same interface as LRUCache
+
+    local entries remember the shared generation they were made at, so an invalidation in any
+    worker retires every worker's local copy on its next read; keep the local LRU small so per
+    host memory does not grow with the worker count
+    """
+
+    def __init__(self, local: LRUCache, shared: SharedFormCache):
+        self.local = local
+        self.shared = shared
+
+    def get(self, formId: int) -> Optional[FormDefinition]:
+        generation = self.shared.generation(formId)
+        entry = self.local.get(formId)
+        if entry is not None and entry[0] == generation:
+            return entry[1]
+
+        payload = self.shared.get(formId, generation)
+        if payload is None:
+            return None
+        definition = FormDefinition.fromJson(payload)
+        self.local.put(formId, (generation, definition))
+        return definition
+
+    def _store(self, formId: int, generation: int, definition: FormDefinition) -> None:
+        # skipped by the shared cache when an invalidation came in since generation was read or it
+        # holds a newer version; too big to share is still cached locally while generation holds
+        payload = definition.toJson()
+        if self.shared.put(formId, generation, payload, definition.version) or (
+            len(payload) > self.shared.slotBytes and self.shared.generation(formId) == generation
+        ):
+            self.local.put(formId, (generation, definition))
+
+    def put(self, formId: int, definition: FormDefinition) -> None:
+        self._store(formId, self.shared.generation(formId), definition)
+
+    def getOrLoad(self, formId: int, loader: Callable[[], FormDefinition]) -> FormDefinition:
+        definition = self.get(formId)
+        if definition is not None:
+            return definition
+        generation = self.shared.generation(formId)
+        definition = loader()
+        self._store(formId, generation, definition)
+        return definition
+
+    def getOrLoadMany(self, formIds: List[int], loader: Callable[[List[int]], Dict[int, FormDefinition]]) -> Dict[int, FormDefinition]:
+        found: Dict[int, FormDefinition] = {}
+        missing: List[int] = []
+        for formId in formIds:
+            definition = self.get(formId)
+            if definition is None:
+                missing.append(formId)
+            else:
+                found[formId] = definition
+        if not missing:
+            return found
+
+        generations = {formId: self.shared.generation(formId) for formId in missing}
+        loaded = loader(missing)
+        for formId, definition in loaded.items():
+            self._store(formId, generations[formId], definition)
+        found.update(loaded)
+        return found
+
+    def invalidate(self, formId: int) -> None:
+        self.shared.invalidate(formId)
+        self.local.invalidate(formId)
+
+    def remove(self, formId: int) -> None:
+        """form deleted: its slot forgets the version too, see SharedFormCache.invalidate"""
+        self.shared.invalidate(formId, removed=True)
+        self.local.invalidate(formId)
+
+    def clear(self) -> None:
+        self.shared.clear()
+        self.local.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        return {**self.local.stats(), "shared": self.shared.stats()}
+
+
+formCache = LRUCache(
+    maxSize=int(os.getenv("FORM_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("FORM_CACHE_TTL", "300")),
+)
+if os.getenv("SHARED_FORM_CACHE_PATH"):
+    # e.g. /dev/shm/forms-cache: one copy of the hot definitions per host instead of per worker
+    formCache = TieredFormCache(formCache, SharedFormCache(
+        os.getenv("SHARED_FORM_CACHE_PATH"),
+        slots=int(os.getenv("SHARED_FORM_CACHE_SLOTS", "2048")),
+        slotBytes=int(os.getenv("SHARED_FORM_CACHE_SLOT_KB", "16")) * 1024,
+    ))
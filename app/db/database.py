@@ -1,9 +1,16 @@
+import asyncio
 import os
+import threading
+import time
+from typing import Dict, Any
+from fastapi import HTTPException, status
 from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import sessionmaker, Session
-from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncEngine, AsyncSession
 from urllib.parse import urlparse
-from app.db.dbModel import Base
+from app.db.migrations import LATEST_VERSION, currentVersion, isCurrent, migrate
 from app.utils.logger import getLogger
 
 
@@ -12,38 +19,160 @@ from app.utils.logger import getLogger
 logger = getLogger()
 
 
-try:
+def _envFlag(name: str, default: str = "") -> bool:
+    return os.getenv(name, default).lower() in ("1", "true", "yes")
+
+
+# pool sizing is per engine, per process: size the database for workers * (size + overflow)
+poolSettings = {
+    "pool_size": int(os.getenv("DB_POOL_SIZE", "5")),
+    "max_overflow": int(os.getenv("DB_MAX_OVERFLOW", "10")),
+    "pool_timeout": float(os.getenv("DB_POOL_TIMEOUT", "10")),
+    "pool_recycle": int(os.getenv("DB_POOL_RECYCLE", "1800")),
+    "pool_pre_ping": _envFlag("DB_POOL_PRE_PING", "true"),
+}
+echoSql = _envFlag("DB_ECHO")
+# server side cap on every statement, postgres cancels anything running longer
+statementTimeoutMs = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "0"))
+# off: startup only checks the schema version and refuses to serve an outdated one, migrations
+# then run out of band with python -m app.cli db-migrate
+migrateOnStart = _envFlag("DB_MIGRATE_ON_START", "true")
+
+
+class PoolStats:
+    """ checkout wait and timeout counters, the pool itself reports occupancy """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.waitTotal = 0.0
+        self.waitMax = 0.0
+
+    def recordCheckout(self, wait: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.waitTotal += wait
+            self.waitMax = max(self.waitMax, wait)
+
+    def recordTimeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "wait_seconds_total": round(self.waitTotal, 6),
+                "wait_seconds_max": round(self.waitMax, 6),
+            }
+
+
+poolStats = PoolStats()
+
+
+def _postgresUrl(driver: str) -> str:
     tmpPostgres = urlparse(os.getenv("DATABASE_URL"))
+    return f"{driver}://{tmpPostgres.username}:{tmpPostgres.password}@{tmpPostgres.hostname}{tmpPostgres.path}"
+
+
+# engines are built on first use, not at import: the cli, the ingest worker and a sync-only
+# deployment never pay for the asyncpg engine, and importing the app opens nothing
+_engines: Dict[str, Any] = {}
+_enginesLock = threading.Lock()
+
+
+def _lazyEngine(name: str, factory):
+    engine = _engines.get(name)
+    if engine is None:
+        with _enginesLock:
+            engine = _engines.get(name)
+            if engine is None:
+                try:
+                    engine = _engines[name] = factory()
+                except Exception as e:
+                    logger.critical(f"Failed to create {name} database engine: {str(e)}")
+                    raise
+                logger.info(f"{name} database engine created")
+    return engine
+
+
+def getSyncEngine() -> Engine:
+    return _lazyEngine("sync", lambda: create_engine(
+        _postgresUrl("postgresql"),
+        echo=echoSql,
+        connect_args={"options": f"-c statement_timeout={statementTimeoutMs}"} if statementTimeoutMs else {},
+        **poolSettings
+    ))
+
 
+def getAsyncEngine() -> AsyncEngine:
+    # asyncpg keeps a per-connection LRU of prepared statements, sized here
+    return _lazyEngine("async", lambda: create_async_engine(
+        f"{_postgresUrl('postgresql+asyncpg')}"
+        f"?ssl=require&prepared_statement_cache_size={int(os.getenv('DB_PREPARED_STATEMENT_CACHE_SIZE', '500'))}",
+        echo=echoSql,
+        connect_args={"server_settings": {"statement_timeout": str(statementTimeoutMs)}} if statementTimeoutMs else {},
+        **poolSettings
+    ))
 
-    syncEngine = create_engine(f"postgresql://{tmpPostgres.username}:{tmpPostgres.password}@{tmpPostgres.hostname}{tmpPostgres.path}", echo=True)
-    engineForAsyncDBCreation = create_async_engine(f"postgresql+asyncpg://{tmpPostgres.username}:{tmpPostgres.password}@{tmpPostgres.hostname}{tmpPostgres.path}?ssl=require", echo=True)
 
-    logger.info("Database engine created successfully")
-except Exception as e:
-    logger.critical(f"Failed to create database engines: {str(e)}")
-    raise
+class _SyncSession(Session):
+    def get_bind(self, mapper=None, **kw):
+        return getSyncEngine()
+
+
+class _AsyncBoundSession(Session):
+    def get_bind(self, mapper=None, **kw):
+        return getAsyncEngine().sync_engine
+
 
 async def createDbSchema() -> None:
-    """ create the initial db schema postgress"""
+    """ apply pending migrations on the sync engine; a no-op lookup once the schema is current """
     try:
-        logger.info("Creating database schema")
-        async with engineForAsyncDBCreation.begin() as conn:
-            
-                await conn.run_sync(Base.metadata.create_all)
-        await engineForAsyncDBCreation.dispose()
-        logger.info("Database schema created successfully!!!")
+        if not migrateOnStart:
+            state = await asyncio.to_thread(_schemaState)
+            if not isCurrent(state):
+                raise RuntimeError(
+                    f"database schema at version {state['version'] if state else None}, "
+                    f"this release needs {LATEST_VERSION}: run python -m app.cli db-migrate"
+                )
+            return
+        applied = await asyncio.to_thread(migrate, getSyncEngine())
+        if applied:
+            logger.info(f"Applied migrations {applied}")
     except Exception as e:
-        logger.critical(f"Failed to create database schema: {str(e)}")
+        logger.critical(f"Failed to migrate database schema: {str(e)}")
         raise
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=syncEngine)
+
+def _schemaState():
+    with getSyncEngine().connect() as conn:
+        return currentVersion(conn)
+
+
+SessionLocal = sessionmaker(autocommit=False, autoflush=False, class_=_SyncSession)
+AsyncSessionLocal = async_sessionmaker(autoflush=False, class_=AsyncSession, sync_session_class=_AsyncBoundSession)
 
 
 def getDb():
     
     db = SessionLocal()
     try:
+        # check the connection out up front, so an exhausted pool is a fast 503 instead of a hung request
+        start = time.perf_counter()
+        try:
+            db.connection()
+        except PoolTimeoutError:
+            poolStats.recordTimeout()
+            logger.error("Database pool exhausted, no connection within pool_timeout")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="database busy, retry later"
+            )
+        poolStats.recordCheckout(time.perf_counter() - start)
+
         logger.debug("Database session created")
         yield db
     except Exception as e:
@@ -53,10 +182,57 @@ def getDb():
         logger.debug("Database session closed")
         db.close()
 
+async def getAsyncDb():
+    
+    db = AsyncSessionLocal()
+    try:
+        start = time.perf_counter()
+        try:
+            await db.connection()
+        except PoolTimeoutError:
+            poolStats.recordTimeout()
+            logger.error("Async database pool exhausted, no connection within pool_timeout")
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="database busy, retry later"
+            )
+        poolStats.recordCheckout(time.perf_counter() - start)
+
+        logger.debug("Async database session created")
+        yield db
+    except Exception as e:
+        logger.error(f"Async database session error: {str(e)}")
+        raise
+    finally:
+        logger.debug("Async database session closed")
+        await db.close()
+
 async def shutdownDatabase():
     """Properly close database engine"""
     try:
         logger.info("Shutting down database connections")
-        await engineForAsyncDBCreation.dispose()
+        if "async" in _engines:
+            await _engines["async"].dispose()
+        if "sync" in _engines:
+            _engines["sync"].dispose()
     except Exception as e:
         logger.error(f"Error duringg databasw shutdown: {str(e)}")
+
+
+def poolStatus() -> Dict[str, Any]:
+    """occupancy of both pools plus checkout wait/timeouts of the request paths"""
+
+    def occupancy(pool) -> Dict[str, Any]:
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "checked_in": pool.checkedin(),
+            "overflow": pool.overflow(),
+        }
+
+    # engines nobody used yet are left out rather than built for the report
+    return {
+        **{name: occupancy(engine.pool) for name, engine in list(_engines.items())},
+        "checkouts": poolStats.snapshot(),
+        "settings": poolSettings,
+    }
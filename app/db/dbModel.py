@@ -1,4 +1,7 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, DateTime, Table, JSON
+import hashlib
+import json
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, DateTime, Table, JSON, Float, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy.sql import func
 
@@ -17,18 +20,39 @@ class Form(Base):
     __tablename__ = "form"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
+    # bumped by every definition change, keys compiled validators
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    # submissions older than this many days are moved to the archive, NULL keeps them forever
+    retention_days = Column(Integer, nullable=True)
+    # "rows": one field_data row per value, "document": all values in submission.document
+    storage_mode = Column(String, nullable=False, default="rows", server_default="rows")
     created = Column(DateTime(timezone=True), server_default=func.now())
     updated = Column(DateTime(timezone=True), onupdate=func.now())
 
     fields = relationship("Field", secondary=form_field, back_populates="forms")
     submissions = relationship("Submission", back_populates="form")
 
+def fieldFingerprint(name, type, required, referFieldId) -> str:
+    """content address of a field definition, equal definitions share it"""
+
+    return hashlib.sha256(
+        json.dumps([name, type, bool(required), referFieldId], separators=(",", ":")).encode()
+    ).hexdigest()
+
+
+def _fingerprintDefault(context) -> str:
+    row = context.get_current_parameters()
+    return fieldFingerprint(row.get("name"), row.get("type"), row.get("required"), row.get("refer_field_id"))
+
+
 class Field(Base):
     __tablename__ = "field"
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String, nullable=False)
     type = Column(String, nullable=False)
     required = Column(Boolean, default=False)
+    # sha256 of (name, type, required, refer_field_id), set on insert; whoever edits those columns recomputes it
+    fingerprint = Column(String(64), nullable=True, index=True, default=_fingerprintDefault)
     created = Column(DateTime(timezone=True), server_default=func.now())
     updated = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -42,6 +66,11 @@ class Submission(Base):
     __tablename__ = "submission"
     id = Column(Integer, primary_key=True, index=True)
     form_id = Column(Integer, ForeignKey("form.id"), nullable=False, index=True)
+    # document storage mode: {"<field id>": value}, NULL when the values live in field_data
+    document = Column(JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql"), nullable=True)
+    # typed copies of the document values for filters, {"<field id>:<value_* column>": value}: the
+    # document keeps what was submitted, a key only exists when the value converts to that column
+    projection = Column(JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql"), nullable=True)
     created = Column(DateTime(timezone=True), server_default=func.now())
     updated = Column(DateTime(timezone=True), onupdate=func.now())
 
@@ -54,16 +83,59 @@ class FieldData(Base):
     __tablename__ = "field_data"
     id = Column(Integer, primary_key=True, index=True)
     submission_id = Column(Integer, ForeignKey("submission.id"), nullable=False, index=True)
-    field_id = Column(Integer, ForeignKey("field.id"), nullable=False)
+    field_id = Column(Integer, ForeignKey("field.id"), nullable=False, index=True)
     value = Column(JSON, nullable=True)
+    # typed copies of value, filled at insert from Field.type so filters can use an index
+    value_number = Column(Float, nullable=True)
+    value_text = Column(String, nullable=True)
+    value_bool = Column(Boolean, nullable=True)
+    value_time = Column(DateTime(timezone=True), nullable=True)
     created = Column(DateTime(timezone=True), server_default=func.now())
     updated = Column(DateTime(timezone=True), onupdate=func.now())
 
     submission = relationship("Submission", back_populates="field_values")
     field = relationship("Field", back_populates="values")
 
+    __table_args__ = (
+        Index("ix_field_data_field_number", "field_id", "value_number"),
+        Index("ix_field_data_field_text", "field_id", "value_text"),
+        Index("ix_field_data_field_bool", "field_id", "value_bool"),
+        Index("ix_field_data_field_time", "field_id", "value_time"),
+    )
+
  
 
 
     
 
+
+
+# rollups kept in step with submission inserts, dashboards read these instead of field_data
+class FormStats(Base):
+    __tablename__ = "form_stats"
+    form_id = Column(Integer, primary_key=True)
+    submission_count = Column(Integer, nullable=False, default=0)
+
+
+class FieldStats(Base):
+    __tablename__ = "field_stats"
+    form_id = Column(Integer, primary_key=True)
+    field_id = Column(Integer, primary_key=True)
+    filled_count = Column(Integer, nullable=False, default=0)
+    distinct_count = Column(Integer, nullable=False, default=0)
+    numeric_count = Column(Integer, nullable=False, default=0)
+    numeric_sum = Column(Float, nullable=True)
+    numeric_min = Column(Float, nullable=True)
+    numeric_max = Column(Float, nullable=True)
+
+
+class FieldValueCount(Base):
+    __tablename__ = "field_value_count"
+    form_id = Column(Integer, primary_key=True)
+    field_id = Column(Integer, primary_key=True)
+    value_key = Column(String, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_field_value_count_top", "form_id", "field_id", "count"),
+    )
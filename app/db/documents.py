@@ -0,0 +1,144 @@
+import time
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+from sqlalchemy import delete, select, update
+from sqlalchemy.orm import Session
+
+from app.db.dbModel import Field, FieldData, Submission
+from app.db.projection import projectDocument
+from app.utils.logger import getLogger
+
+logger = getLogger()
+
+# a form in "document" mode writes one submission row holding {"<field id>": value} as submitted,
+# plus its typed projection for filters; reads merge that document with any field_data rows, so
+# forms can be migrated in place
+
+
+def buildDocument(fieldValues: Iterable[Any]) -> Dict[str, Any]:
+    return {str(value.field_id): value.value for value in fieldValues}
+
+
+def documentFieldTypes(db: Session, documents: Iterable[Dict[str, Any]]) -> Dict[int, str]:
+    """Field.type of every field id keyed in the documents, one query"""
+
+    fieldIds = {int(key) for document in documents for key in (document or {})}
+    if not fieldIds:
+        return {}
+    return dict(db.execute(select(Field.id, Field.type).where(Field.id.in_(fieldIds))).all())
+
+
+def documentValues(document: Optional[Dict[str, Any]]) -> Iterator[Tuple[int, Any]]:
+    """(field id, value) pairs of a stored document"""
+
+    for key, value in (document or {}).items():
+        yield int(key), value
+
+
+def rekeyDocuments(db: Session, mapping: Dict[int, int], formId: Optional[int] = None, chunkSize: int = 500) -> int:
+    """rename field id keys inside stored documents, for field copies and merges; caller owns the commit"""
+
+    if not mapping:
+        return 0
+    oldKeys = {str(old): str(new) for old, new in mapping.items()}
+
+    rewritten = 0
+    lastId = 0
+    while True:
+        query = (
+            select(Submission.id, Submission.document, Submission.projection)
+            .where(Submission.document.isnot(None), Submission.id > lastId)
+        )
+        if formId is not None:
+            query = query.where(Submission.form_id == formId)
+        rows = db.execute(query.order_by(Submission.id).limit(chunkSize)).all()
+        if not rows:
+            return rewritten
+        lastId = rows[-1][0]
+
+        for submissionId, document, projection in rows:
+            if oldKeys.keys() & document.keys():
+                # projection keys are "<field id>:<column>"
+                projection = {
+                    ":".join([oldKeys.get(fieldKey, fieldKey), column]): value
+                    for fieldKey, column, value in (key.split(":", 1) + [value] for key, value in (projection or {}).items())
+                }
+                db.execute(
+                    update(Submission).where(Submission.id == submissionId)
+                    .values(
+                        document={oldKeys.get(key, key): value for key, value in document.items()},
+                        projection=projection or None,
+                    )
+                )
+                rewritten += 1
+
+
+def reprojectDocuments(db: Session, formId: int, fieldId: int, chunkSize: int = 500) -> int:
+    """recompute the projections of a form's documents holding fieldId, after its type changed;
+    caller owns the commit"""
+
+    db.flush()
+    rewritten = 0
+    lastId = 0
+    while True:
+        rows = db.execute(
+            select(Submission.id, Submission.document)
+            .where(Submission.form_id == formId, Submission.document.isnot(None), Submission.id > lastId)
+            .order_by(Submission.id).limit(chunkSize)
+        ).all()
+        if not rows:
+            return rewritten
+        lastId = rows[-1][0]
+
+        documents = {submissionId: document for submissionId, document in rows if str(fieldId) in document}
+        fieldTypes = documentFieldTypes(db, documents.values())
+        for submissionId, document in documents.items():
+            db.execute(
+                update(Submission).where(Submission.id == submissionId)
+                .values(projection=projectDocument(document, fieldTypes))
+            )
+        rewritten += len(documents)
+
+
+def migrateToDocuments(db: Session, formId: int, chunkSize: int = 500, pause: float = 0.0) -> int:
+    """fold a form's field_data rows into submission documents, one short transaction per chunk
+
+    values already in a document win over rows of the same field; safe to rerun
+    """
+
+    moved = 0
+    while True:
+        submissionIds = db.execute(
+            select(FieldData.submission_id).distinct()
+            .join(Submission, Submission.id == FieldData.submission_id)
+            .where(Submission.form_id == formId)
+            .order_by(FieldData.submission_id)
+            .limit(chunkSize)
+        ).scalars().all()
+        if not submissionIds:
+            return moved
+
+        rowValues: Dict[int, Dict[str, Any]] = {}
+        stored: Dict[int, Dict[str, Any]] = {}
+        for submissionId, document, fieldId, value in db.execute(
+            select(Submission.id, Submission.document, FieldData.field_id, FieldData.value)
+            .join(FieldData, FieldData.submission_id == Submission.id)
+            .where(Submission.id.in_(submissionIds))
+            .order_by(Submission.id, FieldData.id)
+        ):
+            stored[submissionId] = document or {}
+            rowValues.setdefault(submissionId, {})[str(fieldId)] = value
+
+        documents = {submissionId: {**values, **stored[submissionId]} for submissionId, values in rowValues.items()}
+        fieldTypes = documentFieldTypes(db, documents.values())
+        for submissionId, document in documents.items():
+            db.execute(
+                update(Submission).where(Submission.id == submissionId)
+                .values(document=document, projection=projectDocument(document, fieldTypes))
+            )
+        db.execute(delete(FieldData).where(FieldData.submission_id.in_(submissionIds)))
+        db.commit()
+
+        moved += len(submissionIds)
+        logger.info("Moved %s submissions of form ID %s to documents", len(submissionIds), formId)
+        if pause:
+            time.sleep(pause)
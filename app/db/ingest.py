@@ -0,0 +1,321 @@
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from fastapi import HTTPException, status
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import DBAPIError, OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session
+
+from app.db.database import SessionLocal
+from app.db.dbModel import Submission
+from app.db.store import FormStore
+from app.schemas import SubmissionCreate
+from app.utils.logger import getLogger
+from app.validators import getValidator
+
+logger = getLogger()
+
+
+class IdAllocator:
+    """ hands out submission ids before the row exists, in blocks to keep it off the hot path """
+
+    def __init__(self, blockSize: int = 100):
+        self.blockSize = blockSize
+        self._free: deque = deque()
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, db: Session) -> int:
+        with self._lock:
+            if not self._free:
+                self._refill(db)
+            return self._free.popleft()
+
+    def _refill(self, db: Session) -> None:
+        if db.get_bind().dialect.name == "postgresql":
+            ids = db.execute(
+                text("SELECT nextval(pg_get_serial_sequence('submission', 'id')) FROM generate_series(1, :n)"),
+                {"n": self.blockSize}
+            ).scalars().all()
+        else:
+            # no sequences (sqlite): single process stand-in that continues after the highest stored id
+            start = max(self._next, (db.execute(select(func.max(Submission.id))).scalar() or 0) + 1)
+            ids = range(start, start + self.blockSize)
+            self._next = start + self.blockSize
+        self._free.extend(ids)
+
+
+def _isTransient(error: Exception) -> bool:
+    """connection trouble worth retrying, as opposed to a submission the database rejects"""
+
+    return isinstance(error, (OperationalError, PoolTimeoutError)) or (
+        isinstance(error, DBAPIError) and error.connection_invalidated
+    )
+
+
+class SubmissionQueue:
+    """ write-behind ingest: validated submissions are acknowledged at once and
+    written by one background worker in group commits, sized by count or latency
+
+    a commit failing on connection trouble is retried with exponential backoff, meanwhile the queue
+    fills and new submissions get 503; a batch failing otherwise is retried per form, then per
+    submission, so one bad submission fails alone. what still fails is appended to the dead letter
+    file (JSON lines, replayable) and counted as dead_lettered. acknowledged submissions are lost
+    when the process dies with them queued, or when the dead letter file cannot be written either
+    """
+
+    def __init__(self, sessionFactory: Callable[[], Session], maxSize: int = 10000, maxBatch: int = 500,
+                 maxLatency: float = 0.05, enqueueTimeout: float = 0.0, retries: int = 8,
+                 retryBackoff: float = 0.1, maxBackoff: float = 5.0, deadLetterPath: Optional[str] = None):
+        self.sessionFactory = sessionFactory
+        self.maxBatch = maxBatch
+        self.maxLatency = maxLatency
+        self.enqueueTimeout = enqueueTimeout
+        self.retries = retries
+        self.retryBackoff = retryBackoff
+        self.maxBackoff = maxBackoff
+        self.deadLetterPath = deadLetterPath
+        self.allocator = IdAllocator()
+        self._queue: "queue.Queue[Tuple[int, int, SubmissionCreate]]" = queue.Queue(maxsize=maxSize)
+        self._worker: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+        # held across the stopping check, id reservation and put, and by stop() while setting the flag,
+        # so nothing acknowledged can be enqueued after the worker drained
+        self._admission = threading.Lock()
+        self._statsLock = threading.Lock()
+        self.enqueued = 0
+        self.flushed = 0
+        self.failed = 0
+        self.retried = 0
+        self.deadLettered = 0
+        self.rejected = 0
+        self.batches = 0
+        self.flushSecondsTotal = 0.0
+        self.flushSecondsMax = 0.0
+        self.flushSecondsLast = 0.0
+
+    @property
+    def running(self) -> bool:
+        return self._worker is not None and self._worker.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stopping.clear()
+        self._worker = threading.Thread(target=self._run, name="submission-ingest", daemon=True)
+        self._worker.start()
+        logger.info("Submission ingest queue started")
+
+    def stop(self, timeout: float = 30.0) -> None:
+        """stop accepting work and drain what is queued, used by the shutdown hook"""
+
+        if not self.running:
+            return
+        with self._admission:
+            self._stopping.set()
+        self._worker.join(timeout)
+        if self._worker.is_alive():
+            logger.error(f"Submission ingest queue did not drain in {timeout}s, {self._queue.qsize()} submissions left")
+        else:
+            logger.info("Submission ingest queue drained and stopped")
+        self._worker = None
+
+    def submit(self, db: Session, formId: int, submitData: SubmissionCreate) -> int:
+        """validate, reserve an id and enqueue; 503 when the queue is off or full"""
+
+        if not self.running or self._stopping.is_set():
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="asynchronous ingest is not enabled"
+            )
+
+        errors = getValidator(FormStore.getFormDefinition(db, formId)).validate(submitData.field_values)
+        if errors:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="; ".join(errors)
+            )
+
+        try:
+            with self._admission:
+                if self._stopping.is_set():
+                    raise HTTPException(
+                        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                        detail="asynchronous ingest is shutting down"
+                    )
+                submissionId = self.allocator.reserve(db)
+                if self.enqueueTimeout > 0:
+                    self._queue.put((formId, submissionId, submitData), timeout=self.enqueueTimeout)
+                else:
+                    self._queue.put_nowait((formId, submissionId, submitData))
+        except queue.Full:
+            with self._statsLock:
+                self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="submission queue is full, retry later",
+                headers={"Retry-After": "1"}
+            )
+
+        with self._statsLock:
+            self.enqueued += 1
+        return submissionId
+
+    def stats(self) -> Dict[str, Any]:
+        with self._statsLock:
+            return {
+                "running": self.running,
+                "depth": self._queue.qsize(),
+                "capacity": self._queue.maxsize,
+                "enqueued": self.enqueued,
+                "flushed": self.flushed,
+                "failed": self.failed,
+                "retried": self.retried,
+                "dead_lettered": self.deadLettered,
+                "rejected": self.rejected,
+                "batches": self.batches,
+                "flush_seconds_last": round(self.flushSecondsLast, 6),
+                "flush_seconds_max": round(self.flushSecondsMax, 6),
+                "flush_seconds_avg": round(self.flushSecondsTotal / self.batches, 6) if self.batches else 0.0,
+            }
+
+    def _run(self) -> None:
+        while True:
+            try:
+                first = self._queue.get(timeout=0.2)
+            except queue.Empty:
+                # once stopping is set nothing more is admitted, so an empty queue stays empty
+                if self._stopping.is_set() and self._queue.empty():
+                    return
+                continue
+
+            batch = [first]
+            deadline = time.monotonic() + self.maxLatency
+            while len(batch) < self.maxBatch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            self._flush(batch)
+
+    def _flush(self, batch: List[Tuple[int, int, SubmissionCreate]]) -> None:
+        start = time.perf_counter()
+
+        groups: Dict[int, List[Tuple[int, SubmissionCreate]]] = {}
+        for formId, submissionId, submitData in batch:
+            groups.setdefault(formId, []).append((submissionId, submitData))
+
+        flushed = failed = 0
+        try:
+            self._commit(groups)
+            flushed = len(batch)
+        except Exception as e:
+            if _isTransient(e):
+                # still unreachable after every retry, splitting the batch will not help
+                logger.error(f"Group commit of {len(batch)} submissions failed after {self.retries} retries: {str(e)}")
+                failed = self._deadLetter(batch, e)
+            else:
+                # one bad form group, or one bad submission, must not take the rest down with it
+                logger.error(f"Group commit of {len(batch)} submissions failed, retrying per form: {str(e)}")
+                for formId, items in groups.items():
+                    try:
+                        self._commit({formId: items})
+                        flushed += len(items)
+                        continue
+                    except Exception as e:
+                        logger.error(f"Commit of {len(items)} submissions for form ID {formId} failed, retrying each: {str(e)}")
+                    for submissionId, submitData in items:
+                        try:
+                            self._commit({formId: [(submissionId, submitData)]})
+                            flushed += 1
+                        except Exception as e:
+                            failed += self._deadLetter([(formId, submissionId, submitData)], e)
+
+        elapsed = time.perf_counter() - start
+        with self._statsLock:
+            self.flushed += flushed
+            self.failed += failed
+            self.batches += 1
+            self.flushSecondsLast = elapsed
+            self.flushSecondsTotal += elapsed
+            self.flushSecondsMax = max(self.flushSecondsMax, elapsed)
+
+    def _commit(self, groups: Dict[int, List[Tuple[int, SubmissionCreate]]]) -> None:
+        """insert and commit in a fresh session, retrying connection trouble with exponential backoff"""
+
+        attempt = 0
+        while True:
+            db = self.sessionFactory()
+            try:
+                for formId, items in groups.items():
+                    self._insert(db, formId, items)
+                db.commit()
+                return
+            except Exception as e:
+                db.rollback()
+                if not _isTransient(e) or attempt >= self.retries:
+                    raise
+                delay = min(self.retryBackoff * 2 ** attempt, self.maxBackoff)
+                attempt += 1
+                with self._statsLock:
+                    self.retried += 1
+                logger.warning(f"Ingest commit failed ({str(e)}), retry {attempt} of {self.retries} in {delay:.2f}s")
+                time.sleep(delay)
+            finally:
+                db.close()
+
+    def _deadLetter(self, items: List[Tuple[int, int, SubmissionCreate]], error: Exception) -> int:
+        """append submissions that could not be written to the dead letter file, returns their count"""
+
+        failedAt = datetime.now(timezone.utc).isoformat()
+        written = False
+        if self.deadLetterPath:
+            try:
+                with open(self.deadLetterPath, "a") as handle:
+                    for formId, submissionId, submitData in items:
+                        handle.write(json.dumps({
+                            "form_id": formId, "submission_id": submissionId, "failed_at": failedAt,
+                            "error": str(error), "submission": submitData.model_dump(mode="json"),
+                        }) + "\n")
+                    handle.flush()
+                    os.fsync(handle.fileno())
+                written = True
+            except OSError as e:
+                logger.error(f"Could not write {len(items)} submissions to {self.deadLetterPath}: {str(e)}")
+
+        if written:
+            with self._statsLock:
+                self.deadLettered += len(items)
+            logger.error(f"Dead lettered {len(items)} queued submissions to {self.deadLetterPath}: {str(error)}")
+        else:
+            ids = [submissionId for _, submissionId, _ in items]
+            logger.error(f"Dropped {len(items)} queued submissions {ids}: {str(error)}")
+        return len(items)
+
+    @staticmethod
+    def _insert(db: Session, formId: int, items: List[Tuple[int, SubmissionCreate]]) -> None:
+        FormStore.insertSubmissions(
+            db, formId,
+            [submitData for _, submitData in items],
+            [submissionId for submissionId, _ in items]
+        )
+
+
+ingestEnabled = os.getenv("INGEST_QUEUE_ENABLED", "").lower() in ("1", "true", "yes")
+
+submissionQueue = SubmissionQueue(
+    SessionLocal,
+    maxSize=int(os.getenv("INGEST_QUEUE_SIZE", "10000")),
+    maxBatch=int(os.getenv("INGEST_BATCH_SIZE", "500")),
+    maxLatency=float(os.getenv("INGEST_MAX_LATENCY_MS", "50")) / 1000,
+    enqueueTimeout=float(os.getenv("INGEST_ENQUEUE_TIMEOUT_MS", "0")) / 1000,
+    retries=int(os.getenv("INGEST_RETRIES", "8")),
+    deadLetterPath=os.getenv("INGEST_DEAD_LETTER_PATH", "logs/ingest_dead_letter.jsonl"),
+)
@@ -0,0 +1,157 @@
+import os
+from typing import Any, Dict, List, Optional, Set
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.orm import Session
+
+from app.db.archive import scheduleArchiveRekey
+from app.db.dbModel import Field, FieldData, FieldStats, FieldValueCount, Form, Submission, fieldFingerprint, form_field
+from app.db.documents import rekeyDocuments
+from app.utils.logger import getLogger
+
+logger = getLogger()
+
+# opt-in: createGetField reuses an existing Field row with the same fingerprint instead of inserting a copy
+fieldInterning = os.getenv("FIELD_INTERNING", "").lower() in ("1", "true", "yes")
+
+
+def findInternedField(db: Session, fingerprint: str) -> Optional[Field]:
+    """oldest field with this fingerprint, through the fingerprint index"""
+
+    return db.execute(
+        select(Field).where(Field.fingerprint == fingerprint).order_by(Field.id).limit(1)
+    ).scalar()
+
+
+def refreshFingerprint(field: Field) -> None:
+    field.fingerprint = fieldFingerprint(field.name, field.type, field.required, field.refer_field_id)
+
+
+def detachSharedField(db: Session, form: Form, field: Field) -> Field:
+    """copy-on-write: a field other forms also hold is replaced by a private copy before it is edited
+
+    this form's stored values, rollups and references to it move to the copy, the other forms keep
+    the original
+    """
+
+    shared = db.execute(
+        select(func.count()).select_from(form_field)
+        .where(form_field.c.field_id == field.id, form_field.c.form_id != form.id)
+    ).scalar()
+    if not shared:
+        return field
+
+    copy = Field(name=field.name, type=field.type, required=field.required, refer_field_id=field.refer_field_id)
+    db.add(copy)
+    db.flush()
+    form.fields.remove(field)
+    form.fields.append(copy)
+
+    db.execute(
+        update(FieldData)
+        .where(FieldData.field_id == field.id,
+               FieldData.submission_id.in_(select(Submission.id).where(Submission.form_id == form.id)))
+        .values(field_id=copy.id)
+    )
+    for model in (FieldStats, FieldValueCount):
+        db.execute(
+            update(model).where(model.form_id == form.id, model.field_id == field.id).values(field_id=copy.id)
+        )
+    rekeyDocuments(db, {field.id: copy.id}, form.id)
+    scheduleArchiveRekey(db, {field.id: copy.id}, form.id)
+    logger.info("Copied shared field %s to %s for form ID %s", field.id, copy.id, form.id)
+
+    # this form's fields referencing the original follow it to the copy, shared ones through a
+    # copy of their own; other forms' references stay on the original
+    for referencing in [other for other in form.fields if other.refer_field_id == field.id]:
+        referencing = detachSharedField(db, form, referencing)
+        referencing.refer_field_id = copy.id
+        refreshFingerprint(referencing)
+    return copy
+
+
+def dedupeFields(db: Session, dryRun: bool = False) -> Dict[str, Any]:
+    """one-off migration: merge fields with equal definitions into the oldest row
+
+    references are repointed to the survivor, which changes the fingerprints of the referencing
+    fields, so passes repeat until nothing merges. Touched forms get a version bump; their
+    rollups must be rebuilt afterwards since field ids changed. Caller owns the commit.
+    """
+
+    # rows written before the fingerprint column existed, or by hand
+    for field in db.execute(select(Field).where(Field.fingerprint.is_(None))).scalars():
+        refreshFingerprint(field)
+    db.flush()
+
+    merged = 0
+    passes = 0
+    affectedForms: Set[int] = set()
+    while True:
+        groups = db.execute(
+            select(Field.fingerprint, func.min(Field.id), func.count())
+            .group_by(Field.fingerprint)
+            .having(func.count() > 1)
+        ).all()
+        if not groups:
+            break
+        passes += 1
+
+        survivors = {fingerprint: keepId for fingerprint, keepId, _ in groups}
+        duplicates: Dict[int, int] = {
+            fieldId: survivors[fingerprint]
+            for fieldId, fingerprint in db.execute(
+                select(Field.id, Field.fingerprint).where(Field.fingerprint.in_(list(survivors)))
+            )
+            if fieldId != survivors[fingerprint]
+        }
+        merged += len(duplicates)
+        affectedForms |= set(db.execute(
+            select(form_field.c.form_id).distinct().where(form_field.c.field_id.in_(list(duplicates)))
+        ).scalars())
+        if dryRun:
+            # later passes depend on this one's repointing, the dry run reports the first only
+            break
+
+        _mergeFields(db, duplicates)
+
+    if not dryRun and affectedForms:
+        db.execute(update(Form).where(Form.id.in_(affectedForms)).values(version=Form.version + 1))
+
+    return {"merged": merged, "passes": passes, "forms": sorted(affectedForms), "dry_run": dryRun}
+
+
+def _mergeFields(db: Session, duplicates: Dict[int, int]) -> None:
+    """repoint everything from each duplicate id to its survivor, then drop the duplicates"""
+
+    duplicateIds: List[int] = list(duplicates)
+    links = db.execute(
+        select(form_field.c.form_id, form_field.c.field_id).where(form_field.c.field_id.in_(duplicateIds))
+    ).all()
+    existing = set(db.execute(
+        select(form_field.c.form_id, form_field.c.field_id)
+        .where(form_field.c.field_id.in_(set(duplicates.values())))
+    ).all())
+    db.execute(delete(form_field).where(form_field.c.field_id.in_(duplicateIds)))
+    relinks = []
+    for formId, fieldId in links:
+        link = (formId, duplicates[fieldId])
+        # a form holding two equal fields keeps one
+        if link not in existing:
+            existing.add(link)
+            relinks.append({"form_id": link[0], "field_id": link[1]})
+    if relinks:
+        db.execute(form_field.insert(), relinks)
+
+    rekeyDocuments(db, duplicates)
+    scheduleArchiveRekey(db, duplicates)
+    for duplicateId, survivorId in duplicates.items():
+        db.execute(update(FieldData).where(FieldData.field_id == duplicateId).values(field_id=survivorId))
+        for field in db.execute(select(Field).where(Field.refer_field_id == duplicateId)).scalars():
+            field.refer_field_id = survivorId
+            refreshFingerprint(field)
+
+    # rollups are keyed by field id, the caller rebuilds them for the touched forms
+    for model in (FieldStats, FieldValueCount):
+        db.execute(delete(model).where(model.field_id.in_(duplicateIds)))
+    db.flush()
+    db.execute(delete(Field).where(Field.id.in_(duplicateIds)))
+    db.flush()
@@ -0,0 +1,226 @@
+import hashlib
+import json
+from typing import Callable, Dict, List, NamedTuple, Optional
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, and_, inspect, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.sql import func
+
+from app.db.dbModel import Base, Field, FieldData, Submission, fieldFingerprint
+from app.db.projection import PROJECTION_COLUMNS, projectDocument, reprojectRows
+from app.utils.logger import getLogger
+
+logger = getLogger()
+
+# kept out of Base.metadata, so create_all/drop_all of the models never touch it
+schemaVersionTable = Table(
+    "schema_version", MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("fingerprint", String(64), nullable=False),
+    Column("applied", DateTime(timezone=True), server_default=func.now()),
+)
+
+# any constant works, it only has to be the same for every process migrating this database
+ADVISORY_LOCK_KEY = 7262910401
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[Connection], None]
+
+
+def metadataFingerprint() -> str:
+    """sha256 of the tables, columns and indexes the models declare; changes whenever dbModel does"""
+
+    tables = []
+    for table in sorted(Base.metadata.tables.values(), key=lambda table: table.name):
+        tables.append([
+            table.name,
+            [[column.name, repr(column.type), column.nullable, column.primary_key] for column in table.columns],
+            sorted([index.name, [column.name for column in index.columns], bool(index.unique)] for index in table.indexes),
+        ])
+    return hashlib.sha256(json.dumps(tables, separators=(",", ":")).encode()).hexdigest()
+
+
+def _addColumns(conn: Connection, tableName: str, names: List[str]) -> None:
+    """ALTER TABLE ADD COLUMN for the model columns the table lacks, with their server defaults"""
+
+    table = Base.metadata.tables[tableName]
+    existing = {column["name"] for column in inspect(conn).get_columns(tableName)}
+    for name in names:
+        if name in existing:
+            continue
+        column = table.c[name]
+        ddl = f"ALTER TABLE {tableName} ADD COLUMN {name} {column.type.compile(dialect=conn.dialect)}"
+        if column.server_default is not None:
+            ddl += f" DEFAULT '{column.server_default.arg}'"
+        if not column.nullable:
+            ddl += " NOT NULL"
+        conn.execute(text(ddl))
+        logger.info("Added column %s.%s", tableName, name)
+
+
+def _createIndexes(conn: Connection, tableName: str, names: List[str]) -> None:
+    """plain CREATE INDEX inside the migration transaction: on a large postgres table create these
+    CONCURRENTLY by hand first, the migration then finds them and moves on"""
+
+    indexes = {index.name: index for index in Base.metadata.tables[tableName].indexes}
+    for name in names:
+        indexes[name].create(conn, checkfirst=True)
+
+
+def _createTables(conn: Connection) -> None:
+    Base.metadata.create_all(conn)
+
+
+def _formVersion(conn: Connection) -> None:
+    _addColumns(conn, "form", ["version"])
+
+
+def _typedValues(conn: Connection) -> None:
+    _addColumns(conn, "field_data", ["value_number", "value_text", "value_bool", "value_time"])
+    _createIndexes(conn, "field_data", [
+        "ix_field_data_field_id", "ix_field_data_field_number", "ix_field_data_field_text",
+        "ix_field_data_field_bool", "ix_field_data_field_time",
+    ])
+
+
+def _fieldFingerprints(conn: Connection) -> None:
+    _addColumns(conn, "field", ["fingerprint"])
+    _createIndexes(conn, "field", ["ix_field_fingerprint"])
+    rows = conn.execute(
+        select(Field.id, Field.name, Field.type, Field.required, Field.refer_field_id).where(Field.fingerprint.is_(None))
+    ).all()
+    for fieldId, name, type, required, referFieldId in rows:
+        conn.execute(
+            update(Field).where(Field.id == fieldId)
+            .values(fingerprint=fieldFingerprint(name, type, required, referFieldId))
+        )
+
+
+def _retention(conn: Connection) -> None:
+    _addColumns(conn, "form", ["retention_days"])
+
+
+def _documentStorage(conn: Connection) -> None:
+    _addColumns(conn, "form", ["storage_mode"])
+    _addColumns(conn, "submission", ["document"])
+
+
+def _documentProjections(conn: Connection) -> None:
+    _addColumns(conn, "submission", ["projection"])
+    lastId = 0
+    while True:
+        rows = conn.execute(
+            select(Submission.id, Submission.document)
+            .where(Submission.document.isnot(None), Submission.projection.is_(None), Submission.id > lastId)
+            .order_by(Submission.id).limit(500)
+        ).all()
+        if not rows:
+            return
+        lastId = rows[-1][0]
+        fieldIds = {int(key) for _, document in rows for key in document}
+        fieldTypes = dict(conn.execute(select(Field.id, Field.type).where(Field.id.in_(fieldIds))).all())
+        for submissionId, document in rows:
+            projection = projectDocument(document, fieldTypes)
+            if projection:
+                conn.execute(update(Submission).where(Submission.id == submissionId).values(projection=projection))
+
+
+def _backfillProjections(conn: Connection) -> None:
+    """field_data rows written before migration 3 have no projections, so filters skipped them"""
+
+    unprojected = and_(*[getattr(FieldData, column).is_(None) for column in PROJECTION_COLUMNS])
+    lastId = 0
+    while True:
+        rows = conn.execute(
+            select(FieldData.id, Field.type, FieldData.value)
+            .join(Field, Field.id == FieldData.field_id)
+            .where(FieldData.id > lastId, unprojected)
+            .order_by(FieldData.id).limit(1000)
+        ).all()
+        if not rows:
+            return
+        lastId = rows[-1][0]
+        reprojectRows(conn, rows)
+
+
+# append only: a released version never changes. every step is idempotent, so a database that
+# create_all already brought up to date (fresh, or from before versioning) passes through them
+MIGRATIONS: List[Migration] = [
+    Migration(1, "create missing tables", _createTables),
+    Migration(2, "form.version", _formVersion),
+    Migration(3, "field_data typed value columns and filter indexes", _typedValues),
+    Migration(4, "field.fingerprint", _fieldFingerprints),
+    Migration(5, "form.retention_days", _retention),
+    Migration(6, "document storage mode", _documentStorage),
+    Migration(7, "submission.projection for document filters", _documentProjections),
+    Migration(8, "field_data projections of rows written before migration 3", _backfillProjections),
+]
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def currentVersion(conn: Connection) -> Optional[Dict[str, object]]:
+    """newest applied migration, None for an unversioned database; one catalog lookup and one select"""
+
+    if not inspect(conn).has_table(schemaVersionTable.name):
+        return None
+    row = conn.execute(
+        select(schemaVersionTable.c.version, schemaVersionTable.c.fingerprint)
+        .order_by(schemaVersionTable.c.version.desc()).limit(1)
+    ).first()
+    return {"version": row.version, "fingerprint": row.fingerprint} if row else None
+
+
+def isCurrent(state: Optional[Dict[str, object]]) -> bool:
+    return state is not None and state["version"] == LATEST_VERSION and state["fingerprint"] == metadataFingerprint()
+
+
+def migrate(engine: Engine) -> List[int]:
+    """bring the database to LATEST_VERSION, returns the versions applied
+
+    when the stored version and model fingerprint match nothing is reflected or created, which is
+    the path every startup after the first takes. concurrent callers serialize on an advisory lock
+    (postgres) and recheck after acquiring it, so a fleet starting together migrates once
+    """
+
+    with engine.connect() as conn:
+        if isCurrent(currentVersion(conn)):
+            logger.debug("Database schema at version %s, nothing to migrate", LATEST_VERSION)
+            return []
+
+    applied: List[int] = []
+    fingerprint = metadataFingerprint()
+    with engine.begin() as conn:
+        if conn.dialect.name == "postgresql":
+            conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": ADVISORY_LOCK_KEY})
+        schemaVersionTable.create(conn, checkfirst=True)
+
+        state = currentVersion(conn)
+        if isCurrent(state):
+            return []
+        stored = state["version"] if state else 0
+        if stored > LATEST_VERSION:
+            # a newer release migrated already, this one runs on the schema it finds
+            logger.warning("Database schema version %s is ahead of this release (%s)", stored, LATEST_VERSION)
+            return []
+        for migration in MIGRATIONS:
+            if migration.version <= stored:
+                continue
+            logger.info("Applying migration %s: %s", migration.version, migration.description)
+            migration.apply(conn)
+            conn.execute(schemaVersionTable.insert().values(
+                version=migration.version, description=migration.description, fingerprint=fingerprint
+            ))
+            applied.append(migration.version)
+
+        if not applied:
+            # the models changed without a migration: new tables are still created, new columns
+            # on existing tables need a Migration entry
+            logger.warning("Model fingerprint changed at schema version %s without a migration", stored)
+            _createTables(conn)
+            conn.execute(
+                update(schemaVersionTable).where(schemaVersionTable.c.version == stored).values(fingerprint=fingerprint)
+            )
+    return applied
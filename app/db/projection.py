@@ -0,0 +1,205 @@
+import json
+import operator
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from fastapi import HTTPException, status
+from sqlalchemy import String, and_, bindparam, cast, or_, update
+from app.db.dbModel import FieldData, Submission
+
+
+# Field.type -> typed projection column on field_data, anything else projects as text
+NUMBER_TYPES = {"number", "integer", "int", "float", "decimal"}
+BOOLEAN_TYPES = {"boolean", "bool", "checkbox"}
+TIME_TYPES = {"date", "datetime", "timestamp"}
+
+PROJECTION_COLUMNS = ("value_number", "value_text", "value_bool", "value_time")
+
+# btree entries have a size limit, text filters compare this prefix; eq/ne with an operand this
+# long recheck the full stored value, ordering operators stay prefix comparisons
+TEXT_PROJECTION_LENGTH = 255
+
+OPERATORS: Dict[str, Callable[[Any, Any], Any]] = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "gt": operator.gt,
+    "gte": operator.ge,
+    "lt": operator.lt,
+    "lte": operator.le,
+}
+
+
+def _toNumber(value: Any) -> Optional[float]:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return None
+
+
+def _toBool(value: Any) -> Optional[bool]:
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.lower() in ("true", "false", "1", "0", "yes", "no"):
+        return value.lower() in ("true", "1", "yes")
+    if isinstance(value, int):
+        return bool(value)
+    return None
+
+
+def _toTime(value: Any) -> Optional[datetime]:
+    """aware UTC datetime, naive values count as UTC; comparisons then agree whatever offset was sent"""
+
+    if isinstance(value, str):
+        try:
+            time = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+        return time.replace(tzinfo=timezone.utc) if time.tzinfo is None else time.astimezone(timezone.utc)
+    return None
+
+
+def _toText(value: Any) -> Optional[str]:
+    if isinstance(value, str):
+        return value[:TEXT_PROJECTION_LENGTH]
+    return None
+
+
+def projectionFor(fieldType: str) -> Tuple[str, Callable[[Any], Any]]:
+    """projection column name and converter for a declared field type"""
+
+    fieldType = (fieldType or "").lower()
+    if fieldType in NUMBER_TYPES:
+        return "value_number", _toNumber
+    if fieldType in BOOLEAN_TYPES:
+        return "value_bool", _toBool
+    if fieldType in TIME_TYPES:
+        return "value_time", _toTime
+    return "value_text", _toText
+
+
+def projectValue(fieldType: str, value: Any) -> Dict[str, Any]:
+    """typed projection columns for one field_data row, empty when the value does not convert"""
+
+    column, convert = projectionFor(fieldType)
+    projected = convert(value)
+    return {column: projected} if projected is not None else {}
+
+
+def reprojectRows(db: Any, rows: Iterable[Tuple[int, str, Any]]) -> int:
+    """rewrite the projection columns of (field_data id, field type, value) rows in one executemany,
+    for rows stored before the columns existed or under another field type; db is a Session or a
+    Connection, the caller owns the commit"""
+
+    table = FieldData.__table__
+    params = [
+        {"row_id": rowId, **{f"new_{column}": None for column in PROJECTION_COLUMNS},
+         **{f"new_{column}": projected for column, projected in projectValue(fieldType, value).items()}}
+        for rowId, fieldType, value in rows
+    ]
+    if params:
+        db.execute(
+            update(table).where(table.c.id == bindparam("row_id"))
+            .values({column: bindparam(f"new_{column}") for column in PROJECTION_COLUMNS}),
+            params
+        )
+    return len(params)
+
+
+def projectDocument(document: Dict[str, Any], fieldTypes: Dict[int, str]) -> Optional[Dict[str, Any]]:
+    """submission.projection for a document: times as UTC ISO strings, which sort in time order, and
+    text untruncated since no btree holds it"""
+
+    projection = {}
+    for key, value in (document or {}).items():
+        column, convert = projectionFor(fieldTypes.get(int(key)))
+        projected = value if column == "value_text" and isinstance(value, str) else convert(value)
+        if projected is not None:
+            projection[f"{key}:{column}"] = projected.isoformat() if column == "value_time" else projected
+    return projection or None
+
+
+# same projections read out of submission.projection, whose keys only ever hold their column's type,
+# so the casts below never see a value of another type
+DOCUMENT_ACCESSORS: Dict[str, Callable[[Any], Any]] = {
+    "value_number": lambda element: element.as_float(),
+    "value_bool": lambda element: element.as_boolean(),
+    "value_text": lambda element: element.as_string(),
+    "value_time": lambda element: element.as_string(),
+}
+
+
+def parseFilters(filters: List[str], fieldNames: Dict[int, str], fieldTypes: Dict[int, str]) -> List[Tuple[int, Any, Any]]:
+    """turn name:op:value strings into (field id, field_data condition, submission.document condition),
+    400 on anything unknown"""
+
+    nameIds = {}
+    for fieldId, name in fieldNames.items():
+        nameIds.setdefault(name, fieldId)
+
+    conditions = []
+    for raw in filters:
+        parts = raw.split(":", 2)
+        if len(parts) != 3:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"filter '{raw}' must look like field:op:value"
+            )
+        name, op, operand = parts
+
+        fieldId = nameIds.get(name)
+        if fieldId is None and name.isdigit() and int(name) in fieldTypes:
+            fieldId = int(name)
+        if fieldId is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"filter field '{name}' is not in this form"
+            )
+        if op not in OPERATORS:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"filter operator '{op}' is not one of {sorted(OPERATORS)}"
+            )
+
+        columnName, convert = projectionFor(fieldTypes.get(fieldId, "text"))
+        if columnName == "value_bool" and op not in ("eq", "ne"):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"boolean field '{name}' only supports eq and ne"
+            )
+        value = convert(operand)
+        if value is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"filter value '{operand}' does not match the type of field '{name}'"
+            )
+
+        column = getattr(FieldData, columnName)
+        rowCondition = OPERATORS[op](column, value)
+        if columnName == "value_text" and op in ("eq", "ne") and len(operand) >= TEXT_PROJECTION_LENGTH:
+            rowCondition = _fullTextCondition(column, op, operand)
+        # document projections hold the untruncated text and normalized times, see projectDocument
+        documentOperand = value
+        if columnName == "value_time":
+            documentOperand = value.astimezone(timezone.utc).isoformat()
+        elif columnName == "value_text":
+            documentOperand = operand
+        documentValue = DOCUMENT_ACCESSORS[columnName](Submission.projection[f"{fieldId}:{columnName}"])
+        documentCondition = OPERATORS[op](documentValue, documentOperand)
+        conditions.append((fieldId, rowCondition, documentCondition))
+
+    return conditions
+
+
+def _fullTextCondition(column, op: str, operand: str):
+    """eq/ne on the whole value: the indexed prefix narrows, the JSON text of value decides.
+    values are serialized with json.dumps on insert, so the same string serializes identically"""
+
+    sameText = cast(FieldData.value, String) == json.dumps(operand)
+    if op == "eq":
+        return and_(column == operand[:TEXT_PROJECTION_LENGTH], sameText)
+    return and_(column.isnot(None), or_(column != operand[:TEXT_PROJECTION_LENGTH], ~sameText))
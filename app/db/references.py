@@ -0,0 +1,66 @@
+from typing import Dict, Iterable, List, Set
+from sqlalchemy import select
+from sqlalchemy.orm import Session, aliased
+
+from app.db.dbModel import Field, form_field
+
+# Field.refer_field_id chains resolved with recursive CTEs, one statement whatever the depth.
+# UNION (not UNION ALL) drops rows already seen, so a cycle stored before checks existed still terminates.
+
+
+def referenceClosure(db: Session, formIds: Iterable[int]) -> Dict[int, List[Field]]:
+    """every field transitively referenced by the fields of each form"""
+
+    formIds = list(formIds)
+    if not formIds:
+        return {}
+
+    chain = (
+        select(form_field.c.form_id.label("form_id"), Field.refer_field_id.label("field_id"))
+        .join(Field, Field.id == form_field.c.field_id)
+        .where(form_field.c.form_id.in_(formIds), Field.refer_field_id.isnot(None))
+        .cte("reference_chain", recursive=True)
+    )
+    parent = aliased(Field)
+    chain = chain.union(
+        select(chain.c.form_id, parent.refer_field_id)
+        .join(parent, parent.id == chain.c.field_id)
+        .where(parent.refer_field_id.isnot(None))
+    )
+
+    closure: Dict[int, List[Field]] = {}
+    for formId, field in db.execute(
+        select(chain.c.form_id, Field).join(Field, Field.id == chain.c.field_id).order_by(chain.c.form_id, Field.id)
+    ):
+        closure.setdefault(formId, []).append(field)
+    return closure
+
+
+def referenceAncestors(db: Session, fieldId: int) -> Set[int]:
+    """fieldId and every field up its reference chain, empty when fieldId does not exist"""
+
+    chain = select(Field.id.label("id")).where(Field.id == fieldId).cte("reference_ancestors", recursive=True)
+    parent = aliased(Field)
+    chain = chain.union(
+        select(parent.refer_field_id)
+        .join(chain, parent.id == chain.c.id)
+        .where(parent.refer_field_id.isnot(None))
+    )
+    return set(db.execute(select(chain.c.id)).scalars().all())
+
+
+def dependentFormIds(db: Session, fieldIds: Iterable[int]) -> Set[int]:
+    """forms holding these fields or any field that transitively references them"""
+
+    fieldIds = list(fieldIds)
+    if not fieldIds:
+        return set()
+
+    chain = select(Field.id.label("id")).where(Field.id.in_(fieldIds)).cte("reference_dependents", recursive=True)
+    child = aliased(Field)
+    chain = chain.union(
+        select(child.id).join(chain, child.refer_field_id == chain.c.id)
+    )
+    return set(db.execute(
+        select(form_field.c.form_id).distinct().where(form_field.c.field_id.in_(select(chain.c.id)))
+    ).scalars().all())
@@ -0,0 +1,196 @@
+import itertools
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from fastapi import Request
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import SQLAlchemyError, TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session
+
+from app.db.database import echoSql, getDb, poolSettings
+from app.utils.logger import getLogger
+
+logger = getLogger()
+
+# set after a successful write, reads of that client go to the primary until the timestamp passes
+STICKY_COOKIE = "db_primary_until"
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# postgres standby: seconds behind the primary, 0 once everything received is replayed (an idle
+# primary would otherwise look further behind every second)
+LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+
+class ReadOnlySession(Session):
+    """ replica session: pending ORM changes fail here instead of on the standby """
+
+    def flush(self, objects=None):
+        if self.new or self.dirty or self.deleted:
+            raise RuntimeError("read replica sessions are read-only")
+        super().flush(objects)
+
+
+class ReplicaRouter:
+    """ round robin over replica engines for read-only requests
+
+    a replica that fails to hand out a connection is skipped for retryAfter seconds, one whose
+    measured lag exceeds maxLag is skipped until the next check; with none usable the primary serves
+    """
+
+    def __init__(self, urls: List[str], maxLag: float = 5.0, lagCheckInterval: float = 2.0,
+                 retryAfter: float = 30.0, stickySeconds: float = 5.0, engineOptions: Optional[Dict[str, Any]] = None):
+        self.urls = urls
+        self.maxLag = maxLag
+        self.lagCheckInterval = lagCheckInterval
+        self.retryAfter = retryAfter
+        self.stickySeconds = stickySeconds
+        self.engineOptions = engineOptions or {}
+        self._engines: List[Optional[Engine]] = [None] * len(urls)
+        self._downUntil = [0.0] * len(urls)
+        # (monotonic time of the check, lag seconds) per replica
+        self._lag = [(float("-inf"), 0.0)] * len(urls)
+        self._rotation = itertools.count()
+        self._lock = threading.Lock()
+        self.replicaReads = 0
+        self.primaryReads = 0
+        self.stickyReads = 0
+        self.failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.urls)
+
+    def _engine(self, index: int) -> Engine:
+        engine = self._engines[index]
+        if engine is None:
+            with self._lock:
+                engine = self._engines[index]
+                if engine is None:
+                    engine = self._engines[index] = create_engine(self.urls[index], **self.engineOptions)
+                    logger.info("Replica %s database engine created", index)
+        return engine
+
+    def isSticky(self, request: Request) -> bool:
+        try:
+            return float(request.cookies.get(STICKY_COOKIE, 0)) > time.time()
+        except ValueError:
+            return False
+
+    def _count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def _lagging(self, index: int, db: Session) -> bool:
+        if db.get_bind().dialect.name != "postgresql":
+            return False
+        checkedAt, lag = self._lag[index]
+        now = time.monotonic()
+        if now - checkedAt >= self.lagCheckInterval:
+            lag = float(db.execute(LAG_QUERY).scalar() or 0)
+            self._lag[index] = (now, lag)
+        return lag > self.maxLag
+
+    def replicaSession(self, request: Request) -> Optional[Session]:
+        """a connected session on a usable replica, None when the primary has to serve this read"""
+
+        if not self.enabled:
+            return None
+        if self.isSticky(request):
+            self._count("stickyReads")
+            return None
+
+        start = next(self._rotation)
+        for offset in range(len(self.urls)):
+            index = (start + offset) % len(self.urls)
+            if self._downUntil[index] > time.monotonic():
+                continue
+            db = ReadOnlySession(bind=self._engine(index), autoflush=False)
+            try:
+                db.connection()
+                if self._lagging(index, db):
+                    logger.warning("Replica %s is %.1fs behind, reading elsewhere", index, self._lag[index][1])
+                    db.close()
+                    continue
+            except PoolTimeoutError:
+                # busy, not broken
+                db.close()
+                continue
+            except SQLAlchemyError as e:
+                db.close()
+                self._downUntil[index] = time.monotonic() + self.retryAfter
+                self._count("failures")
+                logger.error(f"Replica {index} unavailable, skipped for {self.retryAfter}s: {str(e)}")
+                continue
+            self._count("replicaReads")
+            return db
+
+        self._count("primaryReads")
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        return {
+            "replica_reads": self.replicaReads,
+            "primary_reads": self.primaryReads,
+            "sticky_reads": self.stickyReads,
+            "failures": self.failures,
+            "replicas": {
+                str(index): {"down": int(self._downUntil[index] > now), "lag_seconds": self._lag[index][1]}
+                for index in range(len(self.urls))
+            },
+        }
+
+
+replicaRouter = ReplicaRouter(
+    [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()],
+    maxLag=float(os.getenv("DB_REPLICA_MAX_LAG_SECONDS", "5")),
+    lagCheckInterval=float(os.getenv("DB_REPLICA_LAG_CHECK_SECONDS", "2")),
+    retryAfter=float(os.getenv("DB_REPLICA_RETRY_SECONDS", "30")),
+    stickySeconds=float(os.getenv("DB_REPLICA_STICKY_SECONDS", "5")),
+    engineOptions={"echo": echoSql, **poolSettings},
+)
+
+
+def getReadDb(request: Request):
+    """session for GET routes: a replica when one is configured, healthy and caught up, else getDb's"""
+
+    db = replicaRouter.replicaSession(request)
+    if db is None:
+        # through the app's overrides, so whatever stands in for getDb also serves these reads
+        yield from request.app.dependency_overrides.get(getDb, getDb)()
+        return
+    try:
+        logger.debug("Replica database session created")
+        yield db
+    except Exception as e:
+        logger.error(f"Replica database session error: {str(e)}")
+        raise
+    finally:
+        db.close()
+
+
+class StickyWritesMiddleware:
+    """ pure ASGI middleware: a successful write sets STICKY_COOKIE, so the same client reads its
+    own writes from the primary while the replicas catch up """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("method") in SAFE_METHODS or not replicaRouter.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        async def sendWithCookie(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                seconds = replicaRouter.stickySeconds
+                cookie = f"{STICKY_COOKIE}={time.time() + seconds:.3f}; Max-Age={int(seconds) + 1}; Path=/; HttpOnly; SameSite=Lax"
+                message["headers"] = list(message.get("headers", [])) + [(b"set-cookie", cookie.encode())]
+            await send(message)
+
+        await self.app(scope, receive, sendWithCookie)
@@ -0,0 +1,171 @@
+import fcntl
+import mmap
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+from app.utils.logger import getLogger
+
+logger = getLogger()
+
+# file layout, all little endian:
+#   header        magic, slot count, slot payload bytes, generation count, epoch
+#   generations   one u64 per generation bucket (form id % count), bumped by every invalidation
+#   slots         direct mapped by form id % slot count: seq, form id, generation, length, form version, payload
+# readers never lock: a slot's seq is odd while a writer is inside it and changes with every write,
+# so a read that saw the same even seq before and after copied a consistent slot (a seqlock)
+HEADER = struct.Struct("<8sIIIQ")
+GENERATION = struct.Struct("<Q")
+SLOT_HEADER = struct.Struct("<QqQIQ")
+MAGIC = b"FORMSHM2"
+
+
+class SharedFormCache:
+    """ host wide cache of serialized form definitions in one mmap'd file, shared by every worker
+
+    entries carry the generation of their form when they were loaded; invalidate bumps it, which
+    turns the entry (and every worker's local copy made from it) stale at once
+    """
+
+    def __init__(self, path: str, slots: int = 2048, slotBytes: int = 16 * 1024, generations: int = 65536):
+        self.path = path
+        self.slots = slots
+        self.slotBytes = slotBytes
+        self.generations = generations
+        self._generationOffset = HEADER.size
+        self._slotOffset = self._generationOffset + generations * GENERATION.size
+        self._slotSize = SLOT_HEADER.size + slotBytes
+        size = self._slotOffset + slots * self._slotSize
+
+        # fcntl locks exclude other processes only, the thread lock covers this one's threads
+        self._threadLock = threading.Lock()
+        self._fd = self._open(path, size)
+        if self._fd is None:
+            # another layout lives there, maybe still mapped by workers of the previous deploy:
+            # resizing it under them would SIGBUS their reads, so this layout gets its own file
+            self.path = f"{path}.{MAGIC.decode().lower()}-{slots}x{slotBytes}x{generations}"
+            self._fd = self._open(self.path, size)
+            if self._fd is None:
+                raise RuntimeError(f"Shared form cache file {self.path} holds another layout")
+            logger.warning("Shared form cache at %s has another layout, using %s", path, self.path)
+        self._map = mmap.mmap(self._fd, size)
+
+        self.hits = 0
+        self.misses = 0
+        self.oversize = 0
+
+    def _open(self, path: str, size: int) -> Optional[int]:
+        """descriptor of a cache file with this layout, initialized when missing or empty; None
+        when the file holds another layout, which is left untouched"""
+
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        matches = True
+        with self._locked(fd):
+            header = os.pread(fd, HEADER.size, 0)
+            if not header.strip(b"\0"):
+                # new, or its creator died before writing the header: nobody has it mapped
+                os.ftruncate(fd, size)
+                os.pwrite(fd, HEADER.pack(MAGIC, self.slots, self.slotBytes, self.generations, 0), 0)
+                logger.info("Shared form cache initialized at %s (%s slots of %s bytes)", path, self.slots, self.slotBytes)
+            elif (len(header) != HEADER.size or header[:8] != MAGIC or os.fstat(fd).st_size != size
+                  or HEADER.unpack(header)[1:4] != (self.slots, self.slotBytes, self.generations)):
+                matches = False
+        if not matches:
+            os.close(fd)
+            return None
+        return fd
+
+    @contextmanager
+    def _locked(self, fd: int):
+        with self._threadLock:
+            fcntl.lockf(fd, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.lockf(fd, fcntl.LOCK_UN)
+
+    def _writing(self):
+        return self._locked(self._fd)
+
+    def _epoch(self) -> int:
+        return HEADER.unpack_from(self._map, 0)[4]
+
+    def generation(self, formId: int) -> int:
+        """current generation of a form, any change means every cached copy of it is stale"""
+
+        offset = self._generationOffset + (formId % self.generations) * GENERATION.size
+        return (self._epoch() << 32) + GENERATION.unpack_from(self._map, offset)[0]
+
+    def _slot(self, formId: int) -> int:
+        return self._slotOffset + (formId % self.slots) * self._slotSize
+
+    def get(self, formId: int, generation: int) -> Optional[bytes]:
+        """payload stored for formId at this generation, None on a miss, a stale entry or a concurrent write"""
+
+        offset = self._slot(formId)
+        seq, storedId, storedGeneration, length = SLOT_HEADER.unpack_from(self._map, offset)[:4]
+        payload = None
+        if seq % 2 == 0 and storedId == formId and storedGeneration == generation and length <= self.slotBytes:
+            start = offset + SLOT_HEADER.size
+            payload = self._map[start:start + length]
+            if SLOT_HEADER.unpack_from(self._map, offset)[0] != seq:
+                payload = None
+
+        if payload is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return payload
+
+    def put(self, formId: int, generation: int, payload: bytes, version: int) -> bool:
+        """store unless the form was invalidated since generation was read or the slot holds a newer
+        version of it; False when not stored"""
+
+        if len(payload) > self.slotBytes:
+            self.oversize += 1
+            return False
+        offset = self._slot(formId)
+        with self._writing():
+            if self.generation(formId) != generation:
+                return False
+            seq, storedId, _, _, storedVersion = SLOT_HEADER.unpack_from(self._map, offset)
+            if storedId == formId and storedVersion > version:
+                return False
+            SLOT_HEADER.pack_into(self._map, offset, seq + 1, 0, 0, 0, 0)
+            self._map[offset + SLOT_HEADER.size:offset + SLOT_HEADER.size + len(payload)] = payload
+            SLOT_HEADER.pack_into(self._map, offset, seq + 2, formId, generation, len(payload), version)
+        return True
+
+    def invalidate(self, formId: int, removed: bool = False) -> None:
+        """the slot keeps its form id and version, so an older definition cannot replace it later;
+        removed forgets both, a form recreated under the same id (sqlite reuses them) starts over"""
+
+        offset = self._generationOffset + (formId % self.generations) * GENERATION.size
+        slot = self._slot(formId)
+        with self._writing():
+            GENERATION.pack_into(self._map, offset, GENERATION.unpack_from(self._map, offset)[0] + 1)
+            seq, storedId = SLOT_HEADER.unpack_from(self._map, slot)[:2]
+            if removed and storedId == formId:
+                SLOT_HEADER.pack_into(self._map, slot, seq + 2, 0, 0, 0, 0)
+
+    def clear(self) -> None:
+        """every entry of every worker stale at once, through the epoch every generation includes"""
+
+        with self._writing():
+            magic, slots, slotBytes, generations, epoch = HEADER.unpack_from(self._map, 0)
+            HEADER.pack_into(self._map, 0, magic, slots, slotBytes, generations, epoch + 1)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "slots": self.slots,
+            "slot_bytes": self.slotBytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "oversize": self.oversize,
+        }
+
+    def close(self) -> None:
+        self._map.close()
+        os.close(self._fd)
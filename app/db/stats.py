@@ -0,0 +1,219 @@
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from fastapi import HTTPException, status
+from sqlalchemy import case, delete, func, select
+from sqlalchemy.orm import Session
+
+from app.db.dbModel import FieldData, FieldStats, FieldValueCount, FormStats, Submission
+from app.db.documents import documentValues
+from app.db.projection import projectionFor
+from app.utils.logger import getLogger
+
+logger = getLogger()
+
+# keeps upsert statements under the bind parameter limits of both dialects
+UPSERT_CHUNK = 500
+VALUE_KEY_LENGTH = 255
+
+
+def _dialectInsert(db: Session):
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        raise RuntimeError(f"field statistics need ON CONFLICT support, not available for {dialect}")
+    return insert
+
+
+def _valueKey(value: Any) -> str:
+    key = value if isinstance(value, str) else json.dumps(value, sort_keys=True)
+    return key[:VALUE_KEY_LENGTH]
+
+
+def _isFilled(value: Any) -> bool:
+    return value is not None and value != "" and value != [] and value != {}
+
+
+def _least(current, incoming):
+    return case((current.is_(None), incoming), (incoming < current, incoming), else_=current)
+
+
+def _greatest(current, incoming):
+    return case((current.is_(None), incoming), (incoming > current, incoming), else_=current)
+
+
+class StatsStore:
+    """ incrementally maintained per-field aggregates of a form's submissions """
+
+    @staticmethod
+    def recordSubmissions(db: Session, formId: int, submissions: Iterable[Iterable[Tuple[int, Any]]],
+                          fieldTypes: Dict[int, str]) -> None:
+        """fold (field_id, value) pairs of new submissions into the rollups, caller owns the commit"""
+
+        submissionCount = 0
+        fields: Dict[int, Dict[str, Any]] = {}
+        valueCounts: Dict[Tuple[int, str], int] = {}
+
+        for fieldValues in submissions:
+            submissionCount += 1
+            for fieldId, value in fieldValues:
+                if not _isFilled(value):
+                    continue
+                aggregate = fields.setdefault(fieldId, {
+                    "filled_count": 0, "numeric_count": 0,
+                    "numeric_sum": None, "numeric_min": None, "numeric_max": None
+                })
+                aggregate["filled_count"] += 1
+
+                column, convert = projectionFor(fieldTypes.get(fieldId))
+                number = convert(value) if column == "value_number" else None
+                if number is not None:
+                    aggregate["numeric_count"] += 1
+                    aggregate["numeric_sum"] = (aggregate["numeric_sum"] or 0.0) + number
+                    aggregate["numeric_min"] = number if aggregate["numeric_min"] is None else min(aggregate["numeric_min"], number)
+                    aggregate["numeric_max"] = number if aggregate["numeric_max"] is None else max(aggregate["numeric_max"], number)
+
+                key = (fieldId, _valueKey(value))
+                valueCounts[key] = valueCounts.get(key, 0) + 1
+
+        if not submissionCount:
+            return
+
+        insert = _dialectInsert(db)
+
+        statement = insert(FormStats).values(form_id=formId, submission_count=submissionCount)
+        db.execute(statement.on_conflict_do_update(
+            index_elements=[FormStats.form_id],
+            set_={"submission_count": FormStats.submission_count + statement.excluded.submission_count}
+        ))
+
+        # a returned count equal to what this call added means the value was new for the field
+        newDistinct: Dict[int, int] = {}
+        rows = [
+            {"form_id": formId, "field_id": fieldId, "value_key": key, "count": count}
+            for (fieldId, key), count in valueCounts.items()
+        ]
+        for start in range(0, len(rows), UPSERT_CHUNK):
+            chunk = rows[start:start + UPSERT_CHUNK]
+            statement = insert(FieldValueCount).values(chunk)
+            statement = statement.on_conflict_do_update(
+                index_elements=[FieldValueCount.form_id, FieldValueCount.field_id, FieldValueCount.value_key],
+                set_={"count": FieldValueCount.count + statement.excluded["count"]}
+            ).returning(FieldValueCount.field_id, FieldValueCount.value_key, FieldValueCount.count)
+            for fieldId, key, count in db.execute(statement):
+                if count == valueCounts[(fieldId, key)]:
+                    newDistinct[fieldId] = newDistinct.get(fieldId, 0) + 1
+
+        rows = [
+            {"form_id": formId, "field_id": fieldId, "distinct_count": newDistinct.get(fieldId, 0), **aggregate}
+            for fieldId, aggregate in fields.items()
+        ]
+        for start in range(0, len(rows), UPSERT_CHUNK):
+            statement = insert(FieldStats).values(rows[start:start + UPSERT_CHUNK])
+            excluded = statement.excluded
+            db.execute(statement.on_conflict_do_update(
+                index_elements=[FieldStats.form_id, FieldStats.field_id],
+                set_={
+                    "filled_count": FieldStats.filled_count + excluded.filled_count,
+                    "distinct_count": FieldStats.distinct_count + excluded.distinct_count,
+                    "numeric_count": FieldStats.numeric_count + excluded.numeric_count,
+                    "numeric_sum": func.coalesce(FieldStats.numeric_sum, 0.0) + func.coalesce(excluded.numeric_sum, 0.0),
+                    "numeric_min": _least(FieldStats.numeric_min, excluded.numeric_min),
+                    "numeric_max": _greatest(FieldStats.numeric_max, excluded.numeric_max),
+                }
+            ))
+
+    @staticmethod
+    def clear(db: Session, formId: int) -> None:
+        for model in (FormStats, FieldStats, FieldValueCount):
+            db.execute(delete(model).where(model.form_id == formId))
+
+    @staticmethod
+    def rebuild(db: Session, formId: int, fieldTypes: Dict[int, str], batchSize: int = 1000) -> int:
+        """recompute a form's rollups from field_data in submission chunks, returns submissions seen"""
+
+        StatsStore.clear(db, formId)
+
+        statement = (
+            select(Submission.id, Submission.document, FieldData.field_id, FieldData.value)
+            .outerjoin(FieldData, FieldData.submission_id == Submission.id)
+            .where(Submission.form_id == formId)
+            .order_by(Submission.id)
+            .execution_options(yield_per=batchSize)
+        )
+
+        seen = 0
+        chunk: List[List[Tuple[int, Any]]] = []
+        currentId = None
+        for submissionId, document, fieldId, value in db.execute(statement):
+            if submissionId != currentId:
+                if len(chunk) >= batchSize:
+                    StatsStore.recordSubmissions(db, formId, chunk, fieldTypes)
+                    seen += len(chunk)
+                    chunk = []
+                chunk.append(list(documentValues(document)))
+                currentId = submissionId
+            if fieldId is not None:
+                chunk[-1].append((fieldId, value))
+
+        if chunk:
+            StatsStore.recordSubmissions(db, formId, chunk, fieldTypes)
+            seen += len(chunk)
+        return seen
+
+    @staticmethod
+    def getStats(db: Session, formId: int, fieldNames: Dict[int, str], top: int = 5) -> Dict[str, Any]:
+        """dashboard aggregates in three queries, independent of the number of submissions"""
+
+        try:
+            submissionCount = db.execute(
+                select(FormStats.submission_count).where(FormStats.form_id == formId)
+            ).scalar() or 0
+
+            stats = {
+                row.field_id: row
+                for row in db.execute(select(FieldStats).where(FieldStats.form_id == formId)).scalars()
+            }
+
+            topValues: Dict[int, List[Dict[str, Any]]] = {}
+            if top > 0:
+                ranked = select(
+                    FieldValueCount.field_id, FieldValueCount.value_key, FieldValueCount.count,
+                    func.row_number().over(
+                        partition_by=FieldValueCount.field_id,
+                        order_by=(FieldValueCount.count.desc(), FieldValueCount.value_key)
+                    ).label("rank")
+                ).where(FieldValueCount.form_id == formId).subquery()
+                for fieldId, key, count in db.execute(
+                    select(ranked.c.field_id, ranked.c.value_key, ranked.c.count)
+                    .where(ranked.c.rank <= top)
+                    .order_by(ranked.c.field_id, ranked.c.rank)
+                ):
+                    topValues.setdefault(fieldId, []).append({"value": key, "count": count})
+
+            fields = []
+            for fieldId in sorted(set(fieldNames) | set(stats)):
+                row: Optional[FieldStats] = stats.get(fieldId)
+                filled = row.filled_count if row else 0
+                fields.append({
+                    "field_id": fieldId,
+                    "name": fieldNames.get(fieldId, f"field_{fieldId}"),
+                    "filled_count": filled,
+                    "fill_rate": filled / submissionCount if submissionCount else 0.0,
+                    "distinct_count": row.distinct_count if row else 0,
+                    "numeric_min": row.numeric_min if row else None,
+                    "numeric_max": row.numeric_max if row else None,
+                    "numeric_mean": row.numeric_sum / row.numeric_count if row and row.numeric_count else None,
+                    "top_values": topValues.get(fieldId, []),
+                })
+
+            return {"form_id": formId, "submission_count": submissionCount, "fields": fields}
+
+        except Exception as e:
+            logger.error(f"Error reading statistics for form ID {formId}: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to read form statistics: {str(e)}"
+            )
@@ -1,8 +1,21 @@
-from typing import List, Dict, Any
-from sqlalchemy.orm import Session, joinedload
+import heapq
+from datetime import datetime
+from typing import List, Dict, Any, Iterator, Optional, Tuple
+from sqlalchemy import and_, func, insert, or_, select, update
+from sqlalchemy.orm import Session, joinedload, selectinload
 from fastapi import HTTPException, status
-from app.db.dbModel import Form, Field, Submission, FieldData, form_field
-from app.schemas import FormCreate, FormBase, FieldCreate, FormUpdate, SubmissionCreate, SubmissionDetail
+from app.db.archive import archiveStore
+from app.db.cache import formCache, FormDefinition
+from app.db.dbModel import Form, Field, Submission, FieldData, form_field, fieldFingerprint
+from app.db.documents import buildDocument, documentValues, reprojectDocuments
+from app.db.interning import fieldInterning, findInternedField, detachSharedField, refreshFingerprint
+from app.db.projection import projectDocument, projectValue, parseFilters, reprojectRows
+from app.db.replicas import ReadOnlySession
+from app.db.references import referenceClosure, referenceAncestors, dependentFormIds
+from app.db.stats import StatsStore
+from app.schemas import FormCreate, FormBase, FieldCreate, FormImport, FormUpdate, SubmissionCreate, SubmissionDetail
+from app.utils.cursor import encodeCursor, decodeCursor
+from app.validators import getValidator
 from app.utils.logger import getLogger
 
 logger = getLogger()
@@ -16,15 +29,18 @@ class FormStore:
         try:
             
             
-            form = Form(name=formData.name)
+            form = Form(name=formData.name, retention_days=formData.retention_days, storage_mode=formData.storage_mode)
             db.add(form)
             db.flush()
             for fieldData in formData.fields:
                 field = FormStore.createGetField(db, fieldData)
-                form.fields.append(field)
+                # an interned field comes back once for equal definitions, the relation holds it once
+                if field not in form.fields:
+                    form.fields.append(field)
 
             db.commit()
             db.refresh(form)
+            FormStore._attachReferences(db, [form])
             return form
         
         except Exception as e:
@@ -36,6 +52,147 @@ class FormStore:
                 detail=f"Failed to create form: {str(e)}"
             )
     
+    @staticmethod
+    def importForms(db: Session, forms: List[FormImport]) -> Dict[str, Any]:
+        """create many forms in one transaction with multi-row inserts
+
+        existing refer_field_ids are checked with one IN query, refer_to keys point at fields of
+        the same batch, which are inserted one reference level after the fields they refer to
+        """
+
+        try:
+            specs = [(formIndex, fieldData) for formIndex, formData in enumerate(forms) for fieldData in formData.fields]
+            levels = FormStore._importLevels(specs)
+
+            externalIds = {fieldData.refer_field_id for _, fieldData in specs if fieldData.refer_field_id}
+            if externalIds:
+                found = set(db.execute(select(Field.id).where(Field.id.in_(list(externalIds)))).scalars())
+                if externalIds - found:
+                    raise HTTPException(
+                        status_code=status.HTTP_404_NOT_FOUND,
+                        detail=f"referenced field ids {sorted(externalIds - found)} not found"
+                    )
+
+            formIds = db.execute(
+                insert(Form).returning(Form.id, sort_by_parameter_order=True),
+                [
+                    {"name": formData.name, "retention_days": formData.retention_days, "storage_mode": formData.storage_mode}
+                    for formData in forms
+                ]
+            ).scalars().all()
+
+            # position in specs -> field id, level by level so refer_to targets exist before their referrers
+            fieldIds: Dict[int, int] = {}
+            keyPositions = {fieldData.key: position for position, (_, fieldData) in enumerate(specs) if fieldData.key}
+            for level in levels:
+                rows = []
+                for position in level:
+                    fieldData = specs[position][1]
+                    referId = fieldIds[keyPositions[fieldData.refer_to]] if fieldData.refer_to else fieldData.refer_field_id
+                    rows.append({
+                        "name": fieldData.name, "type": fieldData.type, "required": fieldData.required,
+                        "refer_field_id": referId or None,
+                        "fingerprint": fieldFingerprint(fieldData.name, fieldData.type, fieldData.required, referId or None)
+                    })
+                fieldIds.update(zip(level, FormStore._insertImportFields(db, rows)))
+
+            links = {(formIds[formIndex], fieldIds[position]) for position, (formIndex, _) in enumerate(specs)}
+            if links:
+                db.execute(insert(form_field), [{"form_id": formId, "field_id": fieldId} for formId, fieldId in sorted(links)])
+
+            db.commit()
+            logger.info("Imported %s forms with %s fields", len(formIds), len(specs))
+            return {
+                "created": len(formIds),
+                "form_ids": formIds,
+                "form_keys": {formData.key: formId for formData, formId in zip(forms, formIds) if formData.key},
+                "field_keys": {key: fieldIds[position] for key, position in keyPositions.items()},
+            }
+
+        except HTTPException:
+            db.rollback()
+            raise
+        except Exception as e:
+            logger.error(f"Error importing forms: {str(e)}")
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to import forms: {str(e)}"
+            )
+
+    @staticmethod
+    def _importLevels(specs: List[Any]) -> List[List[int]]:
+        """group field positions by depth of their refer_to chain inside the batch, 400 on bad keys or cycles"""
+
+        keyPositions: Dict[str, int] = {}
+        for position, (_, fieldData) in enumerate(specs):
+            if fieldData.refer_to and fieldData.refer_field_id:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"field '{fieldData.name}' sets both refer_to and refer_field_id"
+                )
+            if fieldData.key:
+                if fieldData.key in keyPositions:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"field key '{fieldData.key}' used more than once"
+                    )
+                keyPositions[fieldData.key] = position
+
+        depths: Dict[int, int] = {}
+        for start in range(len(specs)):
+            path: List[int] = []
+            onPath = set()
+            position = start
+            while position not in depths:
+                referTo = specs[position][1].refer_to
+                if not referTo:
+                    depths[position] = 0
+                    break
+                if referTo not in keyPositions:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"refer_to '{referTo}' is not a field key in this import"
+                    )
+                if position in onPath:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail=f"refer_to keys form a reference cycle at '{specs[position][1].key}'"
+                    )
+                path.append(position)
+                onPath.add(position)
+                position = keyPositions[referTo]
+            for position in reversed(path):
+                depths[position] = depths[keyPositions[specs[position][1].refer_to]] + 1
+
+        levels: List[List[int]] = [[] for _ in range(max(depths.values(), default=-1) + 1)]
+        for position in range(len(specs)):
+            levels[depths[position]].append(position)
+        return levels
+
+    @staticmethod
+    def _insertImportFields(db: Session, rows: List[Dict[str, Any]]) -> List[int]:
+        """multi-row insert of one reference level, ids in row order; interned rows are reused"""
+
+        if not fieldInterning:
+            return db.execute(insert(Field).returning(Field.id, sort_by_parameter_order=True), rows).scalars().all()
+
+        known = dict(db.execute(
+            select(Field.fingerprint, func.min(Field.id))
+            .where(Field.fingerprint.in_(list({row["fingerprint"] for row in rows})))
+            .group_by(Field.fingerprint)
+        ).all())
+        fresh = {}
+        for row in rows:
+            if row["fingerprint"] not in known:
+                fresh.setdefault(row["fingerprint"], row)
+        if fresh:
+            newIds = db.execute(
+                insert(Field).returning(Field.id, sort_by_parameter_order=True), list(fresh.values())
+            ).scalars().all()
+            known.update(zip(fresh, newIds))
+        return [known[row["fingerprint"]] for row in rows]
+
     @staticmethod
     def createGetField(db: Session, fieldData: FieldCreate) -> Field:
         try:
@@ -47,22 +204,24 @@ class FormStore:
                         detail="data not found for this ref id, contact admin"
                     )
 
-                field = Field(name=fieldData.name,
-                            type=fieldData.type,
-                            required=fieldData.required,
-                            refer_field_id=referencedField.id
-                            )
-                db.add(field)
-                return field
+            if fieldInterning:
+                existing = findInternedField(db, fieldFingerprint(
+                    fieldData.name, fieldData.type, fieldData.required, fieldData.refer_field_id or None
+                ))
+                if existing:
+                    return existing
 
-            else:
-                field = Field(
-                    name=fieldData.name,
-                    type=fieldData.type,
-                    required=fieldData.required
-                )
-                db.add(field)
-                return field
+            field = Field(
+                name=fieldData.name,
+                type=fieldData.type,
+                required=fieldData.required,
+                refer_field_id=fieldData.refer_field_id or None
+            )
+            db.add(field)
+            if fieldInterning:
+                # visible to the lookup of the next field in this same form
+                db.flush()
+            return field
         
         except HTTPException:
             # Re-raise
@@ -80,13 +239,14 @@ class FormStore:
     def getForm(db: Session, formId: int) -> Form:
         try:
             form =  db.query(Form).options(
-                joinedload(Form.fields).joinedload(Field.refer_field)
+                joinedload(Form.fields)
             ).filter(Form.id == formId).first()
             if not form:
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail=f"Form if{formId} not found"
                 )
+            FormStore._attachReferences(db, [form])
             return form
         
         except HTTPException:           
@@ -99,6 +259,104 @@ class FormStore:
             )
         
     
+    @staticmethod
+    def _attachReferences(db: Session, forms: List[Form]) -> None:
+        """resolve the full reference chains of these forms in one query, as form.reference_fields"""
+
+        closure = referenceClosure(db, [form.id for form in forms])
+        for form in forms:
+            form.reference_fields = closure.get(form.id, [])
+
+    @staticmethod
+    def _checkReference(db: Session, fieldId: int, referFieldId: int) -> None:
+        """404 for a missing target, 400 when pointing fieldId at referFieldId would close a cycle"""
+
+        ancestors = referenceAncestors(db, referFieldId)
+        if not ancestors:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="data not found for this ref id, contact admin"
+            )
+        if fieldId in ancestors:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"field {fieldId} referring to field {referFieldId} would create a reference cycle"
+            )
+
+    @staticmethod
+    def getFormDefinition(db: Session, formId: int) -> FormDefinition:
+        """resolved form definition, served from the process cache when warm"""
+
+        if isinstance(db, ReadOnlySession):
+            # a lagging replica can hold an older definition: serve it, never cache it for the
+            # write paths to validate against
+            return formCache.get(formId) or FormDefinition.fromForm(FormStore.getForm(db, formId))
+        return formCache.getOrLoad(
+            formId, lambda: FormDefinition.fromForm(FormStore.getForm(db, formId))
+        )
+
+    @staticmethod
+    def getFormDefinitions(db: Session, formIds: List[int]) -> Dict[int, FormDefinition]:
+        """resolved definitions of many forms: cached ones as they are, the rest in three queries
+        (forms, their fields, the reference closure) whatever the count; missing ids are left out"""
+
+        def load(missing: List[int]) -> Dict[int, FormDefinition]:
+            forms = db.execute(
+                select(Form).options(selectinload(Form.fields)).where(Form.id.in_(missing))
+            ).scalars().all()
+            FormStore._attachReferences(db, forms)
+            return {form.id: FormDefinition.fromForm(form) for form in forms}
+
+        if isinstance(db, ReadOnlySession):
+            # as in getFormDefinition, replica reads leave the cache alone
+            found = {}
+            for formId in formIds:
+                definition = formCache.get(formId)
+                if definition is not None:
+                    found[formId] = definition
+            missing = [formId for formId in formIds if formId not in found]
+            if missing:
+                found.update(load(missing))
+            return found
+        return formCache.getOrLoadMany(formIds, load)
+
+    @staticmethod
+    def getFormsByIds(db: Session, formIds: List[int]) -> Dict[str, Any]:
+        try:
+            logger.info("Getting %s forms by id", len(formIds))
+            definitions = FormStore.getFormDefinitions(db, formIds)
+            return {
+                "forms": {formId: definitions[formId].form for formId in formIds if formId in definitions},
+                "not_found": [formId for formId in formIds if formId not in definitions],
+            }
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error retrieving forms by id: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to retrieve forms: {str(e)}"
+            )
+
+    @staticmethod
+    def getFormVersion(db: Session, formId: int) -> Optional[int]:
+        """definition version for conditional GETs: the cached definition's, else one primary key lookup"""
+
+        definition = formCache.get(formId)
+        if definition is not None:
+            return definition.version
+        return db.execute(select(Form.version).where(Form.id == formId)).scalar()
+
+    @staticmethod
+    def getSubmissionStamp(db: Session, formId: int, submitId: int) -> Optional[Tuple[datetime, Optional[datetime]]]:
+        """(created, updated) of a live submission, None when it is missing or archived"""
+
+        row = db.execute(
+            select(Submission.created, Submission.updated).where(Submission.id == submitId, Submission.form_id == formId)
+        ).first()
+        return (row.created, row.updated) if row else None
+
     @staticmethod
     def updateForm(db: Session, formId: int, formData: FormUpdate) -> Form:
         try:
@@ -107,33 +365,66 @@ class FormStore:
 
             if formData.name:
                 form.name = formData.name
+            if formData.retention_days is not None:
+                form.retention_days = formData.retention_days or None
+            if formData.storage_mode:
+                # new submissions only, 'python -m app.cli migrate-documents' moves the stored ones
+                form.storage_mode = formData.storage_mode
             
             for fieldEntry in formData.fields_add:
                 field = FormStore.createGetField(db, fieldEntry)
-                form.fields.append(field)
+                if field not in form.fields:
+                    form.fields.append(field)
             
             for fieldId in formData.fields_remove:
                 field = db.query(Field).get(fieldId)
 
                 if field and field in form.fields:
-                    form.feilds.remove(field)
+                    form.fields.remove(field)
 
+            changedFieldIds = []
+            retypedFields = []
             for fieldId, fieldData in formData.fields_update.items():
                 field = db.query(Field).get(fieldId)
 
 
                 if field and field in form.fields:
+                    # edits to a field other forms hold too land on a private copy
+                    field = detachSharedField(db, form, field)
+                    changedFieldIds.append(field.id)
                     if fieldData.name:
                         field.name = fieldData.name
-                    if fieldData.type:
+                    if fieldData.type and fieldData.type != field.type:
                         field.type = fieldData.type
+                        retypedFields.append(field)
                     if fieldData.required is not None:
                         field.required = fieldData.required
                     if fieldData.refer_field_id is not None:
+                        FormStore._checkReference(db, field.id, fieldData.refer_field_id)
                         field.refer_field_id = fieldData.refer_field_id
+                    refreshFingerprint(field)
 
+            # stored values stay in the projection column of the old type unless moved over
+            for field in retypedFields:
+                FormStore._reprojectField(db, formId, field)
+
+            # new version -> cached validators for the old definition are never used again; bumped in
+            # SQL so concurrent updates each get their own version, the refresh below reads it back
+            form.version = Form.version + 1
+            # forms referencing the changed fields carry them in their resolved reference_fields,
+            # so their versions (and ETags) move too
+            db.flush()
+            dependents = dependentFormIds(db, changedFieldIds) - {formId}
+            if dependents:
+                db.execute(update(Form).where(Form.id.in_(dependents)).values(version=Form.version + 1))
             db.commit()
             db.refresh(form)
+            FormStore._attachReferences(db, [form])
+
+            for dependentId in dependents:
+                formCache.invalidate(dependentId)
+            formCache.invalidate(formId)
+            formCache.put(formId, FormDefinition.fromForm(form))
             return form
         except HTTPException:
          
@@ -147,38 +438,62 @@ class FormStore:
             )
     
 
+    @staticmethod
+    def _reprojectField(db: Session, formId: int, field: Field, chunkSize: int = 1000) -> None:
+        """re-derive the filter projections of a field's stored values under its current type"""
+
+        lastId = 0
+        while True:
+            rows = db.execute(
+                select(FieldData.id, FieldData.value)
+                .where(FieldData.field_id == field.id, FieldData.id > lastId)
+                .order_by(FieldData.id).limit(chunkSize)
+            ).all()
+            if not rows:
+                break
+            lastId = rows[-1][0]
+            reprojectRows(db, [(rowId, field.type, value) for rowId, value in rows])
+        reprojectDocuments(db, formId, field.id)
+
     @staticmethod
     def createSubmission(db: Session, submitData: SubmissionCreate) -> Submission:
 
         try:
-            form = db.get(Form, submitData.form_id)
-            if not form:
+            definition = FormStore.getFormDefinition(db, submitData.form_id)
+
+            errors = getValidator(definition).validate(submitData.field_values)
+            if errors:
                 raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail=f"Form with ID {submitData.form_id} not found"
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="; ".join(errors)
                 )
-            
-            formFields = FormStore.getFormFields(db, form.id)
-            formFieldData = {field.id for field in formFields}
+            if definition.form.storage_mode == "document":
+                # one row for the whole submission
+                document = buildDocument(submitData.field_values)
+                submission = Submission(
+                    form_id=submitData.form_id, document=document,
+                    projection=projectDocument(document, definition.fieldTypes)
+                )
+                db.add(submission)
+            else:
+                submission = Submission(form_id= submitData.form_id)
+                db.add(submission)
+                db.flush()
 
-            for values in submitData.field_values:
-                if values.field_id not in formFieldData:
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST,
-                        detail=f"requested id not in form ID {form.id}"
+                for value in submitData.field_values:
+                    fieldValue = FieldData(
+                                submission_id= submission.id,
+                                field_id = value.field_id,
+                                value=value.value,
+                                **projectValue(definition.fieldTypes.get(value.field_id), value.value)
                     )
-            submission = Submission(form_id= form.id)
-            db.add(submission)
-            db.flush()
-
-            for value in submitData.field_values:
-                fieldValue = FieldData(
-                            submission_id= submission.id,
-                            field_id = value.field_id,
-                            value=value.value
-                )
-                db.add(fieldValue)
+                    db.add(fieldValue)
 
+            StatsStore.recordSubmissions(
+                db, submitData.form_id,
+                [[(value.field_id, value.value) for value in submitData.field_values]],
+                definition.fieldTypes
+            )
             db.commit()
             db.refresh(submission)
             return submission
@@ -194,27 +509,112 @@ class FormStore:
             )
         
     
+    @staticmethod
+    def createSubmissions(db: Session, formId: int, submissions: List[SubmissionCreate]) -> Dict[str, Any]:
+        """validate a batch against one field lookup, insert the valid ones in one transaction"""
+
+        try:
+            validator = getValidator(FormStore.getFormDefinition(db, formId))
+
+            items = []
+            accepted = []
+            for index, submitData in enumerate(submissions):
+                if submitData.form_id != formId:
+                    items.append({
+                        "index": index,
+                        "status": "rejected",
+                        "detail": f"form ID {submitData.form_id} does not match form ID {formId}"
+                    })
+                    continue
+
+                errors = validator.validate(submitData.field_values)
+                if errors:
+                    items.append({
+                        "index": index,
+                        "status": "rejected",
+                        "detail": "; ".join(errors)
+                    })
+                    continue
+
+                item = {"index": index, "status": "created"}
+                items.append(item)
+                accepted.append((item, submitData))
+
+            if accepted:
+                submissionIds = FormStore.insertSubmissions(db, formId, [submitData for _, submitData in accepted])
+                db.commit()
+                for (item, _), submissionId in zip(accepted, submissionIds):
+                    item["id"] = submissionId
+
+            return {
+                "created": len(accepted),
+                "rejected": len(items) - len(accepted),
+                "items": items
+            }
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error creating submission batch for form ID {formId}: {str(e)}")
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to create submission batch: {str(e)}"
+            )
+
+    @staticmethod
+    def insertSubmissions(db: Session, formId: int, submissions: List[SubmissionCreate],
+                          submissionIds: Optional[List[int]] = None) -> List[int]:
+        """multi-row insert of already validated submissions, caller owns the commit
+
+        submissionIds are used as given when they were reserved ahead of the insert
+        """
+
+        definition = FormStore.getFormDefinition(db, formId)
+        fieldTypes = definition.fieldTypes
+        documentMode = definition.form.storage_mode == "document"
+        headers = []
+        for submitData in submissions:
+            document = buildDocument(submitData.field_values) if documentMode else None
+            headers.append({"form_id": formId, "document": document, "projection": projectDocument(document, fieldTypes)})
+
+        if submissionIds is None:
+            submissionIds = db.execute(
+                insert(Submission).returning(Submission.id, sort_by_parameter_order=True), headers
+            ).scalars().all()
+        else:
+            db.execute(
+                insert(Submission),
+                [dict(header, id=submissionId) for header, submissionId in zip(headers, submissionIds)]
+            )
+
+        fieldRows = [] if documentMode else [
+            {
+                "submission_id": submissionId, "field_id": value.field_id, "value": value.value,
+                "value_number": None, "value_text": None, "value_bool": None, "value_time": None,
+                **projectValue(fieldTypes.get(value.field_id), value.value)
+            }
+            for submissionId, submitData in zip(submissionIds, submissions)
+            for value in submitData.field_values
+        ]
+        if fieldRows:
+            db.execute(insert(FieldData), fieldRows)
+
+        StatsStore.recordSubmissions(
+            db, formId,
+            [[(value.field_id, value.value) for value in submitData.field_values] for submitData in submissions],
+            fieldTypes
+        )
+        return list(submissionIds)
+
+
     @staticmethod
     def getFormFields(db: Session, formId: int) -> List[Field]:
         """get all fields in a form"""
 
         try:
-            form = db.query(Form).options(
-                joinedload(Form.fields).joinedload(Field.refer_field)
-            ).filter(Form.id == formId).first()
-
-            if not form:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail=f"Form with ID {formId} not found"
-                )
-            
-            fieldsCollection = []
-            for field in form.fields:
-                fieldsCollection.append(field)
-                if field.refer_field:
-                    fieldsCollection.append(field.refer_field)
-            return fieldsCollection
+            form = FormStore.getForm(db, formId)
+            return list(form.fields) + form.reference_fields
         
         except HTTPException:
           
@@ -229,76 +629,289 @@ class FormStore:
     @staticmethod
     def getSubmissionValues(db: Session, formId: int, submitId: int) -> Dict[str, Any]:
         try:
-            logger.info(f"Getting submission values for form ID: {formId}, submission ID: {submitId}")
-            
-        
-            form = db.get(Form, formId)
-            if not form:
+            logger.info("Getting submission values for form ID: %s, submission ID: %s", formId, submitId)
+
+            details = FormStore._readSubmissionDetails(db, formId, [submitId])
+            if details:
+                return details[0]
+
+            # miss: one more lookup, only to tell a missing form from a missing submission
+            if not db.get(Form, formId):
                 raise HTTPException(
                     status_code=status.HTTP_404_NOT_FOUND,
                     detail=f"Form with ID {formId} not found"
                 )
+            definition = FormStore.getFormDefinition(db, formId)
+            archived = archiveStore.lookup(formId, [submitId], definition.fieldNames)
+            if archived:
+                return {**archived[submitId], "form_version": definition.version}
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Submission -> {submitId} for form ID {formId} not found"
+            )
+        
+        except HTTPException:
             
-            submission =  db.query(Submission).filter(
-                Submission.id == submitId,
-                Submission.form_id == formId
-            ).first()
+            raise
+        except Exception as e:
+            logger.error(f"Error retrieving submission values for submission ID={submitId}: {str(e)}")
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to retrieve submission values: {str(e)}"
+            )
 
-            if not submission:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail=f"Submission -> {submitId} for form ID {formId} not found"
+    @staticmethod
+    def _readSubmissionDetails(db: Session, formId: int, submissionIds: List[int]) -> List[Dict[str, Any]]:
+        """submission headers and their name -> value pairs in one joined statement, in the order of submissionIds
+
+        form_version rides along for the ETag of the detail route, response models drop it
+        """
+
+        if not submissionIds:
+            return []
+
+        # names come from the form's own field mapping, values of other fields keep field_<id>
+        statement = (
+            select(
+                Submission.id, Submission.created, Submission.updated, Submission.document, Form.version,
+                FieldData.field_id, FieldData.value, Field.name
+            )
+            .join(Form, Form.id == Submission.form_id)
+            .outerjoin(FieldData, FieldData.submission_id == Submission.id)
+            .outerjoin(form_field, and_(
+                form_field.c.form_id == Submission.form_id,
+                form_field.c.field_id == FieldData.field_id
+            ))
+            .outerjoin(Field, Field.id == form_field.c.field_id)
+            .where(Submission.id.in_(submissionIds), Submission.form_id == formId)
+        )
+
+        details: Dict[int, Dict[str, Any]] = {}
+        documents: Dict[int, Dict[str, Any]] = {}
+        for submissionId, created, updated, document, formVersion, fieldId, value, fieldName in db.execute(statement):
+            detail = details.get(submissionId)
+            if detail is None:
+                detail = details[submissionId] = {
+                    "id": submissionId,
+                    "form_id": formId,
+                    "created": created,
+                    "updated": updated,
+                    "form_version": formVersion,
+                    "values": {}
+                }
+                if document is not None:
+                    documents[submissionId] = document
+            if fieldId is not None:
+                detail["values"][fieldName or f"field_{fieldId}"] = value
+
+        if documents:
+            # document mode: names from the cached definition, document values win over leftover rows
+            fieldNames = FormStore.getFormDefinition(db, formId).fieldNames
+            for submissionId, document in documents.items():
+                FormStore._applyDocument(details[submissionId]["values"], document, fieldNames)
+
+        return [details[submissionId] for submissionId in submissionIds if submissionId in details]
+    
+
+    @staticmethod
+    def _applyDocument(values: Dict[str, Any], document: Dict[str, Any], fieldNames: Dict[int, str]) -> None:
+        for fieldId, value in documentValues(document):
+            values[fieldNames.get(fieldId, f"field_{fieldId}")] = value
+
+    @staticmethod
+    def listSubmissions(db: Session, formId: int, filters: List[str], cursor: Optional[str] = None, range: int = 100,
+                        ids: Optional[List[int]] = None) -> Dict[str, Any]:
+        """keyset page of a form's submissions matching every field:op:value filter, optionally only the given ids"""
+
+        try:
+            definition = FormStore.getFormDefinition(db, formId)
+            conditions = parseFilters(filters, definition.fieldNames, definition.fieldTypes)
+
+            query = select(Submission.id).where(Submission.form_id == formId)
+            documentMode = definition.form.storage_mode == "document"
+            for fieldId, condition, documentCondition in conditions:
+                # each filter is a semi-join served by the (field_id, value_*) index
+                rowMatch = Submission.id.in_(
+                    select(FieldData.submission_id).where(FieldData.field_id == fieldId, condition)
                 )
-            
-            
-            fieldValues = db.query(FieldData).filter(
-                FieldData.submission_id == submitId
-            ).all()
+                # document forms also match inside submission.document, rows not migrated yet still count
+                query = query.where(or_(documentCondition, rowMatch) if documentMode else rowMatch)
+            if ids:
+                query = query.where(Submission.id.in_(ids))
+            if cursor:
+                query = query.where(Submission.id > decodeCursor(cursor))
 
-            # Get all fields for the form
-            
-            formFields = db.query(Field).join(
-                form_field, Field.id == form_field.c.field_id
-            ).filter(
-                form_field.c.form_id == formId
-            ).all()
+            submissionIds = db.execute(query.order_by(Submission.id).limit(range + 1)).scalars().all()
+            nextCursor = None
+            if len(submissionIds) > range:
+                submissionIds = submissionIds[:range]
+                nextCursor = encodeCursor(submissionIds[-1])
 
-            fieldIdName = {field.id: field.name for field in formFields}
-            result = {
-                "id": submission.id,
-                "form_id": submission.form_id,
-                "created": submission.created,
-                "updated": submission.updated,
-                "values": {}
+            return {
+                "items": FormStore._readSubmissionDetails(db, formId, submissionIds),
+                "next_cursor": nextCursor
             }
-            
-            for value in fieldValues:
-                field_id = value.field_id
-                field_name = fieldIdName.get(field_id, f"field_{field_id}")
-                result["values"][field_name] = value.value
-            
-            return result
-        
+
         except HTTPException:
-            
             raise
         except Exception as e:
-            logger.error(f"Error retrieving submission values for submission ID={submitId}: {str(e)}")
+            logger.error(f"Error listing submissions for form ID {formId}: {str(e)}")
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail=f"Failed to retrieve submission values: {str(e)}"
+                detail=f"Failed to list submissions: {str(e)}"
             )
-    
 
     @staticmethod
-    def getForms(db: Session, start: int = 0, range: int = 100) -> List[Form]:
-        
+    def getFormStats(db: Session, formId: int, top: int = 5) -> Dict[str, Any]:
+        """per-field rollups of a form, read without touching field_data"""
+
+        definition = FormStore.getFormDefinition(db, formId)
+        fieldNames = {field.id: field.name for field in definition.referenceFields}
+        fieldNames.update(definition.fieldNames)
+        return StatsStore.getStats(db, formId, fieldNames, top)
+
+    @staticmethod
+    def rebuildFormStats(db: Session, formId: int) -> int:
+        """recompute a form's rollups from its stored submissions, in one transaction"""
+
         try:
-            logger.info(f"Getting forms with pagination: start={start}, range={range}")
-            
-            forms = db.query(Form).offset(start).limit(range).all()
-            return forms
-        
+            definition = FormStore.getFormDefinition(db, formId)
+            seen = StatsStore.rebuild(db, formId, definition.fieldTypes)
+            # archived submissions still count, their values come from the segment files
+            archived = 0
+            for chunk in FormStore._chunks(archiveStore.iterRawValues(formId), 1000):
+                # a crash between archiving a chunk and deleting its rows leaves them live, counted above
+                live = set(db.execute(
+                    select(Submission.id).where(Submission.id.in_([submissionId for submissionId, _ in chunk]))
+                ).scalars())
+                values = [pairs for submissionId, pairs in chunk if submissionId not in live]
+                StatsStore.recordSubmissions(db, formId, values, definition.fieldTypes)
+                archived += len(values)
+            seen += archived
+            db.commit()
+            logger.info("Rebuilt statistics for form ID %s from %s submissions", formId, seen)
+            return seen
+
+        except HTTPException:
+            raise
+        except Exception as e:
+            logger.error(f"Error rebuilding statistics for form ID {formId}: {str(e)}")
+            db.rollback()
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail=f"Failed to rebuild form statistics: {str(e)}"
+            )
+
+    @staticmethod
+    def _chunks(items: Iterator[Any], size: int) -> Iterator[List[Any]]:
+        chunk = []
+        for item in items:
+            chunk.append(item)
+            if len(chunk) >= size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    @staticmethod
+    def getFormFieldNames(db: Session, formId: int) -> Dict[int, str]:
+        """field id -> name from the form_field_relation mapping, in field id order"""
+
+        form = db.get(Form, formId)
+        if not form:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Form with ID {formId} not found"
+            )
+
+        rows = db.execute(
+            select(Field.id, Field.name)
+            .join(form_field, Field.id == form_field.c.field_id)
+            .where(form_field.c.form_id == formId)
+            .order_by(Field.id)
+        ).all()
+        return {fieldId: name for fieldId, name in rows}
+
+    @staticmethod
+    def iterSubmissionRows(db: Session, formId: int, fieldIdName: Dict[int, str], batchSize: int = 1000) -> Iterator[Dict[str, Any]]:
+        """stream every submission of a form pivoted to field names, archived ones included, in id order"""
+
+        rows = heapq.merge(
+            archiveStore.iterForm(formId, fieldIdName),
+            FormStore._iterLiveSubmissionRows(db, formId, fieldIdName, batchSize),
+            key=lambda row: row["id"]
+        )
+        # merge puts an archived row before a live one of the same id (a crash between archiving
+        # and deleting the chunk), the live row wins
+        previous = None
+        for row in rows:
+            if previous is not None and previous["id"] != row["id"]:
+                yield previous
+            previous = row
+        if previous is not None:
+            yield previous
+
+    @staticmethod
+    def _iterLiveSubmissionRows(db: Session, formId: int, fieldIdName: Dict[int, str], batchSize: int) -> Iterator[Dict[str, Any]]:
+
+        statement = (
+            select(
+                Submission.id, Submission.created, Submission.updated, Submission.document,
+                FieldData.field_id, FieldData.value
+            )
+            .outerjoin(FieldData, FieldData.submission_id == Submission.id)
+            .where(Submission.form_id == formId)
+            .order_by(Submission.id)
+            .execution_options(yield_per=batchSize)
+        )
+
+        current = None
+        currentDocument = None
+        for submissionId, created, updated, document, fieldId, value in db.execute(statement):
+            if current is None or current["id"] != submissionId:
+                if current is not None:
+                    if currentDocument is not None:
+                        FormStore._applyDocument(current["values"], currentDocument, fieldIdName)
+                    yield current
+                current = {
+                    "id": submissionId,
+                    "form_id": formId,
+                    "created": created,
+                    "updated": updated,
+                    "values": {}
+                }
+                currentDocument = document
+            if fieldId is not None:
+                current["values"][fieldIdName.get(fieldId, f"field_{fieldId}")] = value
+
+        if current is not None:
+            if currentDocument is not None:
+                FormStore._applyDocument(current["values"], currentDocument, fieldIdName)
+            yield current
+
+
+    @staticmethod
+    def getForms(db: Session, cursor: Optional[str] = None, range: int = 100) -> Dict[str, Any]:
+        """keyset page on form.id, fields and reference chains of the whole page come in one query each"""
+
+        try:
+            logger.info("Getting forms with pagination: cursor=%s, range=%s", cursor, range)
+
+            query = select(Form).options(selectinload(Form.fields)).order_by(Form.id).limit(range + 1)
+            if cursor:
+                query = query.where(Form.id > decodeCursor(cursor))
+
+            forms = db.execute(query).scalars().all()
+            nextCursor = None
+            if len(forms) > range:
+                forms = forms[:range]
+                nextCursor = encodeCursor(forms[-1].id)
+            FormStore._attachReferences(db, forms)
+
+            return {"items": forms, "next_cursor": nextCursor}
+
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error retrieving forms: {str(e)}")
             raise HTTPException(
@@ -309,7 +922,7 @@ class FormStore:
     @staticmethod
     def removeForm(db: Session, formId: int) -> bool:
         try:
-            logger.info(f"Removing form with ID: {formId}")
+            logger.info("Removing form with ID: %s", formId)
             form = db.query(Form).get(formId)
             
             if not form:
@@ -318,8 +931,11 @@ class FormStore:
                     detail=f"Form  id{formId} not found"
                 )
             
+            StatsStore.clear(db, formId)
             db.delete(form)
             db.commit()
+            formCache.remove(formId)
+            archiveStore.drop(formId)
             
             return True
         
@@ -1,11 +1,17 @@
+import asyncio
+import os
+import traceback
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
 
 from app.db.database import createDbSchema, shutdownDatabase
+from app.db.ingest import submissionQueue, ingestEnabled
+from app.db.replicas import StickyWritesMiddleware
 
-from app.router import forms
+from app.router import forms, formsAsync, internal
 from fastapi.middleware.cors import CORSMiddleware
 from app.utils.logger import getLogger
+from app.utils.metrics import MetricsMiddleware, installSqlHooks
 
 
 
@@ -14,12 +20,15 @@ logger = getLogger()
 @asynccontextmanager
 async def lifespanPlan(app: FastAPI):
     try:
-        # Startup: Create database schema if not present
+        # Startup: apply pending migrations, a single version lookup when there are none
 
-        logger.info("app starting up - creating database schema...")
+        logger.info("app starting up - checking database schema...")
         await createDbSchema()
+        if ingestEnabled:
+            submissionQueue.start()
         yield
-        # Shutdown: Close database connections, byebye
+        # Shutdown: drain queued submissions, then close database connections, byebye
+        await asyncio.to_thread(submissionQueue.stop)
         await shutdownDatabase()
         logger.info("Application shutdown completed")
     except Exception as e:
@@ -38,8 +47,17 @@ app.add_middleware(
     allow_methods=["*"],  
     allow_headers=["*"],  
 )
+app.add_middleware(StickyWritesMiddleware)
+# outermost, so latency covers CORS handling and the route is known once the router has matched
+app.add_middleware(MetricsMiddleware)
+installSqlHooks()
 
+if os.getenv("DB_ASYNC_ROUTES", "").lower() in ("1", "true", "yes"):
+    # async twins first so they win the match, the sync router serves the rest
+    app.include_router(formsAsync.router, tags=["Form operations"])
 app.include_router(forms.router, tags=["Form operations"])
+app.include_router(internal.router, tags=["Internal"])
+app.include_router(internal.metricsRouter, tags=["Internal"])
 
 @app.get("/")
 def read_root():
@@ -1,18 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query, Path
-from typing import List, Dict, Any
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status, Query, Path
+from fastapi.responses import StreamingResponse
+from typing import List, Dict, Any, Iterator, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy.ext.asyncio import AsyncSession
 from app.db.database import getDb
+from app.db.replicas import getReadDb
 from app.db.store import FormStore
+from app.db.ingest import submissionQueue
 from app.schemas import (
-    FormCreate, FormUpdate, FormInDB,
-    SubmissionCreate, SubmissionInDB, SubmissionDetail
+    FormCreate, FormUpdate, FormInDB, FormPage, FormBatch, FormImportBatch, FormImportResult,
+    SubmissionCreate, SubmissionInDB, SubmissionDetail, SubmissionPage,
+    SubmissionBatchCreate, SubmissionBatchResult, SubmissionAccepted, FormStatsOut
 )
+from app.utils.etag import etagMatches, formETag, notModified, submissionETag
+from app.utils.export import encodeNdjson, encodeCsv
 from app.utils.logger import getLogger
 
 logger = getLogger()
 router = APIRouter()
 
+FORM_BATCH_LIMIT = 100
+
 
 @router.post("/forms", response_model=FormInDB, status_code=status.HTTP_201_CREATED)
 def createForm(
@@ -24,6 +31,8 @@ def createForm(
         formCreated = FormStore.createForm(db, formData)
         return formCreated
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"API crud: error in createForm: {str(e)}")
         raise HTTPException(
@@ -32,18 +41,85 @@ def createForm(
         )
 
 
+@router.post("/forms/import", response_model=FormImportResult, status_code=status.HTTP_201_CREATED)
+def importForms(
+    importData: FormImportBatch,
+    db: Session = Depends(getDb)
+):
+    """
+    Create many forms in one transaction; fields may refer to each other through symbolic keys
+    """
+    try:
+        return FormStore.importForms(db, importData.forms)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"API: Unexpected error in importForms: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An unexpected error occurred while importing forms: {str(e)}"
+        )
+
+
+# before /forms/{formId}, which would otherwise match "batch" and reject it as an id
+@router.get("/forms/batch", response_model=FormBatch)
+def getFormsBatch(
+    ids: str = Query(..., description="comma separated form ids"),
+    db: Session = Depends(getReadDb)
+):
+    """
+    Get many forms by id in one call, keyed by id, unknown ids listed in not_found
+    """
+    try:
+        try:
+            # duplicates collapse, first occurrence keeps its place
+            formIds = list(dict.fromkeys(int(formId) for formId in ids.split(",") if formId.strip()))
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="ids must be comma separated integers"
+            )
+        if len(formIds) > FORM_BATCH_LIMIT:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"at most {FORM_BATCH_LIMIT} ids per request"
+            )
+
+        return FormStore.getFormsByIds(db, formIds)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"API: Unexpected error in getFormsBatch: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An unexpected error occurred while retrieving forms: {str(e)}"
+        )
+
+
 @router.get("/forms/{formId}", response_model=FormInDB)
 def getForm(
+    response: Response,
     formId: int = Path(..., gt=0),
-    db: AsyncSession = Depends(getDb)
+    ifNoneMatch: Optional[str] = Header(None, alias="If-None-Match"),
+    db: Session = Depends(getReadDb)
 ):
     """
-    Get form details by ID
+    Get form details by ID, 304 when If-None-Match holds the current ETag
     """
     try:
-        form = FormStore.getForm(db, formId)
+        if ifNoneMatch:
+            version = FormStore.getFormVersion(db, formId)
+            if version is not None and etagMatches(ifNoneMatch, formETag(formId, version)):
+                return notModified(formETag(formId, version))
+
+        form = FormStore.getFormDefinition(db, formId).form
+        response.headers["ETag"] = formETag(formId, form.version)
         return form
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"API: Unexpected error in getForm: {str(e)}")
         raise HTTPException(
@@ -55,7 +131,7 @@ def getForm(
 def updateForm(
     formData: FormUpdate,
     formId: int = Path(..., gt=0),
-    db: AsyncSession = Depends(getDb)
+    db: Session = Depends(getDb)
 ):
     """
     Update form and its fields
@@ -65,6 +141,8 @@ def updateForm(
         formUpdated = FormStore.updateForm(db, formId, formData)
         return formUpdated
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"API: Unexpected error in updateForm: {str(e)}")
         raise HTTPException(
@@ -78,7 +156,7 @@ def updateForm(
 def createSubmission(
     submissionData: SubmissionCreate,
     formId: int = Path(..., gt=0),
-    db: AsyncSession = Depends(getDb)
+    db: Session = Depends(getDb)
 ):
     """
     Create a new submission for a form
@@ -92,6 +170,8 @@ def createSubmission(
         
         return FormStore.createSubmission(db, submissionData)
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"API: Unexpected error in createSubmission: {str(e)}")
         raise HTTPException(
@@ -100,19 +180,162 @@ def createSubmission(
         )
 
 
+@router.post("/forms/{formId}/submissions/async", response_model=SubmissionAccepted, status_code=status.HTTP_202_ACCEPTED)
+def enqueueSubmission(
+    submissionData: SubmissionCreate,
+    formId: int = Path(..., gt=0),
+    db: Session = Depends(getDb)
+):
+    """
+    Validate a submission and queue it for a group commit, 503 when the queue is off or full
+    """
+    try:
+        if submissionData.form_id != formId:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Form ID in the path must match the one in the request body"
+            )
+
+        submissionId = submissionQueue.submit(db, formId, submissionData)
+        return {"id": submissionId, "form_id": formId}
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"API: Unexpected error in enqueueSubmission: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An unexpected error occurred while queueing submission: {str(e)}"
+        )
+
+
+@router.post("/forms/{formId}/submissions/batch", response_model=SubmissionBatchResult, status_code=status.HTTP_201_CREATED)
+def createSubmissions(
+    batchData: SubmissionBatchCreate,
+    formId: int = Path(..., gt=0),
+    db: Session = Depends(getDb)
+):
+    """
+    Create many submissions for a form in one transaction, with per-item results
+    """
+    try:
+        return FormStore.createSubmissions(db, formId, batchData.submissions)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"API: Unexpected error in createSubmissions: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An unexpected error occurred while creating submissions: {str(e)}"
+        )
+
+
+@router.get("/forms/{formId}/submissions", response_model=SubmissionPage)
+def listSubmissions(
+    formId: int = Path(..., gt=0),
+    filter: List[str] = Query([], description="field:op:value, op one of eq ne gt gte lt lte; repeat to AND"),
+    ids: Optional[str] = Query(None, description="comma separated submission ids to hydrate"),
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(getReadDb)
+):
+    """
+    List a form's submissions, optionally filtered by field values or restricted to ids
+    """
+    try:
+        submissionIds = None
+        if ids:
+            try:
+                submissionIds = [int(submissionId) for submissionId in ids.split(",") if submissionId.strip()]
+            except ValueError:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail="ids must be comma separated integers"
+                )
+            if len(submissionIds) > limit:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"at most {limit} ids per request"
+                )
+
+        return FormStore.listSubmissions(db, formId, filter, cursor, limit, submissionIds)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"API: Unexpected error in listSubmissions: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An unexpected error occurred while listing submissions: {str(e)}"
+        )
+
+
+@router.get("/forms/{formId}/submissions/export")
+def exportSubmissions(
+    formId: int = Path(..., gt=0),
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    db: Session = Depends(getReadDb)
+):
+    """
+    Stream every submission of a form as NDJSON or CSV
+    """
+    try:
+        fieldIdName = FormStore.getFormFieldNames(db, formId)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"API: Unexpected error in exportSubmissions: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An unexpected error occurred while exporting submissions: {str(e)}"
+        )
+
+    def rows() -> Iterator[Dict[str, Any]]:
+        # the response outlives the request scoped session, so the stream closes it itself
+        try:
+            yield from FormStore.iterSubmissionRows(db, formId, fieldIdName)
+        finally:
+            db.close()
+
+    if format == "csv":
+        return StreamingResponse(
+            encodeCsv(rows(), list(fieldIdName.values())),
+            media_type="text/csv",
+            headers={"Content-Disposition": f"attachment; filename=form_{formId}_submissions.csv"}
+        )
+    return StreamingResponse(encodeNdjson(rows()), media_type="application/x-ndjson")
+
+
 @router.get("/forms/{formId}/submissions/{submissionId}", response_model=SubmissionDetail)
 def getSubmissions(
+    response: Response,
     formId: int = Path(..., gt=0),
     submissionId: int = Path(..., gt=0),
-    db: AsyncSession = Depends(getDb)
+    ifNoneMatch: Optional[str] = Header(None, alias="If-None-Match"),
+    db: Session = Depends(getReadDb)
 ):
     """
-    Get submission details by sub ID
+    Get submission details by sub ID, 304 when If-None-Match holds the current ETag
     """
     try:
+        if ifNoneMatch:
+            stamp = FormStore.getSubmissionStamp(db, formId, submissionId)
+            version = FormStore.getFormVersion(db, formId) if stamp else None
+            if version is not None:
+                etag = submissionETag(submissionId, *stamp, version)
+                if etagMatches(ifNoneMatch, etag):
+                    return notModified(etag)
+
         submission = FormStore.getSubmissionValues(db, formId, submissionId)
+        response.headers["ETag"] = submissionETag(
+            submissionId, submission["created"], submission["updated"], submission["form_version"]
+        )
         return submission
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"API: Unexpected error in getSubmission: {str(e)}")
         raise HTTPException(
@@ -121,21 +344,22 @@ def getSubmissions(
         )
 
 
-@router.get("/forms", response_model=List[FormInDB])
+@router.get("/forms", response_model=FormPage)
 def getForms(
-    skip: int = Query(0, ge=0),
+    cursor: Optional[str] = Query(None),
     limit: int = Query(100, ge=1, le=1000),
-    db: AsyncSession = Depends(getDb)
+    db: Session = Depends(getReadDb)
 ):
     """
-    get forms with pagination
+    get forms with keyset pagination, follow next_cursor for the next page
     """
 
 
     try:
-        forms = FormStore.getForms(db, skip, limit)
-        return forms
+        return FormStore.getForms(db, cursor, limit)
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"API getforms: Unexpected error in getForms: {str(e)}")
         raise HTTPException(
@@ -145,17 +369,41 @@ def getForms(
 
 
 
+@router.get("/forms/{formId}/stats", response_model=FormStatsOut)
+def getFormStats(
+    formId: int = Path(..., gt=0),
+    top: int = Query(5, ge=0, le=100),
+    db: Session = Depends(getReadDb)
+):
+    """
+    Fill rate, distinct counts, numeric min/max/mean and top values per field
+    """
+    try:
+        return FormStore.getFormStats(db, formId, top)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"API: Unexpected error in getFormStats: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An unexpected error occurred while reading form statistics: {str(e)}"
+        )
+
+
 @router.delete("/forms/{formId}", status_code=status.HTTP_204_NO_CONTENT)
 def deleteForm(
     formId: int = Path(..., gt=0),
-    db: AsyncSession = Depends(getDb)
+    db: Session = Depends(getDb)
 ):
     try:
         FormStore.removeForm(db, formId)
 
-        logger.info(f"API: Form deleted successfully: ID={formId}")
+        logger.info("API: Form deleted successfully: ID=%s", formId)
         return None
     
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"API: Unexpected error in deleteForm: {str(e)}")
         raise HTTPException(
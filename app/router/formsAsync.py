@@ -0,0 +1,217 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status, Query, Path
+from typing import Optional
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.db.database import getAsyncDb
+from app.db.asyncStore import AsyncFormStore
+from app.schemas import (
+    FormCreate, FormUpdate, FormInDB, FormPage,
+    SubmissionCreate, SubmissionInDB, SubmissionDetail,
+    SubmissionBatchCreate, SubmissionBatchResult
+)
+from app.utils.etag import etagMatches, formETag, notModified, submissionETag
+from app.utils.logger import getLogger
+
+logger = getLogger()
+router = APIRouter()
+
+# async twins of the routes in app.router.forms, mounted ahead of them when
+# DB_ASYNC_ROUTES is set; routes without a twin keep being served by the sync router
+
+
+@router.post("/forms", response_model=FormInDB, status_code=status.HTTP_201_CREATED)
+async def createFormAsync(
+    formData: FormCreate,
+    db: AsyncSession = Depends(getAsyncDb)
+):
+    try:
+        return await AsyncFormStore.createForm(db, formData)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"API async: error in createForm: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"unexpected error occurred while creating form: {str(e)}"
+        )
+
+
+@router.get("/forms/{formId:int}", response_model=FormInDB)
+async def getFormAsync(
+    response: Response,
+    formId: int = Path(..., gt=0),
+    ifNoneMatch: Optional[str] = Header(None, alias="If-None-Match"),
+    db: AsyncSession = Depends(getAsyncDb)
+):
+    """
+    Get form details by ID, 304 when If-None-Match holds the current ETag
+    """
+    try:
+        if ifNoneMatch:
+            version = await AsyncFormStore.getFormVersion(db, formId)
+            if version is not None and etagMatches(ifNoneMatch, formETag(formId, version)):
+                return notModified(formETag(formId, version))
+
+        form = await AsyncFormStore.getForm(db, formId)
+        response.headers["ETag"] = formETag(formId, form.version)
+        return form
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"API async: Unexpected error in getForm: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An unexpected error occurred while retrieving form: {str(e)}"
+        )
+
+
+@router.put("/forms/{formId:int}", response_model=FormInDB)
+async def updateFormAsync(
+    formData: FormUpdate,
+    formId: int = Path(..., gt=0),
+    db: AsyncSession = Depends(getAsyncDb)
+):
+    """
+    Update form and its fields
+    """
+    try:
+        return await AsyncFormStore.updateForm(db, formId, formData)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"API async: Unexpected error in updateForm: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An unexpected error occurred while updating form: {str(e)}"
+        )
+
+
+@router.post("/forms/{formId:int}/submissions", response_model=SubmissionInDB, status_code=status.HTTP_201_CREATED)
+async def createSubmissionAsync(
+    submissionData: SubmissionCreate,
+    formId: int = Path(..., gt=0),
+    db: AsyncSession = Depends(getAsyncDb)
+):
+    """
+    Create a new submission for a form
+    """
+    try:
+        if submissionData.form_id != formId:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Form ID in the path must match the one in the request body"
+            )
+
+        return await AsyncFormStore.createSubmission(db, submissionData)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"API async: Unexpected error in createSubmission: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An unexpected error occurred while creating submission: {str(e)}"
+        )
+
+
+@router.post("/forms/{formId:int}/submissions/batch", response_model=SubmissionBatchResult, status_code=status.HTTP_201_CREATED)
+async def createSubmissionsAsync(
+    batchData: SubmissionBatchCreate,
+    formId: int = Path(..., gt=0),
+    db: AsyncSession = Depends(getAsyncDb)
+):
+    """
+    Create many submissions for a form in one transaction, with per-item results
+    """
+    try:
+        return await AsyncFormStore.createSubmissions(db, formId, batchData.submissions)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"API async: Unexpected error in createSubmissions: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An unexpected error occurred while creating submissions: {str(e)}"
+        )
+
+
+@router.get("/forms/{formId:int}/submissions/{submissionId:int}", response_model=SubmissionDetail)
+async def getSubmissionsAsync(
+    response: Response,
+    formId: int = Path(..., gt=0),
+    submissionId: int = Path(..., gt=0),
+    ifNoneMatch: Optional[str] = Header(None, alias="If-None-Match"),
+    db: AsyncSession = Depends(getAsyncDb)
+):
+    """
+    Get submission details by sub ID, 304 when If-None-Match holds the current ETag
+    """
+    try:
+        if ifNoneMatch:
+            stamp = await AsyncFormStore.getSubmissionStamp(db, formId, submissionId)
+            version = await AsyncFormStore.getFormVersion(db, formId) if stamp else None
+            if version is not None:
+                etag = submissionETag(submissionId, *stamp, version)
+                if etagMatches(ifNoneMatch, etag):
+                    return notModified(etag)
+
+        submission = await AsyncFormStore.getSubmissionValues(db, formId, submissionId)
+        response.headers["ETag"] = submissionETag(
+            submissionId, submission["created"], submission["updated"], submission["form_version"]
+        )
+        return submission
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"API async: Unexpected error in getSubmission: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An unexpected error occurred while retrieving submission: {str(e)}"
+        )
+
+
+@router.get("/forms", response_model=FormPage)
+async def getFormsAsync(
+    cursor: Optional[str] = Query(None),
+    limit: int = Query(100, ge=1, le=1000),
+    db: AsyncSession = Depends(getAsyncDb)
+):
+    """
+    get forms with keyset pagination, follow next_cursor for the next page
+    """
+    try:
+        return await AsyncFormStore.getForms(db, cursor, limit)
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"API async getforms: Unexpected error in getForms: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"error occurred while retrieving forms: {str(e)}"
+        )
+
+
+@router.delete("/forms/{formId:int}", status_code=status.HTTP_204_NO_CONTENT)
+async def deleteFormAsync(
+    formId: int = Path(..., gt=0),
+    db: AsyncSession = Depends(getAsyncDb)
+):
+    try:
+        await AsyncFormStore.removeForm(db, formId)
+
+        logger.info("API async: Form deleted successfully: ID=%s", formId)
+        return None
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"API async: Unexpected error in deleteForm: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"An unexpected error occurred while deleting form: {str(e)}"
+        )
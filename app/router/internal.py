@@ -0,0 +1,61 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from typing import Dict, Any
+from app.db.cache import formCache
+from app.db.database import poolStatus
+from app.db.ingest import submissionQueue
+from app.db.replicas import replicaRouter
+from app.utils.metrics import renderGauges, renderMetrics
+from app.validators import validatorCache
+
+
+router = APIRouter(prefix="/internal")
+metricsRouter = APIRouter()
+
+
+@router.get("/cache")
+def cacheStats() -> Dict[str, Any]:
+    """
+    hit/miss/eviction counters of the process local caches
+    """
+    return {"forms": formCache.stats(), "validators": validatorCache.stats()}
+
+
+@router.get("/pool")
+def poolStats() -> Dict[str, Any]:
+    """
+    connection pool occupancy, checkout wait time and timeouts
+    """
+    return poolStatus()
+
+
+@router.get("/replicas")
+def replicaStats() -> Dict[str, Any]:
+    """
+    reads served by replicas vs the primary, replica failures and last measured lag
+    """
+    return replicaRouter.stats()
+
+
+@router.get("/ingest")
+def ingestStats() -> Dict[str, Any]:
+    """
+    write-behind queue depth, flush latency and backpressure counters
+    """
+    return submissionQueue.stats()
+
+
+@metricsRouter.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> str:
+    """
+    prometheus text exposition: request latency and SQL cost per route, plus cache/pool/ingest gauges
+    """
+    ingest = submissionQueue.stats()
+    ingest["running"] = int(ingest["running"])
+    return renderMetrics(
+        renderGauges("forms_cache", formCache.stats(), "form definition cache")
+        + renderGauges("validator_cache", validatorCache.stats(), "submission validator cache")
+        + renderGauges("db_pool", poolStatus(), "connection pool")
+        + renderGauges("db_replicas", replicaRouter.stats(), "read replica routing")
+        + renderGauges("ingest_queue", ingest, "write-behind submission queue")
+    )
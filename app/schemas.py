@@ -1,5 +1,5 @@
 from datetime import datetime
-from typing import List, Optional, Any, Dict, Union
+from typing import List, Optional, Any, Dict, Literal, Union
 from pydantic import BaseModel, Field, ConfigDict
 
 
@@ -37,6 +37,9 @@ class FieldInDB(FieldBase):
 # Form schema----------------------------------
 class FormBase(BaseModel):
     name: str
+    retention_days: Optional[int] = Field(None, ge=1)
+    # "document" keeps all values of a submission in one JSON column instead of a row per field
+    storage_mode: Literal["rows", "document"] = "rows"
 
 
 class FormCreate(FormBase):
@@ -47,6 +50,9 @@ class FormCreate(FormBase):
 class FormUpdate(BaseModel):
     
     name: Optional[str] = None
+    # 0 turns retention off
+    retention_days: Optional[int] = Field(None, ge=0)
+    storage_mode: Optional[Literal["rows", "document"]] = None
     fields_add: List[FieldCreate] = []
     fields_remove: List[int] = []
     fields_update: Dict[int, FieldUpdate] = {}
@@ -55,13 +61,57 @@ class FormUpdate(BaseModel):
 class FormInDB(FormBase):
     """Form values in database"""
     id: int
+    version: int = 1
     created: datetime
     updated: Optional[datetime] = None
     fields: List[FieldInDB] = []
+    # every field reached through refer_field_id chains, at any depth
+    reference_fields: List[FieldInDB] = []
 
     model_config = ConfigDict(from_attributes=True)
 
 
+class FormPage(BaseModel):
+    """One keyset page of forms, pass next_cursor back to continue"""
+    items: List[FormInDB]
+    next_cursor: Optional[str] = None
+
+
+class FormBatch(BaseModel):
+    """Forms fetched by id list, keyed by id; requested ids without a form are in not_found"""
+    forms: Dict[int, FormInDB]
+    not_found: List[int] = []
+
+
+# Bulk import schemas----------------------------
+class FieldImport(FieldCreate):
+    """A field of an imported form, optionally keyed so others in the batch can refer to it"""
+    key: Optional[str] = None
+    # key of another field in the same import, instead of an existing refer_field_id
+    refer_to: Optional[str] = None
+
+
+class FormImport(FormBase):
+
+    key: Optional[str] = None
+    fields: List[FieldImport] = []
+
+
+class FormImportBatch(BaseModel):
+    """Many form definitions created in one transaction"""
+    forms: List[FormImport] = Field(..., min_length=1, max_length=10000)
+
+
+class FormImportResult(BaseModel):
+
+    created: int
+    # form ids in the order of the request
+    form_ids: List[int]
+    # symbolic key -> id, for every keyed form and field
+    form_keys: Dict[str, int] = {}
+    field_keys: Dict[str, int] = {}
+
+
 # Field Value relationship schemas
 class FieldDataBase(BaseModel):
     """Base schema for FieldValue"""
@@ -123,4 +173,64 @@ class SubmissionDetail(BaseModel):
     updated: Optional[datetime] = None
     values: Dict[str, Any]
 
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+
+class SubmissionPage(BaseModel):
+    """One keyset page of submissions, pass next_cursor back to continue"""
+    items: List[SubmissionDetail]
+    next_cursor: Optional[str] = None
+
+# Batch submission schemas-----------------------
+class SubmissionBatchCreate(BaseModel):
+    """Many submissions for one form, ingested in a single transaction"""
+    submissions: List[SubmissionCreate] = Field(..., min_length=1, max_length=10000)
+
+
+class SubmissionBatchItem(BaseModel):
+    """Outcome of one submission in a batch, by position in the request"""
+    index: int
+    status: str
+    id: Optional[int] = None
+    detail: Optional[str] = None
+
+
+class SubmissionAccepted(BaseModel):
+    """Submission validated and queued, written by the ingest worker shortly after"""
+    id: int
+    form_id: int
+    status: str = "queued"
+
+
+class SubmissionBatchResult(BaseModel):
+
+    created: int
+    rejected: int
+    items: List[SubmissionBatchItem]
+
+
+
+# Statistics schemas-----------------------
+class ValueCount(BaseModel):
+    value: str
+    count: int
+
+
+class FieldStatsOut(BaseModel):
+    """Rollup of one field across all submissions of a form"""
+    field_id: int
+    name: str
+    filled_count: int
+    fill_rate: float
+    distinct_count: int
+    numeric_min: Optional[float] = None
+    numeric_max: Optional[float] = None
+    numeric_mean: Optional[float] = None
+    top_values: List[ValueCount] = []
+
+
+class FormStatsOut(BaseModel):
+
+    form_id: int
+    submission_count: int
+    fields: List[FieldStatsOut]
@@ -0,0 +1,22 @@
+import base64
+import json
+from fastapi import HTTPException, status
+
+
+def encodeCursor(lastId: int) -> str:
+    """opaque keyset cursor, clients only ever pass it back"""
+    return base64.urlsafe_b64encode(json.dumps({"id": lastId}).encode()).decode().rstrip("=")
+
+
+def decodeCursor(cursor: str) -> int:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        lastId = json.loads(base64.urlsafe_b64decode(padded.encode()))["id"]
+        if not isinstance(lastId, int):
+            raise ValueError("cursor id is not an integer")
+        return lastId
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="invalid pagination cursor"
+        )
@@ -0,0 +1,27 @@
+from datetime import datetime
+from typing import Optional
+from fastapi import Response, status
+
+
+def formETag(formId: int, version: int) -> str:
+    """strong validator of a FormInDB: every definition change, including referenced fields, bumps version"""
+    return f'"form-{formId}-v{version}"'
+
+
+def submissionETag(submissionId: int, created: datetime, updated: Optional[datetime], formVersion: int) -> str:
+    """values change with updated, their names with the form version"""
+    stamp = updated or created
+    return f'"submission-{submissionId}-v{formVersion}-{stamp:%Y%m%d%H%M%S%f}"'
+
+
+def etagMatches(ifNoneMatch: Optional[str], etag: str) -> bool:
+    """If-None-Match uses the weak comparison: W/ prefixes are ignored, * matches anything"""
+
+    if not ifNoneMatch:
+        return False
+    candidates = [candidate.strip() for candidate in ifNoneMatch.split(",")]
+    return "*" in candidates or any(candidate.removeprefix("W/") == etag for candidate in candidates)
+
+
+def notModified(etag: str) -> Response:
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
@@ -0,0 +1,56 @@
+import csv
+import io
+import json
+from typing import Any, Dict, Iterable, Iterator, List
+
+
+def _jsonDefault(value: Any) -> str:
+    # datetimes from the submission header
+    return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+
+def _csvCell(value: Any) -> Any:
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list, bool)):
+        return json.dumps(value, default=_jsonDefault)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return value
+
+
+def encodeNdjson(rows: Iterable[Dict[str, Any]], chunkRows: int = 500) -> Iterator[str]:
+    """one JSON document per line, yielded in chunks of rows"""
+
+    chunk = []
+    for row in rows:
+        chunk.append(json.dumps(row, default=_jsonDefault))
+        if len(chunk) >= chunkRows:
+            yield "\n".join(chunk) + "\n"
+            chunk = []
+    if chunk:
+        yield "\n".join(chunk) + "\n"
+
+
+def encodeCsv(rows: Iterable[Dict[str, Any]], fieldNames: List[str], chunkRows: int = 500) -> Iterator[str]:
+    """header plus one line per submission, field values pivoted into named columns"""
+
+    columns = ["id", "form_id", "created", "updated"] + list(dict.fromkeys(fieldNames))
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+
+    written = 0
+    for row in rows:
+        values = row["values"]
+        writer.writerow(
+            [_csvCell(row[column]) for column in columns[:4]]
+            + [_csvCell(values.get(column)) for column in columns[4:]]
+        )
+        written += 1
+        if written % chunkRows == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+
+    yield buffer.getvalue()
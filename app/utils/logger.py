@@ -1,13 +1,85 @@
+import atexit
+import copy
+import json
 import logging
 import os
-from logging.handlers import RotatingFileHandler
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Dict
 
 
 os.makedirs("logs", exist_ok=True)
 
 
 logger = logging.getLogger("forms_service")
-logger.setLevel(logging.INFO)
+logger.setLevel(os.getenv("LOG_LEVEL", "INFO").upper())
+
+# attributes every LogRecord has, anything else came in through extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "taskName"}
+
+
+class JsonFormatter(logging.Formatter):
+    """ one JSON object per record, extra={...} fields included as keys """
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                payload[key] = value
+        if record.exc_info:
+            payload["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exception"] = record.exc_text
+        return json.dumps(payload, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """ keeps a fraction of records per level, e.g. {logging.INFO: 0.1}; unlisted levels pass """
+
+    def __init__(self, rates: Dict[int, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.levelno, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+class DeferredQueueHandler(QueueHandler):
+    """ interpolates the message and traceback on the calling thread, like QueueHandler, but leaves
+    the record's extra fields in place for JsonFormatter; file/console output happens on the listener
+
+    args are rendered here because they may be mutated, or be ORM instances whose lazy loads must
+    not run on another thread's session, by the time the listener gets to the record
+    """
+
+    _exceptionFormatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = self._exceptionFormatter.formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+def parseSampleRates(spec: str) -> Dict[int, float]:
+    """'INFO=0.1,DEBUG=0.01' -> {20: 0.1, 10: 0.01}"""
+
+    rates = {}
+    for part in filter(None, (item.strip() for item in spec.split(","))):
+        level, _, rate = part.partition("=")
+        rates[logging.getLevelName(level.strip().upper())] = float(rate)
+    return rates
 
 
 consoleHandler = logging.StreamHandler()
@@ -15,22 +87,37 @@ consoleHandler.setLevel(logging.INFO)
 
 
 fileHandler = RotatingFileHandler(
-    "logs/forms_service.log", 
+    "logs/forms_service.log",
     maxBytes=10485760,  # file size abhi 10 MB, loggfile change hoti rahe
     backupCount=5
 )
 fileHandler.setLevel(logging.INFO)
 
 # Create formatter
-formatter = logging.Formatter(
-    "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
-)
+if os.getenv("LOG_FORMAT", "text").lower() == "json":
+    formatter = JsonFormatter()
+else:
+    formatter = logging.Formatter(
+        "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    )
 consoleHandler.setFormatter(formatter)
 fileHandler.setFormatter(formatter)
 
+sampler = SamplingFilter(parseSampleRates(os.getenv("LOG_SAMPLE_RATES", "")))
+
 
-logger.addHandler(consoleHandler)
-logger.addHandler(fileHandler)
+if os.getenv("LOG_ASYNC", "true").lower() in ("1", "true", "yes"):
+    # request threads only enqueue, console and file I/O run on the listener thread
+    queueHandler = DeferredQueueHandler(queue.SimpleQueue())
+    queueHandler.addFilter(sampler)
+    listener = QueueListener(queueHandler.queue, consoleHandler, fileHandler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    logger.addHandler(queueHandler)
+else:
+    logger.addFilter(sampler)
+    logger.addHandler(consoleHandler)
+    logger.addHandler(fileHandler)
 
 def getLogger():
-    return logger
\ No newline at end of file
+    return logger
@@ -0,0 +1,180 @@
+import contextvars
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200)
+ROW_BUCKETS = (1, 10, 100, 1000, 10000, 100000)
+
+serverTimingEnabled = os.getenv("METRICS_SERVER_TIMING", "").lower() in ("1", "true", "yes")
+
+
+class Histogram:
+    """ prometheus style cumulative histogram, one series per label tuple """
+
+    def __init__(self, name: str, help: str, labelNames: Tuple[str, ...], buckets: Tuple[float, ...]):
+        self.name = name
+        self.help = help
+        self.labelNames = labelNames
+        self.buckets = buckets
+        self._series: Dict[Tuple[str, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels: Tuple[str, ...], value: float) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # per-bucket counts (last slot is +Inf), sum, count
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            snapshot = [(labels, list(counts), total, count) for labels, (counts, total, count) in self._series.items()]
+        for labels, counts, total, count in sorted(snapshot):
+            base = _labelText(self.labelNames, labels)
+            cumulative = 0
+            for bound, bucketCount in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucketCount
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                lines.append(f"{self.name}_bucket{{{base}{',' if base else ''}le=\"{le}\"}} {cumulative}")
+            lines.append(f"{self.name}_sum{{{base}}} {total}")
+            lines.append(f"{self.name}_count{{{base}}} {count}")
+        return lines
+
+
+def _labelText(names: Iterable[str], values: Iterable[str]) -> str:
+    return ",".join(
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in zip(names, values)
+    )
+
+
+requestLatency = Histogram(
+    "http_request_duration_seconds", "Request latency by route and status",
+    ("method", "route", "status"), LATENCY_BUCKETS
+)
+requestStatements = Histogram(
+    "db_statements_per_request", "SQL statements executed per request",
+    ("method", "route"), STATEMENT_BUCKETS
+)
+requestDbTime = Histogram(
+    "db_seconds_per_request", "Time spent in SQL statements per request",
+    ("method", "route"), LATENCY_BUCKETS
+)
+requestRows = Histogram(
+    "db_rows_per_request", "Rows reported by the driver per request",
+    ("method", "route"), ROW_BUCKETS
+)
+
+
+class RequestSqlStats:
+    __slots__ = ("statements", "seconds", "rows")
+
+    def __init__(self):
+        self.statements = 0
+        self.seconds = 0.0
+        self.rows = 0
+
+
+# set per request by the middleware; threadpool routes run in a copy of the context,
+# and since the object is shared their statements land on the same counters
+currentSqlStats: contextvars.ContextVar[Optional[RequestSqlStats]] = contextvars.ContextVar("currentSqlStats", default=None)
+
+
+def _beforeCursorExecute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metricsQueryStart", []).append(time.perf_counter())
+
+
+def _afterCursorExecute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("metricsQueryStart")
+    if not started:
+        return
+    elapsed = time.perf_counter() - started.pop()
+    stats = currentSqlStats.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.seconds += elapsed
+        stats.rows += max(cursor.rowcount, 0)
+
+
+def installSqlHooks() -> None:
+    """count statements, DB time and rows of every engine, attributed to the current request"""
+
+    if not event.contains(Engine, "before_cursor_execute", _beforeCursorExecute):
+        event.listen(Engine, "before_cursor_execute", _beforeCursorExecute)
+        event.listen(Engine, "after_cursor_execute", _afterCursorExecute)
+
+
+class MetricsMiddleware:
+    """ pure ASGI middleware: latency per route template and status, SQL cost per request,
+    optional Server-Timing header """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestSqlStats()
+        token = currentSqlStats.set(stats)
+        start = time.perf_counter()
+        statusCode = 500
+
+        async def sendWithTiming(message):
+            nonlocal statusCode
+            if message["type"] == "http.response.start":
+                statusCode = message["status"]
+                if serverTimingEnabled:
+                    total = (time.perf_counter() - start) * 1000
+                    timing = f'db;dur={stats.seconds * 1000:.2f};desc="{stats.statements} statements", app;dur={total:.2f}'
+                    message["headers"] = list(message.get("headers", [])) + [(b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, sendWithTiming)
+        finally:
+            elapsed = time.perf_counter() - start
+            route = scope.get("route")
+            routeName = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            requestLatency.observe((method, routeName, str(statusCode)), elapsed)
+            requestStatements.observe((method, routeName), stats.statements)
+            requestDbTime.observe((method, routeName), stats.seconds)
+            requestRows.observe((method, routeName), stats.rows)
+            currentSqlStats.reset(token)
+
+
+def renderGauges(prefix: str, values: Dict[str, Any], help: str) -> List[str]:
+    """flat numeric dict -> one gauge per key, nested dicts become name segments"""
+
+    lines = []
+    for key, value in values.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            lines.extend(renderGauges(name, value, help))
+        elif isinstance(value, (int, float)):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {float(value)}")
+    return lines
+
+
+def renderMetrics(extraLines: Iterable[str] = ()) -> str:
+    lines = []
+    for histogram in (requestLatency, requestStatements, requestDbTime, requestRows):
+        lines.extend(histogram.render())
+    lines.extend(extraLines)
+    return "\n".join(lines) + "\n"
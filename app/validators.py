@@ -0,0 +1,96 @@
+import os
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple, Type
+from pydantic import BaseModel, ConfigDict, EmailStr, ValidationError, create_model
+
+from app.db.cache import LRUCache, FormDefinition
+from app.schemas import FieldDataCreate
+
+
+# Field.type -> value annotation, unknown types accept any JSON value
+TYPE_ANNOTATIONS: Dict[str, Any] = {
+    "text": str,
+    "string": str,
+    "textarea": str,
+    "email": EmailStr,
+    "number": float,
+    "integer": int,
+    "int": int,
+    "float": float,
+    "decimal": float,
+    "boolean": bool,
+    "bool": bool,
+    "checkbox": bool,
+    "date": date,
+    "datetime": datetime,
+    "timestamp": datetime,
+}
+
+
+class SubmissionValidator:
+    """ a form definition compiled to a pydantic model, validates field values without DB access """
+
+    __slots__ = ("formId", "version", "model", "fieldIds", "fieldNames", "referTo")
+
+    def __init__(self, definition: FormDefinition):
+        self.formId = definition.form.id
+        self.version = definition.version
+        self.fieldIds = definition.fieldIds
+        self.fieldNames = {field.id: field.name for field in definition.referenceFields}
+        self.fieldNames.update(definition.fieldNames)
+        # a value submitted under the referenced field also satisfies the referencing one
+        self.referTo = {
+            field.id: field.refer_field_id
+            for field in definition.form.fields if field.refer_field_id
+        }
+
+        required = {field.id: field.required for field in definition.form.fields}
+        modelFields: Dict[str, Tuple[Any, Any]] = {}
+        for fieldId, fieldType in definition.fieldTypes.items():
+            annotation = TYPE_ANNOTATIONS.get((fieldType or "").lower(), Any)
+            if required.get(fieldId):
+                modelFields[f"f{fieldId}"] = (annotation, ...)
+            else:
+                modelFields[f"f{fieldId}"] = (Optional[annotation], None)
+
+        self.model: Type[BaseModel] = create_model(
+            f"Form{self.formId}V{self.version}Submission",
+            __config__=ConfigDict(extra="forbid"),
+            **modelFields
+        )
+
+    def validate(self, fieldValues: List[FieldDataCreate]) -> List[str]:
+        """error messages for one submission, empty when it is valid"""
+
+        unknownIds = [value.field_id for value in fieldValues if value.field_id not in self.fieldIds]
+        if unknownIds:
+            return [f"field ids {unknownIds} not in form ID {self.formId}"]
+
+        payload = {f"f{value.field_id}": value.value for value in fieldValues}
+        for fieldId, referId in self.referTo.items():
+            if f"f{fieldId}" not in payload and f"f{referId}" in payload:
+                payload[f"f{fieldId}"] = payload[f"f{referId}"]
+
+        try:
+            self.model.model_validate(payload)
+            return []
+        except ValidationError as e:
+            errors = []
+            for error in e.errors():
+                fieldId = int(error["loc"][0][1:])
+                errors.append(f"{self.fieldNames.get(fieldId, f'field_{fieldId}')}: {error['msg']}")
+            return errors
+
+
+validatorCache = LRUCache(
+    maxSize=int(os.getenv("VALIDATOR_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("VALIDATOR_CACHE_TTL", "3600")),
+)
+
+
+def getValidator(definition: FormDefinition) -> SubmissionValidator:
+    """compiled validator for this form definition, rebuilt only when the form version moves"""
+
+    return validatorCache.getOrLoad(
+        (definition.form.id, definition.version), lambda: SubmissionValidator(definition)
+    )
@@ -0,0 +1,358 @@
+""" FormStore and route micro-benchmarks, run as: python -m benchmarks.bench_store --help
+
+    python -m benchmarks.bench_store --output benchmarks/baseline.json
+    python -m benchmarks.bench_store --compare benchmarks/baseline.json --threshold 0.25
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.db.cache import formCache
+from app.db.dbModel import Base
+from app.db.store import FormStore
+from app.schemas import FieldCreate, FormCreate, FormUpdate
+from app.utils.logger import getLogger
+from app.validators import validatorCache
+from benchmarks.datagen import FIELD_TYPES, generateDataset, generateSubmissions
+
+
+DEFAULT_DATABASE_URL = "sqlite:///./bench.db"
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def measure(operation: Callable[[Any], Any], iterations: int, warmup: int,
+            setup: Optional[Callable[[], Any]] = None) -> Dict[str, float]:
+    """time operation(setup()) iterations times, setup is not timed"""
+
+    samples = []
+    for run in range(warmup + iterations):
+        argument = setup() if setup else None
+        start = time.perf_counter()
+        operation(argument)
+        elapsed = time.perf_counter() - start
+        if run >= warmup:
+            samples.append(elapsed)
+
+    total = sum(samples)
+    return {
+        "iterations": iterations,
+        "ops_per_sec": round(iterations / total, 2) if total else 0.0,
+        "mean_ms": round(statistics.fmean(samples) * 1000, 4),
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 4),
+        "p99_ms": round(percentile(samples, 0.99) * 1000, 4),
+    }
+
+
+class StoreBenchmark:
+    """ one dataset, every FormStore method and the main routes timed against it """
+
+    def __init__(self, databaseUrl: str, forms: int, fields: int, submissions: int, chainLength: int, seed: int):
+        connectArgs = {"check_same_thread": False} if databaseUrl.startswith("sqlite") else {}
+        self.engine = create_engine(databaseUrl, connect_args=connectArgs)
+        self.sessionFactory = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.rng = random.Random(seed)
+        self.config = {
+            "database": self.engine.dialect.name,
+            "forms": forms,
+            "fields": fields,
+            "submissions": submissions,
+            "chain_length": chainLength,
+            "seed": seed,
+        }
+
+        Base.metadata.drop_all(bind=self.engine)
+        Base.metadata.create_all(bind=self.engine)
+        self._clearCaches()
+        db = self.sessionFactory()
+        try:
+            started = time.perf_counter()
+            self.dataset = generateDataset(db, forms, fields, submissions, chainLength, seed)
+            self.config["generate_seconds"] = round(time.perf_counter() - started, 3)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _clearCaches() -> None:
+        formCache.clear()
+        validatorCache.clear()
+
+    def pickForm(self) -> int:
+        return self.rng.choice(list(self.dataset["forms"]))
+
+    def pickFormIds(self, count: int = 20) -> List[int]:
+        forms = list(self.dataset["forms"])
+        return self.rng.sample(forms, min(count, len(forms)))
+
+    def pickSubmission(self) -> Dict[str, int]:
+        formId = self.pickForm()
+        return {"form": formId, "submission": self.rng.choice(self.dataset["submissions"][formId])}
+
+    def withSession(self, operation: Callable[[Session, Any], Any]) -> Callable[[Any], Any]:
+        """one session per call, like one request"""
+
+        def run(argument):
+            db = self.sessionFactory()
+            try:
+                result = operation(db, argument)
+                if hasattr(result, "__next__"):
+                    for _ in result:
+                        pass
+                return result
+            finally:
+                db.close()
+        return run
+
+    def throwawayForm(self) -> int:
+        db = self.sessionFactory()
+        try:
+            return FormStore.createForm(db, FormCreate(name="Throwaway", fields=[FieldCreate(name="F", type="text")])).id
+        finally:
+            db.close()
+
+    def submissionBatch(self, size: int) -> Callable[[], Any]:
+        def setup():
+            formId = self.pickForm()
+            return {"form": formId, "items": generateSubmissions(formId, self.dataset["forms"][formId], size, self.rng)}
+        return setup
+
+    def numberFilter(self, formId: int) -> List[str]:
+        db = self.sessionFactory()
+        try:
+            definition = FormStore.getFormDefinition(db, formId)
+        finally:
+            db.close()
+        name = next(definition.fieldNames[fieldId] for fieldId, fieldType in definition.fieldTypes.items()
+                    if fieldType == "number" and fieldId in definition.fieldNames)
+        return [f"{name}:gt:500"]
+
+    def coldForm(self) -> int:
+        self._clearCaches()
+        return self.pickForm()
+
+    def coldFormIds(self) -> List[int]:
+        self._clearCaches()
+        return self.pickFormIds()
+
+    def storeOperations(self) -> Dict[str, tuple]:
+        """name -> (operation(db, argument), setup)"""
+
+        hasNumbers = any(fieldType == "number" for fields in self.dataset["forms"].values() for fieldType in fields.values())
+        operations = {
+            "store.getForm": (lambda db, formId: FormStore.getForm(db, formId), self.pickForm),
+            "store.getFormDefinition.warm": (lambda db, formId: FormStore.getFormDefinition(db, formId), self.pickForm),
+            "store.getFormDefinition.cold": (lambda db, formId: FormStore.getFormDefinition(db, formId), self.coldForm),
+            "store.getFormFields": (lambda db, formId: FormStore.getFormFields(db, formId), self.pickForm),
+            "store.getForms": (lambda db, _: FormStore.getForms(db, None, 100), None),
+            "store.getFormDefinitions.cold": (
+                lambda db, formIds: FormStore.getFormDefinitions(db, formIds), self.coldFormIds
+            ),
+            "store.getFormFieldNames": (lambda db, formId: FormStore.getFormFieldNames(db, formId), self.pickForm),
+            "store.createForm": (
+                lambda db, _: FormStore.createForm(db, FormCreate(name="Bench create", fields=[
+                    FieldCreate(name=f"Field {position}", type=FIELD_TYPES[position % len(FIELD_TYPES)])
+                    for position in range(self.config["fields"])
+                ])),
+                None
+            ),
+            "store.updateForm": (
+                lambda db, formId: FormStore.updateForm(db, formId, FormUpdate(name=f"Renamed {formId}")),
+                self.pickForm
+            ),
+            "store.createSubmission": (
+                lambda db, batch: FormStore.createSubmission(db, batch["items"][0]),
+                self.submissionBatch(1)
+            ),
+            "store.createSubmissions.100": (
+                lambda db, batch: FormStore.createSubmissions(db, batch["form"], batch["items"]),
+                self.submissionBatch(100)
+            ),
+            "store.getSubmissionValues": (
+                lambda db, target: FormStore.getSubmissionValues(db, target["form"], target["submission"]),
+                self.pickSubmission
+            ),
+            "store.listSubmissions": (lambda db, formId: FormStore.listSubmissions(db, formId, [], None, 100), self.pickForm),
+            "store.getFormStats": (lambda db, formId: FormStore.getFormStats(db, formId), self.pickForm),
+            "store.iterSubmissionRows": (
+                lambda db, formId: FormStore.iterSubmissionRows(db, formId, FormStore.getFormFieldNames(db, formId)),
+                self.pickForm
+            ),
+            "store.rebuildFormStats": (lambda db, formId: FormStore.rebuildFormStats(db, formId), self.pickForm),
+            "store.removeForm": (lambda db, formId: FormStore.removeForm(db, formId), self.throwawayForm),
+        }
+        if hasNumbers:
+            operations["store.listSubmissions.filtered"] = (
+                lambda db, target: FormStore.listSubmissions(db, target["form"], target["filters"], None, 100),
+                lambda: (lambda formId: {"form": formId, "filters": self.numberFilter(formId)})(self.pickForm())
+            )
+        return operations
+
+    def routeOperations(self, client: TestClient) -> Dict[str, tuple]:
+        """name -> (operation(argument), setup), each asserting a 2xx answer"""
+
+        def call(method: str, url: Callable[[Any], str], body: Optional[Callable[[Any], Any]] = None):
+            def run(argument):
+                response = client.request(method, url(argument), json=body(argument) if body else None)
+                if response.status_code >= 300:
+                    raise RuntimeError(f"{method} {url(argument)} answered {response.status_code}: {response.text[:200]}")
+            return run
+
+        return {
+            "route.GET /forms/{formId}": (call("GET", lambda formId: f"/forms/{formId}"), self.pickForm),
+            "route.GET /forms": (call("GET", lambda _: "/forms?limit=100"), None),
+            "route.GET /forms/batch": (
+                call("GET", lambda formIds: f"/forms/batch?ids={','.join(map(str, formIds))}"), self.pickFormIds
+            ),
+            "route.POST /forms/{formId}/submissions": (
+                call("POST", lambda batch: f"/forms/{batch['form']}/submissions",
+                     lambda batch: batch["items"][0].model_dump()),
+                self.submissionBatch(1)
+            ),
+            "route.GET /forms/{formId}/submissions/{submissionId}": (
+                call("GET", lambda target: f"/forms/{target['form']}/submissions/{target['submission']}"),
+                self.pickSubmission
+            ),
+            "route.GET /forms/{formId}/submissions": (
+                call("GET", lambda formId: f"/forms/{formId}/submissions?limit=100"), self.pickForm
+            ),
+            "route.GET /forms/{formId}/stats": (call("GET", lambda formId: f"/forms/{formId}/stats"), self.pickForm),
+            "route.GET /forms/{formId}/submissions/export": (
+                call("GET", lambda formId: f"/forms/{formId}/submissions/export?format=ndjson"), self.pickForm
+            ),
+        }
+
+    def run(self, iterations: int, warmup: int, only: Optional[str] = None, routes: bool = True) -> Dict[str, Any]:
+        results: Dict[str, Dict[str, float]] = {}
+
+        for name, (operation, setup) in self.storeOperations().items():
+            if only and only not in name:
+                continue
+            results[name] = measure(self.withSession(operation), iterations, warmup, setup)
+            print(_formatRow(name, results[name]), flush=True)
+
+        if routes:
+            from app.db.database import getDb
+            from app.main import app
+
+            def benchDb():
+                db = self.sessionFactory()
+                try:
+                    yield db
+                finally:
+                    db.close()
+
+            previous = app.dependency_overrides.get(getDb)
+            app.dependency_overrides[getDb] = benchDb
+            try:
+                client = TestClient(app)
+                for name, (operation, setup) in self.routeOperations(client).items():
+                    if only and only not in name:
+                        continue
+                    results[name] = measure(operation, iterations, warmup, setup)
+                    print(_formatRow(name, results[name]), flush=True)
+            finally:
+                if previous is None:
+                    app.dependency_overrides.pop(getDb, None)
+                else:
+                    app.dependency_overrides[getDb] = previous
+
+        return {
+            "config": self.config,
+            "environment": {"python": platform.python_version(), "platform": platform.platform()},
+            "results": results,
+        }
+
+
+def _formatRow(name: str, result: Dict[str, float]) -> str:
+    return f"{name:<55} {result['ops_per_sec']:>10.1f}/s  p50 {result['p50_ms']:>9.3f} ms  p99 {result['p99_ms']:>9.3f} ms"
+
+
+def compareResults(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float) -> List[str]:
+    """operations whose p50 grew by more than threshold (0.2 = 20%) over the baseline"""
+
+    regressions = []
+    for name, result in current["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous or not previous["p50_ms"]:
+            continue
+        change = result["p50_ms"] / previous["p50_ms"] - 1
+        if change > threshold:
+            regressions.append(
+                f"{name}: p50 {previous['p50_ms']:.3f} -> {result['p50_ms']:.3f} ms (+{change:.0%})"
+            )
+    return regressions
+
+
+def buildParser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.bench_store", description="FormStore micro-benchmarks")
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL", DEFAULT_DATABASE_URL),
+                        help="scratch database, dropped and recreated (default BENCH_DATABASE_URL or sqlite:///./bench.db)")
+    parser.add_argument("--forms", type=int, default=20)
+    parser.add_argument("--fields", type=int, default=10)
+    parser.add_argument("--submissions", type=int, default=500, help="per form")
+    parser.add_argument("--chain-length", type=int, default=4, help="forms per reference chain")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--only", help="run operations whose name contains this text")
+    parser.add_argument("--no-routes", action="store_true", help="skip the HTTP route benchmarks")
+    parser.add_argument("--log-level", default="WARNING", help="service logger level while benchmarking")
+    parser.add_argument("--output", help="write results as a JSON baseline")
+    parser.add_argument("--compare", help="baseline JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed p50 slowdown, 0.2 = 20%%")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = buildParser().parse_args(argv)
+    # the service logger is process wide: put its level back for whoever runs next (pytest, a shell)
+    logger = getLogger()
+    previousLevel = logger.level
+    logger.setLevel(args.log_level.upper())
+    try:
+        return _run(args)
+    finally:
+        logger.setLevel(previousLevel)
+
+
+def _run(args: argparse.Namespace) -> int:
+    bench = StoreBenchmark(args.database_url, args.forms, args.fields, args.submissions, args.chain_length, args.seed)
+    print(f"dataset: {bench.config}", flush=True)
+    report = bench.run(args.iterations, args.warmup, args.only, routes=not args.no_routes)
+
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(report, handle, indent=2, sort_keys=True)
+        print(f"results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as handle:
+            baseline = json.load(handle)
+        if baseline.get("config", {}).get("database") != report["config"]["database"]:
+            print("warning: baseline was recorded against a different database", file=sys.stderr)
+        regressions = compareResults(baseline, report, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions over {args.threshold:.0%}:", file=sys.stderr)
+            for line in regressions:
+                print(f"  {line}", file=sys.stderr)
+            return 1
+        print(f"no regressions over {args.threshold:.0%} against {args.compare}")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+""" synthetic forms, fields and submissions for the benchmarks, deterministic for a given seed """
+import random
+from datetime import date, timedelta
+from typing import Any, Dict, List
+from sqlalchemy.orm import Session
+
+from app.db.store import FormStore
+from app.schemas import FieldCreate, FieldDataCreate, FormCreate, SubmissionCreate
+
+
+FIELD_TYPES = ["text", "number", "boolean", "date", "email"]
+
+
+def fieldValue(fieldType: str, rng: random.Random) -> Any:
+    """a valid value for fieldType, drawn from a small domain so the stats rollups see repeats"""
+
+    if fieldType == "number":
+        return rng.randint(0, 1000)
+    if fieldType == "boolean":
+        return rng.random() < 0.5
+    if fieldType == "date":
+        return (date(2024, 1, 1) + timedelta(days=rng.randint(0, 365))).isoformat()
+    if fieldType == "email":
+        return f"user{rng.randint(0, 200)}@example.com"
+    return f"value {rng.randint(0, 50)}"
+
+
+def generateSubmissions(formId: int, fields: Dict[int, str], count: int, rng: random.Random) -> List[SubmissionCreate]:
+    return [
+        SubmissionCreate(
+            form_id=formId,
+            field_values=[
+                FieldDataCreate(field_id=fieldId, value=fieldValue(fieldType, rng))
+                for fieldId, fieldType in fields.items()
+            ]
+        )
+        for _ in range(count)
+    ]
+
+
+def generateDataset(db: Session, forms: int = 10, fields: int = 10, submissions: int = 100,
+                    chainLength: int = 4, seed: int = 42, batchSize: int = 500) -> Dict[str, Any]:
+    """forms x fields x submissions through FormStore
+
+    the first field of every form refers to the first field of the previous form,
+    restarting every chainLength forms, so reference chains up to chainLength - 1 deep exist
+    """
+
+    rng = random.Random(seed)
+    dataset: Dict[str, Any] = {"forms": {}, "submissions": {}}
+    previousChainField = None
+
+    for index in range(forms):
+        referTo = previousChainField if chainLength > 1 and index % chainLength else None
+        fieldSpecs = [FieldCreate(name="Chain", type="text", refer_field_id=referTo)]
+        fieldSpecs += [
+            FieldCreate(name=f"Field {position}", type=FIELD_TYPES[position % len(FIELD_TYPES)])
+            for position in range(1, fields)
+        ]
+        form = FormStore.createForm(db, FormCreate(name=f"Bench form {index}", fields=fieldSpecs))
+        formFields = {field.id: field.type for field in form.fields}
+        previousChainField = min(formFields)
+
+        submissionIds: List[int] = []
+        for start in range(0, submissions, batchSize):
+            batch = generateSubmissions(form.id, formFields, min(batchSize, submissions - start), rng)
+            submissionIds += FormStore.insertSubmissions(db, form.id, batch)
+            db.commit()
+
+        dataset["forms"][form.id] = formFields
+        dataset["submissions"][form.id] = submissionIds
+
+    return dataset
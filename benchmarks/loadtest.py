@@ -0,0 +1,370 @@
+""" mixed-workload load generator, run as: python -m benchmarks.loadtest --help
+
+in process (default): drives app.main:app through httpx's ASGI transport against a scratch database
+    python -m benchmarks.loadtest --concurrency 32 --duration 30 --threadpool 40 --pool-size 10
+against a running server:
+    python -m benchmarks.loadtest --url http://localhost:8000 --rate 200 --duration 60
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.bench_store import percentile
+from benchmarks.datagen import FIELD_TYPES, fieldValue
+
+
+DEFAULT_DATABASE_URL = "sqlite:///./loadtest.db"
+DEFAULT_MIX = "form_read=40,submission_write=25,submission_read=15,list_page=15,forms_page=5"
+
+
+def parseMix(spec: str) -> Dict[str, float]:
+    """'form_read=3,submission_write=1' -> relative weights, unknown operations rejected"""
+
+    mix = {}
+    for part in filter(None, (item.strip() for item in spec.split(","))):
+        name, _, weight = part.partition("=")
+        if name.strip() not in OPERATIONS:
+            raise ValueError(f"unknown operation {name!r}, choose from {', '.join(OPERATIONS)}")
+        mix[name.strip()] = float(weight or 1)
+    if not mix or sum(mix.values()) <= 0:
+        raise ValueError("mix needs at least one operation with a positive weight")
+    return mix
+
+
+class EndpointStats:
+    __slots__ = ("latencies", "errors", "statuses")
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.errors = 0
+        self.statuses: Dict[str, int] = {}
+
+    def record(self, latency: float, status: str, failed: bool) -> None:
+        self.latencies.append(latency)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        if failed:
+            self.errors += 1
+
+    def summary(self, elapsed: float) -> Dict[str, Any]:
+        count = len(self.latencies)
+        return {
+            "requests": count,
+            "errors": self.errors,
+            "error_rate": round(self.errors / count, 4) if count else 0.0,
+            "throughput": round(count / elapsed, 2) if elapsed else 0.0,
+            "p50_ms": round(percentile(self.latencies, 0.50) * 1000, 3) if count else 0.0,
+            "p95_ms": round(percentile(self.latencies, 0.95) * 1000, 3) if count else 0.0,
+            "p99_ms": round(percentile(self.latencies, 0.99) * 1000, 3) if count else 0.0,
+            "max_ms": round(max(self.latencies) * 1000, 3) if count else 0.0,
+            "statuses": dict(sorted(self.statuses.items())),
+        }
+
+
+class Workload:
+    """ seeded forms and the submissions seen so far, shared by every virtual user """
+
+    def __init__(self, client: httpx.AsyncClient, rng: random.Random):
+        self.client = client
+        self.rng = rng
+        self.forms: Dict[int, Dict[int, str]] = {}
+        self.submissions: Dict[int, List[int]] = {}
+        # list_page walks each form's submissions page by page, wrapping at the end
+        self.cursors: Dict[int, Optional[str]] = {}
+
+    async def seed(self, forms: int, fields: int, submissions: int) -> None:
+        for index in range(forms):
+            response = await self.client.post("/forms", json={
+                "name": f"Load form {index}",
+                "fields": [
+                    {"name": f"Field {position}", "type": FIELD_TYPES[position % len(FIELD_TYPES)]}
+                    for position in range(fields)
+                ]
+            })
+            response.raise_for_status()
+            form = response.json()
+            formId = form["id"]
+            self.forms[formId] = {field["id"]: field["type"] for field in form["fields"]}
+            self.submissions[formId] = []
+
+            for start in range(0, submissions, 1000):
+                count = min(1000, submissions - start)
+                response = await self.client.post(f"/forms/{formId}/submissions/batch", json={
+                    "submissions": [self.submissionBody(formId) for _ in range(count)]
+                })
+                response.raise_for_status()
+                self.submissions[formId] += [
+                    item["id"] for item in response.json()["items"] if item["status"] == "created"
+                ]
+
+    def submissionBody(self, formId: int) -> Dict[str, Any]:
+        return {
+            "form_id": formId,
+            "field_values": [
+                {"field_id": fieldId, "value": fieldValue(fieldType, self.rng)}
+                for fieldId, fieldType in self.forms[formId].items()
+            ]
+        }
+
+    def pickForm(self) -> int:
+        return self.rng.choice(list(self.forms))
+
+
+async def formRead(workload: Workload) -> httpx.Response:
+    return await workload.client.get(f"/forms/{workload.pickForm()}")
+
+
+async def submissionWrite(workload: Workload) -> httpx.Response:
+    formId = workload.pickForm()
+    response = await workload.client.post(f"/forms/{formId}/submissions", json=workload.submissionBody(formId))
+    if response.status_code == 201:
+        workload.submissions[formId].append(response.json()["id"])
+    return response
+
+
+async def submissionRead(workload: Workload) -> httpx.Response:
+    formId = workload.pickForm()
+    submissionIds = workload.submissions[formId]
+    if not submissionIds:
+        return await formRead(workload)
+    return await workload.client.get(f"/forms/{formId}/submissions/{workload.rng.choice(submissionIds)}")
+
+
+async def listPage(workload: Workload) -> httpx.Response:
+    formId = workload.pickForm()
+    params = {"limit": 50}
+    if workload.cursors.get(formId):
+        params["cursor"] = workload.cursors[formId]
+    response = await workload.client.get(f"/forms/{formId}/submissions", params=params)
+    if response.status_code == 200:
+        workload.cursors[formId] = response.json()["next_cursor"]
+    return response
+
+
+async def formsPage(workload: Workload) -> httpx.Response:
+    return await workload.client.get("/forms", params={"limit": 50})
+
+
+OPERATIONS = {
+    "form_read": ("GET /forms/{formId}", formRead),
+    "submission_write": ("POST /forms/{formId}/submissions", submissionWrite),
+    "submission_read": ("GET /forms/{formId}/submissions/{submissionId}", submissionRead),
+    "list_page": ("GET /forms/{formId}/submissions", listPage),
+    "forms_page": ("GET /forms", formsPage),
+}
+
+
+class LoadTest:
+    """ closed loop (concurrency virtual users back to back) or open loop (fixed arrival rate,
+    latency measured from the scheduled start so queueing shows up in the tail) """
+
+    def __init__(self, workload: Workload, mix: Dict[str, float], concurrency: int, rate: float,
+                 duration: float, maxRequests: Optional[int]):
+        self.workload = workload
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.concurrency = concurrency
+        self.rate = rate
+        self.duration = duration
+        self.maxRequests = maxRequests
+        self.stats: Dict[str, EndpointStats] = {}
+        self.issued = 0
+
+    def nextOperation(self) -> str:
+        return self.workload.rng.choices(self.names, self.weights)[0]
+
+    def budgetLeft(self, deadline: float) -> bool:
+        if self.maxRequests is not None and self.issued >= self.maxRequests:
+            return False
+        return time.perf_counter() < deadline
+
+    async def execute(self, name: str, scheduled: float) -> None:
+        endpoint, operation = OPERATIONS[name]
+        try:
+            response = await operation(self.workload)
+            status, failed = str(response.status_code), response.status_code >= 400
+        except Exception as e:
+            status, failed = type(e).__name__, True
+        self.stats.setdefault(endpoint, EndpointStats()).record(time.perf_counter() - scheduled, status, failed)
+
+    async def virtualUser(self, deadline: float) -> None:
+        while self.budgetLeft(deadline):
+            self.issued += 1
+            await self.execute(self.nextOperation(), time.perf_counter())
+
+    async def openLoop(self, deadline: float) -> None:
+        slots = asyncio.Semaphore(self.concurrency)
+        pending = set()
+
+        async def fire(name: str, scheduled: float) -> None:
+            async with slots:
+                await self.execute(name, scheduled)
+
+        scheduled = time.perf_counter()
+        while self.budgetLeft(deadline):
+            # poisson arrivals
+            scheduled += self.workload.rng.expovariate(self.rate)
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self.issued += 1
+            task = asyncio.create_task(fire(self.nextOperation(), scheduled))
+            pending.add(task)
+            task.add_done_callback(pending.discard)
+        if pending:
+            await asyncio.gather(*pending)
+
+    async def run(self) -> Dict[str, Any]:
+        started = time.perf_counter()
+        deadline = started + self.duration
+        if self.rate > 0:
+            await self.openLoop(deadline)
+        else:
+            await asyncio.gather(*(self.virtualUser(deadline) for _ in range(self.concurrency)))
+        elapsed = time.perf_counter() - started
+
+        endpoints = {endpoint: stats.summary(elapsed) for endpoint, stats in sorted(self.stats.items())}
+        everything = EndpointStats()
+        for stats in self.stats.values():
+            everything.latencies += stats.latencies
+            everything.errors += stats.errors
+        return {"elapsed_seconds": round(elapsed, 3), "total": everything.summary(elapsed), "endpoints": endpoints}
+
+
+def inProcessClient(args: argparse.Namespace) -> httpx.AsyncClient:
+    """app.main:app on a scratch database, getDb pointed at it; lifespan is not run"""
+
+    import anyio.to_thread
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app.db.cache import formCache
+    from app.db.database import getDb
+    from app.db.dbModel import Base
+    from app.main import app
+    from app.validators import validatorCache
+
+    connectArgs = {"check_same_thread": False} if args.database_url.startswith("sqlite") else {}
+    engine = create_engine(
+        args.database_url, connect_args=connectArgs,
+        pool_size=args.pool_size, max_overflow=args.max_overflow
+    )
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    # ids restart in the fresh database, nothing cached for another one may survive
+    formCache.clear()
+    validatorCache.clear()
+    sessionFactory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def loadTestDb():
+        db = sessionFactory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    # dropped again by runLoadTest once the run is over
+    app.dependency_overrides[getDb] = loadTestDb
+    if args.threadpool:
+        # sync routes run on anyio's worker threads, 40 by default
+        anyio.to_thread.current_default_thread_limiter().total_tokens = args.threadpool
+
+    return httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest", timeout=args.timeout)
+
+
+def printReport(report: Dict[str, Any]) -> None:
+    header = f"{'endpoint':<48} {'req':>7} {'req/s':>9} {'err%':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}"
+    print(header)
+    print("-" * len(header))
+    rows = list(report["endpoints"].items()) + [("TOTAL", report["total"])]
+    for endpoint, summary in rows:
+        print(
+            f"{endpoint:<48} {summary['requests']:>7} {summary['throughput']:>9.1f} {summary['error_rate'] * 100:>6.2f}"
+            f" {summary['p50_ms']:>9.2f} {summary['p95_ms']:>9.2f} {summary['p99_ms']:>9.2f} {summary['max_ms']:>9.2f}"
+        )
+
+
+def buildParser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.loadtest", description="Forms service load generator")
+    parser.add_argument("--url", help="base URL of a running server, default drives the app in process")
+    parser.add_argument("--database-url", default=os.getenv("BENCH_DATABASE_URL", DEFAULT_DATABASE_URL),
+                        help="in process only: scratch database, dropped and recreated")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"operation weights, default {DEFAULT_MIX}")
+    parser.add_argument("--concurrency", type=int, default=16, help="virtual users, or max in flight with --rate")
+    parser.add_argument("--rate", type=float, default=0, help="open loop arrivals per second, 0 = closed loop")
+    parser.add_argument("--duration", type=float, default=10, help="seconds")
+    parser.add_argument("--requests", type=int, help="stop after this many requests")
+    parser.add_argument("--forms", type=int, default=10, help="forms seeded before the run")
+    parser.add_argument("--fields", type=int, default=8)
+    parser.add_argument("--submissions", type=int, default=200, help="seeded per form")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--threadpool", type=int, help="in process only: worker threads for sync routes")
+    parser.add_argument("--pool-size", type=int, default=5, help="in process only: DB pool size")
+    parser.add_argument("--max-overflow", type=int, default=10, help="in process only: DB pool overflow")
+    parser.add_argument("--timeout", type=float, default=30, help="per request seconds")
+    parser.add_argument("--log-level", default="WARNING", help="in process only: service logger level")
+    parser.add_argument("--output", help="write the report as JSON")
+    return parser
+
+
+async def runLoadTest(args: argparse.Namespace) -> Dict[str, Any]:
+    from app.db.database import getDb
+    from app.main import app
+    previousOverride = app.dependency_overrides.get(getDb)
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout,
+                                   limits=httpx.Limits(max_connections=args.concurrency))
+    else:
+        from app.utils.logger import getLogger
+        getLogger().setLevel(args.log_level.upper())
+        client = inProcessClient(args)
+
+    try:
+        async with client:
+            workload = Workload(client, random.Random(args.seed))
+            await workload.seed(args.forms, args.fields, args.submissions)
+            loadTest = LoadTest(workload, parseMix(args.mix), args.concurrency, args.rate, args.duration, args.requests)
+            report = await loadTest.run()
+    finally:
+        if previousOverride is None:
+            app.dependency_overrides.pop(getDb, None)
+        else:
+            app.dependency_overrides[getDb] = previousOverride
+
+    report["config"] = {
+        "target": args.url or f"in-process ({args.database_url})",
+        "mix": parseMix(args.mix),
+        "concurrency": args.concurrency,
+        "rate": args.rate,
+        "threadpool": args.threadpool,
+        "pool_size": None if args.url else args.pool_size,
+    }
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = buildParser().parse_args(argv)
+    try:
+        parseMix(args.mix)
+    except ValueError as e:
+        print(str(e), file=sys.stderr)
+        return 2
+
+    report = asyncio.run(runLoadTest(args))
+    printReport(report)
+
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(report, handle, indent=2, sort_keys=True)
+        print(f"report written to {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
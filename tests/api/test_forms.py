@@ -1,11 +1,30 @@
+import csv
+import io
+import json
 import pytest
+import queue
+import subprocess
+import sys
+from datetime import datetime, timedelta, timezone
 from fastapi.testclient import TestClient
 from sqlalchemy.orm import Session
-from app.db.dbModel import Base
+from app.db.dbModel import Base, FieldData, Submission, fieldFingerprint
+from app.db.documents import migrateToDocuments
+from app.db.archive import archiveStore, archiveSubmissions
 from app.main import app
 from app.db.database import getDb
+from app.db.replicas import ReplicaRouter
+from app.db.cache import FormDefinition, LRUCache, TieredFormCache, formCache
+from app.db.sharedCache import SharedFormCache
+from app.db.store import FormStore
+from app.db.ingest import submissionQueue, IdAllocator, SubmissionQueue
+from app.db.interning import dedupeFields
+from app.schemas import FormUpdate, SubmissionCreate
+from app.db.migrations import MIGRATIONS, currentVersion, isCurrent, migrate
+from app.validators import validatorCache
 from tests.testingData import addTestData, clearData
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, inspect, text, update
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import sessionmaker
 
 
@@ -21,6 +40,8 @@ TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engin
 def db():
     """Initialize test db before each test"""
     Base.metadata.create_all(bind=engine)
+    formCache.clear()
+    validatorCache.clear()
     
     db = TestingSessionLocal()
     try:
@@ -119,6 +140,22 @@ class TestFormsAPI:
         assert data["name"] == "New Test Form 1"
         assert len(data["fields"]) == 4  # Original 3 + 1 new
 
+    def test_concurrentUpdates(self, db: Session):
+        """Test two updates of the same form from stale sessions get distinct versions"""
+        clearData(db)
+        form = client.post("/forms", json={"name": "Versioned", "fields": [{"name": "Note", "type": "text"}]}).json()
+
+        # this session read version 1 before the request below committed version 2
+        other = TestingSessionLocal()
+        try:
+            stale = FormStore.getForm(other, form["id"])
+            assert stale.version == 1
+            assert client.put(f"/forms/{form['id']}", json={"name": "First"}).json()["version"] == 2
+            assert FormStore.updateForm(other, form["id"], FormUpdate(name="Second")).version == 3
+        finally:
+            other.close()
+        assert FormStore.getFormDefinition(db, form["id"]).version == 3
+
     def test_fieldLinking(self, db: Session):
         """Test field linking in two forms"""
         # referencing
@@ -193,4 +230,878 @@ class TestFormsAPI:
         assert "Field 3" in data["values"]
         assert data["values"]["Field 1"] == "Sample Text for Field 1"
         assert data["values"]["Field 2"] == "Sample Text for Field 2"
-        assert data["values"]["Field 3"] == 42
\ No newline at end of file
+        assert data["values"]["Field 3"] == 42
+
+    def test_createSubmissionBatch(self, db: Session):
+        """Test batch submissions with per-item results"""
+        clearData(db)
+
+        testData = addTestData(db)
+        formId = testData["form1"].id
+        field1Id = testData["field1"].id
+        field4Id = testData["field4"].id
+
+        batchData = {
+            "submissions": [
+                {"form_id": formId, "field_values": [{"field_id": field1Id, "value": "batch one"}]},
+                {"form_id": formId, "field_values": [{"field_id": field4Id, "value": "not in form 1"}]},
+                {"form_id": formId, "field_values": [{"field_id": field1Id, "value": "batch two"}]},
+            ]
+        }
+
+        response = client.post(f"/forms/{formId}/submissions/batch", json=batchData)
+
+        assert response.status_code == 201
+        data = response.json()
+        assert data["created"] == 2
+        assert data["rejected"] == 1
+        assert [item["status"] for item in data["items"]] == ["created", "rejected", "created"]
+
+        submissionId = data["items"][2]["id"]
+        response = client.get(f"/forms/{formId}/submissions/{submissionId}")
+        assert response.status_code == 200
+        assert response.json()["values"]["Field 1"] == "batch two"
+
+    def test_exportSubmissions(self, db: Session):
+        """Test streaming export as ndjson and csv"""
+        clearData(db)
+
+        testData = addTestData(db)
+        formId = testData["form1"].id
+
+        response = client.get(f"/forms/{formId}/submissions/export?format=ndjson")
+        assert response.status_code == 200
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert len(lines) == 1
+        assert lines[0]["id"] == testData["submission1"].id
+        assert lines[0]["values"]["Field 3"] == 42
+
+        response = client.get(f"/forms/{formId}/submissions/export?format=csv")
+        assert response.status_code == 200
+        rows = list(csv.reader(io.StringIO(response.text)))
+        assert rows[0] == ["id", "form_id", "created", "updated", "Field 1", "Field 2", "Field 3"]
+        assert rows[1][4:] == ["Sample Text for Field 1", "Sample Text for Field 2", "42"]
+
+    def test_formCacheInvalidation(self, db: Session):
+        """Test cached form reads and invalidation on update"""
+        clearData(db)
+
+        testData = addTestData(db)
+        formId = testData["form1"].id
+
+        hits = formCache.stats()["hits"]
+        assert client.get(f"/forms/{formId}").status_code == 200
+        assert client.get(f"/forms/{formId}").status_code == 200
+        assert formCache.stats()["hits"] == hits + 1
+
+        response = client.put(f"/forms/{formId}", json={"name": "Renamed Form 1"})
+        assert response.status_code == 200
+
+        response = client.get(f"/forms/{formId}")
+        assert response.json()["name"] == "Renamed Form 1"
+
+        response = client.get("/internal/cache")
+        assert response.status_code == 200
+        assert response.json()["forms"]["size"] >= 1
+
+    def test_poolStats(self, db: Session):
+        """Test pool telemetry surface"""
+        response = client.get("/internal/pool")
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data["settings"]["pool_size"] >= 1
+        assert {"checkouts", "timeouts", "wait_seconds_max"} <= set(data["checkouts"])
+
+    def test_metrics(self, db: Session):
+        """Test per-route latency and SQL metrics exposition"""
+        clearData(db)
+
+        testData = addTestData(db)
+        formId = testData["form1"].id
+        assert client.get(f"/forms/{formId}").status_code == 200
+
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        body = response.text
+        assert 'http_request_duration_seconds_count{method="GET",route="/forms/{formId}",status="200"}' in body
+        statements = [
+            line for line in body.splitlines()
+            if line.startswith('db_statements_per_request_sum{method="GET",route="/forms/{formId}"}')
+        ]
+        assert statements and float(statements[0].split()[-1]) >= 1
+        assert "forms_cache_hits" in body
+
+    def test_getFormsKeyset(self, db: Session):
+        """Test cursor pagination over forms"""
+        clearData(db)
+
+        testData = addTestData(db)
+        client.post("/forms", json={"name": "Form 3", "fields": [{"name": "F", "type": "text"}]})
+
+        response = client.get("/forms?limit=2")
+        assert response.status_code == 200
+        page = response.json()
+        assert [form["name"] for form in page["items"]] == ["Form 1", "Form 2"]
+        assert len(page["items"][0]["fields"]) == 3
+        assert page["next_cursor"]
+
+        response = client.get(f"/forms?limit=2&cursor={page['next_cursor']}")
+        page = response.json()
+        assert [form["name"] for form in page["items"]] == ["Form 3"]
+        assert page["next_cursor"] is None
+
+        assert client.get("/forms?cursor=not-a-cursor").status_code == 400
+
+    def test_filterSubmissions(self, db: Session):
+        """Test filtering submissions on typed field values"""
+        clearData(db)
+
+        response = client.post("/forms", json={
+            "name": "Survey",
+            "fields": [{"name": "age", "type": "number"}, {"name": "country", "type": "text"}]
+        })
+        form = response.json()
+        formId = form["id"]
+        ageId, countryId = [field["id"] for field in form["fields"]]
+
+        people = [(25, "IN"), (35, "IN"), (45, "US"), (31, "IN")]
+        client.post(f"/forms/{formId}/submissions/batch", json={"submissions": [
+            {"form_id": formId, "field_values": [
+                {"field_id": ageId, "value": age}, {"field_id": countryId, "value": country}
+            ]}
+            for age, country in people
+        ]})
+
+        response = client.get(f"/forms/{formId}/submissions", params={"filter": ["age:gt:30", "country:eq:IN"]})
+        assert response.status_code == 200
+        ages = [item["values"]["age"] for item in response.json()["items"]]
+        assert ages == [35, 31]
+
+        response = client.get(f"/forms/{formId}/submissions", params={"filter": ["age:gt:thirty"]})
+        assert response.status_code == 400
+
+        # values sharing the indexed prefix: eq/ne decide on the full text
+        prefix = "x" * 300
+        client.post(f"/forms/{formId}/submissions/batch", json={"submissions": [
+            {"form_id": formId, "field_values": [{"field_id": ageId, "value": 50}, {"field_id": countryId, "value": prefix + tail}]}
+            for tail in ("A", "B")
+        ]})
+        response = client.get(f"/forms/{formId}/submissions", params={"filter": [f"country:eq:{prefix}A"]})
+        assert [item["values"]["country"] for item in response.json()["items"]] == [prefix + "A"]
+        response = client.get(f"/forms/{formId}/submissions", params={"filter": [f"country:ne:{prefix}A", "age:eq:50"]})
+        assert [item["values"]["country"] for item in response.json()["items"]] == [prefix + "B"]
+
+    def test_submissionValidation(self, db: Session):
+        """Test required and type checks from the compiled validator"""
+        clearData(db)
+
+        response = client.post("/forms", json={
+            "name": "Signup",
+            "fields": [
+                {"name": "age", "type": "number", "required": True},
+                {"name": "email", "type": "email", "required": False}
+            ]
+        })
+        form = response.json()
+        formId = form["id"]
+        ageId, emailId = [field["id"] for field in form["fields"]]
+
+        submit = lambda values: client.post(f"/forms/{formId}/submissions", json={"form_id": formId, "field_values": values})
+
+        assert submit([{"field_id": ageId, "value": 30}]).status_code == 201
+        assert submit([{"field_id": emailId, "value": "a@example.com"}]).status_code == 400
+        assert submit([{"field_id": ageId, "value": "old"}]).status_code == 400
+        assert submit([{"field_id": ageId, "value": 30}, {"field_id": emailId, "value": "nope"}]).status_code == 400
+
+        # relaxing the field bumps the version and recompiles the validator
+        response = client.put(f"/forms/{formId}", json={"fields_update": {str(ageId): {"required": False}}})
+        assert response.json()["version"] == 2
+        assert submit([{"field_id": emailId, "value": "a@example.com"}]).status_code == 201
+
+    def test_submissionDetailQueries(self, db: Session):
+        """Test single query detail read, 404s and batch hydration by ids"""
+        clearData(db)
+
+        testData = addTestData(db)
+        formId = testData["form1"].id
+        submissionId = testData["submission1"].id
+
+        statements = []
+        countStatements = lambda *args: statements.append(args[2])
+        event.listen(engine, "before_cursor_execute", countStatements)
+        try:
+            response = client.get(f"/forms/{formId}/submissions/{submissionId}")
+        finally:
+            event.remove(engine, "before_cursor_execute", countStatements)
+        assert response.status_code == 200
+        assert len(statements) == 1
+
+        assert client.get(f"/forms/{formId}/submissions/9999").status_code == 404
+        assert client.get(f"/forms/9999/submissions/{submissionId}").status_code == 404
+
+        second = client.post(f"/forms/{formId}/submissions", json={
+            "form_id": formId, "field_values": [{"field_id": testData["field1"].id, "value": "second"}]
+        }).json()["id"]
+
+        response = client.get(f"/forms/{formId}/submissions?ids={second},{submissionId},9999")
+        assert response.status_code == 200
+        items = response.json()["items"]
+        assert [item["id"] for item in items] == [submissionId, second]
+        assert items[0]["values"]["Field 3"] == 42
+        assert items[1]["values"] == {"Field 1": "second"}
+
+    def test_formStats(self, db: Session):
+        """Test incrementally maintained statistics and their rebuild"""
+        clearData(db)
+
+        response = client.post("/forms", json={
+            "name": "Survey",
+            "fields": [{"name": "age", "type": "number"}, {"name": "country", "type": "text"}]
+        })
+        form = response.json()
+        formId = form["id"]
+        ageId, countryId = [field["id"] for field in form["fields"]]
+
+        client.post(f"/forms/{formId}/submissions/batch", json={"submissions": [
+            {"form_id": formId, "field_values": [{"field_id": ageId, "value": 20}, {"field_id": countryId, "value": "IN"}]},
+            {"form_id": formId, "field_values": [{"field_id": ageId, "value": 40}, {"field_id": countryId, "value": "IN"}]},
+        ]})
+        client.post(f"/forms/{formId}/submissions", json={
+            "form_id": formId, "field_values": [{"field_id": countryId, "value": "US"}]
+        })
+
+        response = client.get(f"/forms/{formId}/stats?top=1")
+        assert response.status_code == 200
+        data = response.json()
+        assert data["submission_count"] == 3
+        age, country = data["fields"]
+        assert age["filled_count"] == 2
+        assert age["numeric_min"] == 20 and age["numeric_max"] == 40 and age["numeric_mean"] == 30
+        assert country["distinct_count"] == 2
+        assert country["fill_rate"] == 1.0
+        assert country["top_values"] == [{"value": "IN", "count": 2}]
+
+        assert FormStore.rebuildFormStats(db, formId) == 3
+        assert client.get(f"/forms/{formId}/stats?top=1").json() == data
+
+    def test_asyncIngestQueue(self, db: Session, tmp_path, monkeypatch):
+        """Test write-behind submissions are acknowledged, then group committed"""
+        clearData(db)
+
+        testData = addTestData(db)
+        formId = testData["form1"].id
+        field1Id = testData["field1"].id
+        payload = {"form_id": formId, "field_values": [{"field_id": field1Id, "value": "queued"}]}
+
+        assert client.post(f"/forms/{formId}/submissions/async", json=payload).status_code == 503
+
+        monkeypatch.setattr(submissionQueue, "sessionFactory", TestingSessionLocal)
+        monkeypatch.setattr(submissionQueue, "allocator", IdAllocator())
+        submissionQueue.start()
+        try:
+            responses = [client.post(f"/forms/{formId}/submissions/async", json=payload) for _ in range(5)]
+            assert {response.status_code for response in responses} == {202}
+            bad = client.post(f"/forms/{formId}/submissions/async", json={
+                "form_id": formId, "field_values": [{"field_id": testData["field4"].id, "value": "x"}]
+            })
+            assert bad.status_code == 400
+        finally:
+            submissionQueue.stop()
+
+        assert submissionQueue.stats()["depth"] == 0
+        for response in responses:
+            detail = client.get(f"/forms/{formId}/submissions/{response.json()['id']}")
+            assert detail.status_code == 200
+            assert detail.json()["values"] == {"Field 1": "queued"}
+
+        # the worker's wait timed out just before a late item was admitted and stop() was called:
+        # it must still write that item instead of exiting on the stale empty result
+        late = SubmissionQueue(TestingSessionLocal)
+        lateId = late.allocator.reserve(db)
+        late._queue.put((formId, lateId, SubmissionCreate.model_validate(payload)))
+        late._stopping.set()
+        realGet = late._queue.get
+        timedOut = []
+
+        def getAfterTimeout(*args, **kwargs):
+            if not timedOut:
+                timedOut.append(True)
+                raise queue.Empty
+            return realGet(*args, **kwargs)
+
+        monkeypatch.setattr(late._queue, "get", getAfterTimeout)
+        late._run()
+        assert client.get(f"/forms/{formId}/submissions/{lateId}").status_code == 200
+
+        # a dropped connection is retried; a submission the database rejects (its id is taken)
+        # fails alone and lands in the dead letter file
+        deadLetters = tmp_path / "dead.jsonl"
+        flaky = SubmissionQueue(TestingSessionLocal, retryBackoff=0, deadLetterPath=str(deadLetters))
+        realInsert = flaky._insert
+        outages = [OperationalError("INSERT", {}, Exception("server closed the connection"))]
+
+        def insertAfterOutage(*args):
+            if outages:
+                raise outages.pop()
+            realInsert(*args)
+
+        monkeypatch.setattr(flaky, "_insert", insertAfterOutage)
+        submitData = SubmissionCreate.model_validate(payload)
+        goodIds = [flaky.allocator.reserve(db) for _ in range(2)]
+        flaky._flush([(formId, goodIds[0], submitData), (formId, lateId, submitData), (formId, goodIds[1], submitData)])
+
+        assert all(client.get(f"/forms/{formId}/submissions/{goodId}").status_code == 200 for goodId in goodIds)
+        stats = flaky.stats()
+        assert (stats["flushed"], stats["retried"], stats["dead_lettered"]) == (2, 1, 1)
+        [deadLetter] = [json.loads(line) for line in deadLetters.read_text().splitlines()]
+        assert deadLetter["submission_id"] == lateId and deadLetter["submission"]["field_values"][0]["value"] == "queued"
+
+    def test_referenceChains(self, db: Session):
+        """Test transitive reference resolution, cycle detection and dependent invalidation"""
+        clearData(db)
+
+        formA = client.post("/forms", json={"name": "A", "fields": [{"name": "a", "type": "text"}]}).json()
+        aId = formA["fields"][0]["id"]
+        formB = client.post("/forms", json={"name": "B", "fields": [{"name": "b", "type": "text", "refer_field_id": aId}]}).json()
+        bId = formB["fields"][0]["id"]
+        formC = client.post("/forms", json={"name": "C", "fields": [{"name": "c", "type": "text", "refer_field_id": bId}]}).json()
+        cId = formC["fields"][0]["id"]
+
+        response = client.get(f"/forms/{formC['id']}")
+        assert response.status_code == 200
+        assert [field["id"] for field in response.json()["reference_fields"]] == [aId, bId]
+
+        response = client.put(f"/forms/{formA['id']}", json={"fields_update": {str(aId): {"refer_field_id": cId}}})
+        assert response.status_code == 400
+
+        client.put(f"/forms/{formA['id']}", json={"fields_update": {str(aId): {"name": "a renamed"}}})
+        referenceNames = [field["name"] for field in client.get(f"/forms/{formC['id']}").json()["reference_fields"]]
+        assert referenceNames == ["a renamed", "b"]
+
+    def test_fieldInterning(self, db: Session, monkeypatch):
+        """Test shared field rows, copy-on-write edits and the dedupe migration"""
+        clearData(db)
+        monkeypatch.setattr("app.db.store.fieldInterning", True)
+
+        fields = [{"name": "Email", "type": "email", "required": True}, {"name": "Age", "type": "number"}]
+        form1 = client.post("/forms", json={"name": "Template 1", "fields": fields}).json()
+        form2 = client.post("/forms", json={"name": "Template 2", "fields": fields}).json()
+        assert sorted(field["id"] for field in form1["fields"]) == sorted(field["id"] for field in form2["fields"])
+
+        emailId = form1["fields"][0]["id"]
+        submission = client.post(f"/forms/{form1['id']}/submissions", json={
+            "form_id": form1["id"], "field_values": [{"field_id": emailId, "value": "a@example.com"}]
+        }).json()
+
+        # editing a shared field gives form 1 its own copy, form 2 keeps the original
+        response = client.put(f"/forms/{form1['id']}", json={"fields_update": {str(emailId): {"name": "Work email"}}})
+        assert response.status_code == 200
+        copyId = next(field["id"] for field in response.json()["fields"] if field["name"] == "Work email")
+        assert copyId != emailId
+        assert sorted(field["name"] for field in client.get(f"/forms/{form2['id']}").json()["fields"]) == ["Age", "Email"]
+        detail = client.get(f"/forms/{form1['id']}/submissions/{submission['id']}").json()
+        assert detail["values"] == {"Work email": "a@example.com"}
+
+        # duplicates written without interning are merged by the migration
+        monkeypatch.setattr("app.db.store.fieldInterning", False)
+        form3 = client.post("/forms", json={"name": "Template 3", "fields": fields}).json()
+        assert form3["fields"][0]["id"] != emailId
+
+        result = dedupeFields(db)
+        db.commit()
+        assert result["merged"] == 2
+        assert form3["id"] in result["forms"]
+        formCache.clear()
+        assert sorted(field["id"] for field in client.get(f"/forms/{form3['id']}").json()["fields"]) == \
+            sorted(field["id"] for field in form2["fields"])
+
+    def test_detachReferences(self, db: Session, monkeypatch):
+        """Test references inside the edited form follow a detached field, other forms' stay"""
+        clearData(db)
+        monkeypatch.setattr("app.db.store.fieldInterning", True)
+
+        emailId = client.post("/forms", json={"name": "Source", "fields": [{"name": "Email", "type": "email"}]}).json()["fields"][0]["id"]
+        fields = [{"name": "Email", "type": "email"}, {"name": "Contact", "type": "email", "refer_field_id": emailId}]
+        edited = client.post("/forms", json={"name": "Edited", "fields": fields}).json()
+        other = client.post("/forms", json={"name": "Other", "fields": fields}).json()
+        contactId = next(field["id"] for field in edited["fields"] if field["name"] == "Contact")
+        assert contactId in {field["id"] for field in other["fields"]}
+
+        response = client.put(f"/forms/{edited['id']}", json={"fields_update": {str(emailId): {"name": "Work email"}}})
+        assert response.status_code == 200
+        byName = {field["name"]: field for field in response.json()["fields"]}
+        assert byName["Contact"]["refer_field_id"] == byName["Work email"]["id"] != emailId
+        assert byName["Contact"]["id"] != contactId
+
+        otherFields = {field["name"]: field for field in client.get(f"/forms/{other['id']}").json()["fields"]}
+        assert otherFields["Contact"]["id"] == contactId and otherFields["Contact"]["refer_field_id"] == emailId
+
+    def test_importForms(self, db: Session):
+        """Test bulk import with symbolic references and batch validation"""
+        clearData(db)
+
+        testData = addTestData(db)
+        existingId = testData["field1"].id
+        response = client.post("/forms/import", json={"forms": [
+            {"key": "contact", "name": "Contact", "fields": [
+                {"key": "contact.email", "name": "Email", "type": "email"},
+                {"name": "Origin", "type": "text", "refer_field_id": existingId},
+            ]},
+            {"name": "Follow up", "fields": [
+                {"key": "follow.email", "name": "Email again", "type": "email", "refer_to": "contact.email"},
+                {"name": "Email third", "type": "email", "refer_to": "follow.email"},
+            ]},
+        ]})
+        assert response.status_code == 201
+        result = response.json()
+        assert result["created"] == 2
+        assert result["form_keys"] == {"contact": result["form_ids"][0]}
+
+        followUp = client.get(f"/forms/{result['form_ids'][1]}").json()
+        fields = {field["name"]: field for field in followUp["fields"]}
+        assert fields["Email again"]["refer_field_id"] == result["field_keys"]["contact.email"]
+        assert fields["Email third"]["refer_field_id"] == result["field_keys"]["follow.email"]
+        assert [field["id"] for field in followUp["reference_fields"]] == \
+            [result["field_keys"]["contact.email"], result["field_keys"]["follow.email"]]
+
+        cycle = {"forms": [{"name": "Cycle", "fields": [
+            {"key": "a", "name": "A", "type": "text", "refer_to": "b"},
+            {"key": "b", "name": "B", "type": "text", "refer_to": "a"},
+        ]}]}
+        assert client.post("/forms/import", json=cycle).status_code == 400
+        missing = {"forms": [{"name": "Missing", "fields": [{"name": "M", "type": "text", "refer_field_id": 999999}]}]}
+        assert client.post("/forms/import", json=missing).status_code == 404
+        assert len(client.get("/forms").json()["items"]) == 4
+
+    def test_archiveSubmissions(self, db: Session, tmp_path, monkeypatch):
+        """Test archival of old submissions and transparent reads from the archive"""
+        clearData(db)
+        monkeypatch.setattr(archiveStore, "root", str(tmp_path))
+
+        form = client.post("/forms", json={"name": "Retained", "retention_days": 30, "fields": [
+            {"name": "Note", "type": "text"}, {"name": "Score", "type": "number"}
+        ]}).json()
+        assert form["retention_days"] == 30
+        noteId, scoreId = sorted(field["id"] for field in form["fields"])
+        submissionIds = [
+            client.post(f"/forms/{form['id']}/submissions", json={"form_id": form["id"], "field_values": [
+                {"field_id": noteId, "value": f"note {index}"}, {"field_id": scoreId, "value": index}
+            ]}).json()["id"]
+            for index in range(5)
+        ]
+        db.execute(update(Submission).where(Submission.id.in_(submissionIds[:3])).values(
+            created=datetime.now(timezone.utc) - timedelta(days=90)
+        ))
+        db.commit()
+
+        cutoff = datetime.now(timezone.utc) - timedelta(days=30)
+        assert archiveSubmissions(db, form["id"], cutoff, chunkSize=2) == 3
+        assert db.query(Submission).filter(Submission.form_id == form["id"]).count() == 2
+        assert archiveStore.count(form["id"]) == 3
+
+        detail = client.get(f"/forms/{form['id']}/submissions/{submissionIds[1]}")
+        assert detail.status_code == 200
+        assert detail.json()["values"] == {"Note": "note 1", "Score": 1}
+
+        exported = [json.loads(line) for line in client.get(f"/forms/{form['id']}/submissions/export").text.splitlines()]
+        assert [row["id"] for row in exported] == submissionIds
+
+        assert FormStore.rebuildFormStats(db, form["id"]) == 5
+        assert client.get(f"/forms/{form['id']}/stats").json()["submission_count"] == 5
+
+    def test_archiveRekey(self, db: Session, tmp_path, monkeypatch):
+        """Test archived values follow field copies and archived duplicates of live rows are dropped"""
+        clearData(db)
+        monkeypatch.setattr(archiveStore, "root", str(tmp_path))
+        monkeypatch.setattr("app.db.store.fieldInterning", True)
+
+        fields = [{"name": "Email", "type": "email"}]
+        form = client.post("/forms", json={"name": "Archived 1", "retention_days": 30, "fields": fields}).json()
+        client.post("/forms", json={"name": "Archived 2", "fields": fields})
+        emailId = form["fields"][0]["id"]
+
+        def submit(fieldId, value):
+            return client.post(f"/forms/{form['id']}/submissions", json={
+                "form_id": form["id"], "field_values": [{"field_id": fieldId, "value": value}]
+            }).json()["id"]
+
+        archivedId = submit(emailId, "a@example.com")
+        liveId = submit(emailId, "b@example.com")
+        db.execute(update(Submission).where(Submission.id == archivedId).values(
+            created=datetime.now(timezone.utc) - timedelta(days=90)
+        ))
+        db.commit()
+        assert archiveSubmissions(db, form["id"], datetime.now(timezone.utc) - timedelta(days=30)) == 1
+
+        # the shared field is copied for this form, the archived record still holds the old id
+        response = client.put(f"/forms/{form['id']}", json={"fields_update": {str(emailId): {"name": "Work email"}}})
+        copyId = response.json()["fields"][0]["id"]
+        assert copyId != emailId
+        assert archiveStore.fieldRemap(form["id"]) == {emailId: copyId}
+        detail = client.get(f"/forms/{form['id']}/submissions/{archivedId}").json()
+        assert detail["values"] == {"Work email": "a@example.com"}
+
+        # a crash after appending a chunk but before deleting its rows leaves the row live as well
+        with archiveStore.writer(form["id"]):
+            archiveStore.append(form["id"], [{"id": liveId, "created": None, "updated": None, "values": [[copyId, "b@example.com"]]}])
+        exported = [json.loads(line) for line in client.get(f"/forms/{form['id']}/submissions/export").text.splitlines()]
+        assert [(row["id"], row["values"]) for row in exported] == [
+            (archivedId, {"Work email": "a@example.com"}), (liveId, {"Work email": "b@example.com"})
+        ]
+        assert FormStore.rebuildFormStats(db, form["id"]) == 2
+
+    def test_documentStorage(self, db: Session):
+        """Test document storage mode, dual reads and the rows to document migration"""
+        clearData(db)
+
+        form = client.post("/forms", json={"name": "Docs", "fields": [
+            {"name": "Note", "type": "text"}, {"name": "Score", "type": "number"}
+        ]}).json()
+        formId = form["id"]
+        noteId, scoreId = sorted(field["id"] for field in form["fields"])
+
+        def submit(note, score):
+            return client.post(f"/forms/{formId}/submissions", json={"form_id": formId, "field_values": [
+                {"field_id": noteId, "value": note}, {"field_id": scoreId, "value": score}
+            ]}).json()["id"]
+
+        rowId = submit("row", 1)
+        assert client.put(f"/forms/{formId}", json={"storage_mode": "document"}).json()["storage_mode"] == "document"
+        documentId = submit("document", 7)
+        batch = client.post(f"/forms/{formId}/submissions/batch", json={"submissions": [
+            {"form_id": formId, "field_values": [{"field_id": scoreId, "value": 9}]}
+        ]}).json()
+
+        assert db.query(FieldData).join(Submission).filter(Submission.id == documentId).count() == 0
+        assert db.get(Submission, documentId).document == {str(noteId): "document", str(scoreId): 7}
+
+        detail = client.get(f"/forms/{formId}/submissions/{documentId}").json()
+        assert detail["values"] == {"Note": "document", "Score": 7}
+        page = client.get(f"/forms/{formId}/submissions", params={"filter": "Score:gt:5"}).json()
+        assert [item["id"] for item in page["items"]] == [documentId, batch["items"][0]["id"]]
+        page = client.get(f"/forms/{formId}/submissions", params={"filter": "Note:eq:row"}).json()
+        assert [item["values"] for item in page["items"]] == [{"Note": "row", "Score": 1}]
+
+        assert migrateToDocuments(db, formId) == 1
+        db.expire_all()
+        assert db.get(Submission, rowId).document == {str(noteId): "row", str(scoreId): 1}
+        assert client.get(f"/forms/{formId}/submissions/{rowId}").json()["values"] == {"Note": "row", "Score": 1}
+        exported = [json.loads(line) for line in client.get(f"/forms/{formId}/submissions/export").text.splitlines()]
+        assert [row["values"].get("Score") for row in exported] == [1, 7, 9]
+        assert FormStore.rebuildFormStats(db, formId) == 3
+
+    def test_documentFilters(self, db: Session):
+        """Test a filter selects the same submissions on a rows form and a document form"""
+        clearData(db)
+
+        longNote = "x" * 300
+        values = [("2024-01-01T10:00:00+02:00", longNote + "a"), ("2024-01-01T09:00:00+00:00", longNote + "b")]
+        filters = [
+            "When:gt:2024-01-01T08:30:00+00:00",
+            "When:lte:2024-01-01T03:00:00-05:00",
+            f"Note:eq:{longNote}a",
+            f"Note:ne:{longNote}a",
+        ]
+
+        matches = {}
+        for mode in ("rows", "document"):
+            form = client.post("/forms", json={"name": f"Filtered {mode}", "storage_mode": mode, "fields": [
+                {"name": "When", "type": "datetime"}, {"name": "Note", "type": "text"}
+            ]}).json()
+            whenId, noteId = sorted(field["id"] for field in form["fields"])
+            for when, note in values:
+                client.post(f"/forms/{form['id']}/submissions", json={"form_id": form["id"], "field_values": [
+                    {"field_id": whenId, "value": when}, {"field_id": noteId, "value": note}
+                ]})
+            matches[mode] = [
+                [item["values"]["Note"][-1] for item in client.get(
+                    f"/forms/{form['id']}/submissions", params={"filter": condition}
+                ).json()["items"]]
+                for condition in filters
+            ]
+
+        assert matches["rows"] == [["b"], ["a"], ["a"], ["b"]]
+        assert matches["document"] == matches["rows"]
+
+    def test_fieldTypeChange(self, db: Session):
+        """Test stored values are filtered under a field's new type in both storage modes"""
+        clearData(db)
+
+        for mode in ("rows", "document"):
+            form = client.post("/forms", json={"name": f"Retyped {mode}", "storage_mode": mode, "fields": [
+                {"name": "Score", "type": "text"}
+            ]}).json()
+            scoreId = form["fields"][0]["id"]
+            submissionIds = [
+                client.post(f"/forms/{form['id']}/submissions", json={
+                    "form_id": form["id"], "field_values": [{"field_id": scoreId, "value": value}]
+                }).json()["id"]
+                for value in ("7", "3", "n/a")
+            ]
+
+            response = client.put(f"/forms/{form['id']}", json={"fields_update": {str(scoreId): {"type": "number"}}})
+            assert response.status_code == 200
+            page = client.get(f"/forms/{form['id']}/submissions", params={"filter": "Score:gt:5"}).json()
+            assert [item["id"] for item in page["items"]] == submissionIds[:1]
+            page = client.get(f"/forms/{form['id']}/submissions", params={"filter": "Score:lt:5"}).json()
+            assert [item["id"] for item in page["items"]] == submissionIds[1:2]
+
+    def test_documentRoundTrip(self, db: Session):
+        """Test both storage modes return values as submitted and rollups survive a rebuild"""
+        clearData(db)
+
+        submitted = {"Day": "2024-01-01", "When": "2024-01-01T10:00:00+02:00", "Score": "7"}
+        for mode in ("rows", "document"):
+            form = client.post("/forms", json={"name": f"Round trip {mode}", "storage_mode": mode, "fields": [
+                {"name": "Day", "type": "date"}, {"name": "When", "type": "datetime"}, {"name": "Score", "type": "number"}
+            ]}).json()
+            fieldIds = {field["name"]: field["id"] for field in form["fields"]}
+            submissionId = client.post(f"/forms/{form['id']}/submissions", json={"form_id": form["id"], "field_values": [
+                {"field_id": fieldIds[name], "value": value} for name, value in submitted.items()
+            ]}).json()["id"]
+
+            assert client.get(f"/forms/{form['id']}/submissions/{submissionId}").json()["values"] == submitted
+            exported = [json.loads(line) for line in client.get(f"/forms/{form['id']}/submissions/export").text.splitlines()]
+            assert exported[0]["values"] == submitted
+            page = client.get(f"/forms/{form['id']}/submissions", params={"filter": "Day:eq:2024-01-01"}).json()
+            assert [item["id"] for item in page["items"]] == [submissionId]
+
+            recorded = client.get(f"/forms/{form['id']}/stats").json()["fields"]
+            FormStore.rebuildFormStats(db, form["id"])
+            assert client.get(f"/forms/{form['id']}/stats").json()["fields"] == recorded
+            assert recorded[0]["top_values"] == [{"value": "2024-01-01", "count": 1}]
+
+    def test_schemaMigrations(self, db: Session, tmp_path):
+        """Test migrations upgrade a pre-versioning database and are skipped once current"""
+        legacy = create_engine(f"sqlite:///{tmp_path}/legacy.db")
+        with legacy.begin() as conn:
+            conn.execute(text("CREATE TABLE form (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, created DATETIME, updated DATETIME)"))
+            conn.execute(text(
+                "CREATE TABLE field (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL, type VARCHAR NOT NULL, "
+                "required BOOLEAN, refer_field_id INTEGER, created DATETIME, updated DATETIME)"
+            ))
+            conn.execute(text("CREATE TABLE submission (id INTEGER PRIMARY KEY, form_id INTEGER NOT NULL, created DATETIME, updated DATETIME)"))
+            conn.execute(text(
+                "CREATE TABLE field_data (id INTEGER PRIMARY KEY, submission_id INTEGER NOT NULL, field_id INTEGER NOT NULL, "
+                "value JSON, created DATETIME, updated DATETIME)"
+            ))
+            conn.execute(text("INSERT INTO form (id, name) VALUES (1, 'Old')"))
+            conn.execute(text("INSERT INTO field (id, name, type, required) VALUES (1, 'Email', 'email', 0)"))
+            conn.execute(text("INSERT INTO field (id, name, type, required) VALUES (2, 'Age', 'number', 0)"))
+            conn.execute(text("INSERT INTO submission (id, form_id) VALUES (1, 1)"))
+            conn.execute(text("INSERT INTO field_data (id, submission_id, field_id, value) VALUES (1, 1, 1, '\"a@example.com\"'), (2, 1, 2, '41')"))
+
+        assert migrate(legacy) == [migration.version for migration in MIGRATIONS]
+        with legacy.connect() as conn:
+            assert isCurrent(currentVersion(conn))
+            assert conn.execute(text("SELECT version, storage_mode, retention_days FROM form")).one() == (1, "rows", None)
+            assert conn.execute(text("SELECT fingerprint FROM field")).scalar() == fieldFingerprint("Email", "email", False, None)
+            assert "document" in {column["name"] for column in inspect(conn).get_columns("submission")}
+            # rows from before the typed columns are projected, filters find them
+            assert conn.execute(text("SELECT value_text, value_number FROM field_data ORDER BY id")).all() == [
+                ("a@example.com", None), (None, 41.0)
+            ]
+
+        # current: one lookup, nothing applied, nothing reflected
+        assert migrate(legacy) == []
+        fresh = create_engine(f"sqlite:///{tmp_path}/fresh.db")
+        assert migrate(fresh) == [migration.version for migration in MIGRATIONS]
+        assert migrate(fresh) == []
+
+    def test_readReplicas(self, db: Session, tmp_path, monkeypatch):
+        """Test GET routes read from a replica, fall back to the primary, and stick to it after writes"""
+        clearData(db)
+        form = client.post("/forms", json={"name": "Primary", "fields": [{"name": "Note", "type": "text"}]}).json()
+
+        # the replica is a stale copy: same form id under another name
+        replica = create_engine(f"sqlite:///{tmp_path}/replica.db")
+        Base.metadata.create_all(bind=replica)
+        with replica.begin() as conn:
+            conn.execute(text("INSERT INTO form (id, name, version, storage_mode) VALUES (:id, 'Replica', 1, 'rows')"), {"id": form["id"]})
+
+        router = ReplicaRouter([f"sqlite:///{tmp_path}/replica.db", f"sqlite:///{tmp_path}/missing/replica.db"])
+        monkeypatch.setattr("app.db.replicas.replicaRouter", router)
+        replicaClient = TestClient(app)
+        formCache.clear()
+
+        names = {replicaClient.get("/forms").json()["items"][0]["name"] for _ in range(4)}
+        # the unreachable replica is skipped, never surfaces as an error
+        assert names == {"Replica"}
+        assert router.stats()["failures"] == 1 and router.stats()["replicas"]["1"]["down"] == 1
+
+        renamed = replicaClient.put(f"/forms/{form['id']}", json={"name": "Renamed"})
+        assert "db_primary_until" in renamed.headers["set-cookie"]
+        assert replicaClient.get("/forms").json()["items"][0]["name"] == "Renamed"
+        assert router.stats()["sticky_reads"] == 1
+
+        replicaClient.cookies.clear()
+        monkeypatch.setattr(router, "_lagging", lambda index, session: True)
+        assert replicaClient.get("/forms").json()["items"][0]["name"] == "Renamed"
+        assert router.stats()["primary_reads"] == 1
+
+    def test_replicaReadsBypassCache(self, db: Session, tmp_path, monkeypatch):
+        """Test a stale replica read does not change what a following write validates against"""
+        clearData(db)
+        form = client.post("/forms", json={"name": "Current", "fields": [{"name": "Email", "type": "email"}]}).json()
+        emailId = form["fields"][0]["id"]
+
+        # the replica has not seen the field yet, the form holds another one there
+        replica = create_engine(f"sqlite:///{tmp_path}/replica.db")
+        Base.metadata.create_all(bind=replica)
+        with replica.begin() as conn:
+            conn.execute(text("INSERT INTO form (id, name, version, storage_mode) VALUES (:id, 'Current', 1, 'rows')"), {"id": form["id"]})
+            conn.execute(text("INSERT INTO field (id, name, type, required) VALUES (:id, 'Old', 'text', 0)"), {"id": emailId + 100})
+            conn.execute(text("INSERT INTO form_field_relation (form_id, field_id) VALUES (:form, :field)"), {"form": form["id"], "field": emailId + 100})
+
+        monkeypatch.setattr("app.db.replicas.replicaRouter", ReplicaRouter([f"sqlite:///{tmp_path}/replica.db"]))
+        replicaClient = TestClient(app)
+        formCache.clear()
+
+        assert [field["name"] for field in replicaClient.get(f"/forms/{form['id']}").json()["fields"]] == ["Old"]
+        batch = replicaClient.get("/forms/batch", params={"ids": str(form["id"])}).json()
+        assert [field["name"] for field in batch["forms"][str(form["id"])]["fields"]] == ["Old"]
+        assert formCache.get(form["id"]) is None
+
+        response = replicaClient.post(f"/forms/{form['id']}/submissions", json={
+            "form_id": form["id"], "field_values": [{"field_id": emailId, "value": "a@example.com"}]
+        })
+        assert response.status_code == 201
+
+    def test_conditionalGet(self, db: Session):
+        """Test ETags on forms and submissions and 304 answers to If-None-Match"""
+        clearData(db)
+        source = client.post("/forms", json={"name": "Source", "fields": [{"name": "Email", "type": "email"}]}).json()
+        emailId = source["fields"][0]["id"]
+        dependent = client.post("/forms", json={"name": "Dependent", "fields": [
+            {"name": "Contact", "type": "email", "refer_field_id": emailId}
+        ]}).json()
+
+        first = client.get(f"/forms/{source['id']}")
+        etag = first.headers["etag"]
+        assert etag == f'"form-{source["id"]}-v1"'
+
+        # cold cache: answered from the version column alone
+        formCache.clear()
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            notModified = client.get(f"/forms/{source['id']}", headers={"If-None-Match": f'W/{etag}, "other"'})
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        assert notModified.status_code == 304 and notModified.content == b""
+        assert notModified.headers["etag"] == etag
+        assert len(statements) == 1
+
+        dependentTag = client.get(f"/forms/{dependent['id']}").headers["etag"]
+        client.put(f"/forms/{source['id']}", json={"fields_update": {str(emailId): {"name": "Work email"}}})
+        assert client.get(f"/forms/{source['id']}", headers={"If-None-Match": etag}).status_code == 200
+        # the dependent's resolved reference_fields changed with it
+        assert client.get(f"/forms/{dependent['id']}", headers={"If-None-Match": dependentTag}).status_code == 200
+
+        submissionId = client.post(f"/forms/{source['id']}/submissions", json={
+            "form_id": source["id"], "field_values": [{"field_id": emailId, "value": "a@example.com"}]
+        }).json()["id"]
+        detail = client.get(f"/forms/{source['id']}/submissions/{submissionId}")
+        submissionTag = detail.headers["etag"]
+        assert client.get(f"/forms/{source['id']}/submissions/{submissionId}",
+                          headers={"If-None-Match": submissionTag}).status_code == 304
+        client.put(f"/forms/{source['id']}", json={"name": "Renamed"})
+        assert client.get(f"/forms/{source['id']}/submissions/{submissionId}",
+                          headers={"If-None-Match": submissionTag}).status_code == 200
+
+    def test_formsBatch(self, db: Session):
+        """Test fetching many forms by id in a constant number of queries"""
+        clearData(db)
+        source = client.post("/forms", json={"name": "Source", "fields": [{"name": "Email", "type": "email"}]}).json()
+        emailId = source["fields"][0]["id"]
+        formIds = [source["id"]] + [
+            client.post("/forms", json={"name": f"Form {position}", "fields": [
+                {"name": "Contact", "type": "email", "refer_field_id": emailId},
+                {"name": f"Note {position}", "type": "text"},
+            ]}).json()["id"]
+            for position in range(4)
+        ]
+
+        formCache.clear()
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            response = client.get(f"/forms/batch?ids={','.join(map(str, formIds))},9999,{formIds[1]}")
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        assert response.status_code == 200
+        # forms, their fields, the reference closure
+        assert len(statements) == 3
+
+        batch = response.json()
+        assert list(batch["forms"]) == [str(formId) for formId in formIds]
+        assert batch["not_found"] == [9999]
+        assert [field["id"] for field in batch["forms"][str(formIds[2])]["reference_fields"]] == [emailId]
+        assert batch["forms"][str(formIds[1])] == client.get(f"/forms/{formIds[1]}").json()
+
+        statements.clear()
+        event.listen(engine, "before_cursor_execute", listener)
+        try:
+            assert client.get(f"/forms/batch?ids={formIds[0]},{formIds[3]}").status_code == 200
+        finally:
+            event.remove(engine, "before_cursor_execute", listener)
+        assert statements == []
+
+        assert client.get("/forms/batch?ids=1,x").status_code == 400
+        assert client.get(f"/forms/batch?ids={','.join(map(str, range(1, 102)))}").status_code == 400
+
+    def test_sharedFormCache(self, db: Session, tmp_path):
+        """Test the mmap form cache is shared by workers and invalidated across processes"""
+        clearData(db)
+        form = client.post("/forms", json={"name": "Shared", "fields": [{"name": "Note", "type": "text"}]}).json()
+        definition = FormStore.getFormDefinition(db, form["id"])
+        path = str(tmp_path / "forms.shm")
+
+        workerA = TieredFormCache(LRUCache(), SharedFormCache(path, slots=8, slotBytes=4096))
+        workerB = TieredFormCache(LRUCache(), SharedFormCache(path, slots=8, slotBytes=4096))
+        loads = []
+        workerA.getOrLoad(form["id"], lambda: loads.append(1) or definition)
+
+        shared = workerB.getOrLoad(form["id"], lambda: loads.append(2) or definition)
+        assert loads == [1]
+        assert shared.form == definition.form and shared.fieldNames == definition.fieldNames
+        assert shared.fieldIds == definition.fieldIds
+
+        # another process bumps the generation: both workers' local copies are stale
+        subprocess.run([sys.executable, "-c", (
+            "import sys; from app.db.sharedCache import SharedFormCache; "
+            "SharedFormCache(sys.argv[1], slots=8, slotBytes=4096).invalidate(int(sys.argv[2]))"
+        ), path, str(form["id"])], check=True)
+        assert workerA.get(form["id"]) is None and workerB.get(form["id"]) is None
+
+        workerB.clear()
+        big = FormDefinition.fromJson(definition.toJson())
+        big.form.name = "x" * 5000
+        workerA.put(form["id"], big)
+        # too big to share, still served locally
+        assert workerA.get(form["id"]).form.name == big.form.name and workerB.get(form["id"]) is None
+        assert workerA.stats()["shared"]["oversize"] == 1
+
+        # a definition older than the stored one never replaces it, in the slot or locally
+        newer = FormDefinition.fromJson(definition.toJson())
+        newer.form.version = definition.version + 1
+        workerB.put(form["id"], newer)
+        workerB.invalidate(form["id"])
+        workerA.put(form["id"], definition)
+        assert workerA.get(form["id"]) is None and workerB.get(form["id"]) is None
+
+        # another layout leaves the file in use alone and gets a file of its own
+        size = (tmp_path / "forms.shm").stat().st_size
+        resized = SharedFormCache(path, slots=16, slotBytes=4096)
+        assert resized.path != path and (tmp_path / "forms.shm").stat().st_size == size
+        workerB.put(form["id"], newer)
+        assert workerA.get(form["id"]).version == newer.version
+        resized.close()
+
+        # a removed form's id can come back (sqlite reuses ids), starting over at version 1
+        workerA.remove(form["id"])
+        workerA.put(form["id"], definition)
+        assert workerB.get(form["id"]).version == definition.version
@@ -0,0 +1,26 @@
+import json
+
+from app.utils.logger import getLogger
+from benchmarks.bench_store import compareResults, main
+
+
+def test_benchStoreBaseline(tmp_path):
+    """a tiny run writes a baseline and passes the comparison against itself"""
+    baseline = tmp_path / "baseline.json"
+    args = [
+        "--database-url", f"sqlite:///{tmp_path / 'bench.db'}",
+        "--forms", "3", "--fields", "4", "--submissions", "5",
+        "--iterations", "2", "--warmup", "0",
+    ]
+
+    level = getLogger().level
+    assert main(args + ["--output", str(baseline)]) == 0
+    # the service logger is back at its level for the rest of the session
+    assert getLogger().level == level
+    report = json.loads(baseline.read_text())
+    assert {"store.getForm", "store.listSubmissions", "route.GET /forms/{formId}"} <= set(report["results"])
+    assert report["results"]["store.getForm"]["p99_ms"] >= report["results"]["store.getForm"]["p50_ms"]
+
+    slower = {"results": {name: dict(result, p50_ms=result["p50_ms"] * 2) for name, result in report["results"].items()}}
+    assert compareResults(report, slower, 0.5)
+    assert not compareResults(slower, report, 0.5)
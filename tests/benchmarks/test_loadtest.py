@@ -0,0 +1,25 @@
+import json
+
+import pytest
+
+from benchmarks.loadtest import main, parseMix
+
+
+def test_loadtestInProcess(tmp_path):
+    """a short closed loop run reports every endpoint of the mix without errors"""
+    report = tmp_path / "report.json"
+
+    assert main([
+        "--database-url", f"sqlite:///{tmp_path / 'loadtest.db'}",
+        "--forms", "2", "--fields", "3", "--submissions", "10",
+        "--concurrency", "2", "--requests", "40", "--duration", "30",
+        "--output", str(report),
+    ]) == 0
+
+    data = json.loads(report.read_text())
+    assert data["total"]["requests"] == 40
+    assert data["total"]["errors"] == 0
+    assert "POST /forms/{formId}/submissions" in data["endpoints"]
+
+    with pytest.raises(ValueError):
+        parseMix("delete_everything=1")
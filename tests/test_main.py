@@ -3,7 +3,7 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from fastapi.testclient import TestClient
 
-from app.db.database import Base
+from app.db.dbModel import Base
 
 # initialize test db
 SQLALCHEMY_TEST_DATABASE_URL = "sqlite:///./test.db"
@@ -1,7 +1,7 @@
 from typing import Dict, List, Any
 from sqlalchemy.orm import Session
 
-from app.db.dbModel import Form, Field, Submission, FieldData
+from app.db.dbModel import Form, Field, Submission, FieldData, FormStats, FieldStats, FieldValueCount
 
 
 def addTestData(db: Session) -> Dict[str, Any]:
@@ -123,6 +123,9 @@ def addTestData(db: Session) -> Dict[str, Any]:
 
 def clearData(db: Session) -> None:
     """Clear all data from the database"""
+    db.query(FieldValueCount).delete()
+    db.query(FieldStats).delete()
+    db.query(FormStats).delete()
     db.query(FieldData).delete()
     db.query(Submission).delete()
     db.query(Field).delete()
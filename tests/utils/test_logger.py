@@ -0,0 +1,50 @@
+import json
+import logging
+import queue
+import sys
+
+from app.utils.logger import DeferredQueueHandler, JsonFormatter, SamplingFilter, parseSampleRates
+
+
+def makeRecord(level=logging.INFO, msg="form %s", args=(7,), **extra):
+    record = logging.LogRecord("forms_service", level, __file__, 1, msg, args, None)
+    record.__dict__.update(extra)
+    return record
+
+
+def test_jsonFormatter():
+    """records become one JSON object with lazy args applied and extras kept"""
+    payload = json.loads(JsonFormatter().format(makeRecord(form_id=7)))
+
+    assert payload["message"] == "form 7"
+    assert payload["level"] == "INFO"
+    assert payload["form_id"] == 7
+
+
+def test_samplingFilter():
+    """per-level rates drop sampled levels and pass the rest"""
+    rates = parseSampleRates("INFO=0, debug=0.5")
+    assert rates == {logging.INFO: 0.0, logging.DEBUG: 0.5}
+
+    sampler = SamplingFilter(rates)
+    assert not sampler.filter(makeRecord(logging.INFO))
+    assert sampler.filter(makeRecord(logging.ERROR))
+
+
+def test_deferredQueueHandler():
+    """args and tracebacks are rendered when enqueued, extras stay for the JSON formatter"""
+    values = {"state": "before"}
+    try:
+        raise ValueError("broken")
+    except ValueError:
+        record = makeRecord(msg="values %s", args=(values,), form_id=7)
+        record.exc_info = sys.exc_info()
+
+    prepared = DeferredQueueHandler(queue.SimpleQueue()).prepare(record)
+    values["state"] = "after"
+
+    assert prepared.args is None and prepared.exc_info is None
+    payload = json.loads(JsonFormatter().format(prepared))
+    assert payload["message"] == "values {'state': 'before'}"
+    assert payload["form_id"] == 7
+    assert "ValueError: broken" in payload["exception"]